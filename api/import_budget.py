@@ -0,0 +1,68 @@
+"""
+Import-time budget check for the scheduler-only API (INLISTED_VISION=0).
+
+    python -m api.import_budget                  # 超過上限或載入了影像套件時以非零狀態結束
+    python -m api.import_budget --max-ms 800 --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET_MS = 1500.0
+# 只用排程功能時不應該被載入的模組
+FORBIDDEN_MODULES = ('cv2', 'mediapipe', 'torch', 'playsound', 'posture.model')
+
+
+def measure(module):
+    """在乾淨的子程序中以 python -X importtime 匯入 module，回傳 [(模組, 自身 us, 累計 us, 深度)]"""
+    env = dict(os.environ, INLISTED_VISION='0')
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def check(rows, max_ms, top):
+    total_ms = sum(cumulative for _, _, cumulative, depth in rows if depth == 0) / 1000.0
+    forbidden = sorted({m for name, _, _, _ in rows for m in FORBIDDEN_MODULES
+                        if name == m or name.startswith(m + '.')})
+
+    print(f"{'module':<40} {'cumulative(ms)':>15}")
+    for name, _, cumulative, _ in sorted((r for r in rows if r[3] == 0), key=lambda r: -r[2])[:top]:
+        print(f"{name:<40} {cumulative / 1000.0:>15.1f}")
+    print(f"\ntotal import time: {total_ms:.1f} ms (budget {max_ms:.0f} ms), {len(rows)} modules")
+
+    failures = []
+    if total_ms > max_ms:
+        failures.append(f"import time {total_ms:.1f} ms exceeds budget {max_ms:.0f} ms")
+    if forbidden:
+        failures.append(f"vision modules imported: {', '.join(forbidden)}")
+    for failure in failures:
+        print(f"[FAIL] {failure}")
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time budget for the scheduler-only API")
+    parser.add_argument('--module', default='api.main')
+    parser.add_argument('--max-ms', type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument('--repeat', type=int, default=3, help="take the fastest of N runs (the first one warms the disk cache)")
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args(argv)
+    runs = [measure(args.module) for _ in range(max(1, args.repeat))]
+    fastest = min(runs, key=lambda rows: sum(r[2] for r in rows if r[3] == 0))
+    return check(fastest, args.max_ms, args.top)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,350 @@
+"""
+Local load test for the API: many desktop clients polling posture/mode while
+others schedule, against a stubbed posture model and FakeCalendarService.
+
+    python -m api.loadtest                                        # 預設: 50 個輪詢 + 2 個排程 + 2 個同步，20 秒
+    python -m api.loadtest --clients poll=200,mode=20,schedule=4,sync=4 --duration 60
+    python -m api.loadtest --save-baseline main                   # 存成 loadtest_baselines/main.json
+    python -m api.loadtest --compare main --max-regression 0.25   # 與基準比較，退步超過 25% 時以非零狀態結束
+
+The app runs under uvicorn on a local port (or in-process through httpx's
+ASGI transport with --in-process). The stub model runs a frame loop that
+holds the GIL for --model-gil-ms per frame, like the real capture loop, and
+a probe inside the server's event loop measures how late it wakes up, so
+blocking calls on the loop and GIL/lock contention show up directly.
+Requires uvicorn and httpx.
+"""
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+
+try:
+    import httpx
+    import uvicorn
+except ImportError as e:
+    sys.exit(f"api.loadtest requires httpx and uvicorn (missing: {e.name}); "
+             f"install them with pip install -r posture/requirements.txt or pip install httpx uvicorn")
+
+os.environ.setdefault('INLISTED_VISION', '1')
+
+from scheduler.fake_calendar import FakeCalendarService, generate_calendar, generate_tasks
+from api import main as api_main
+from api.routers import health, schedule
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'loadtest_baselines')
+DEFAULT_CLIENTS = "poll=50,schedule=2,sync=2"
+LOOP_PROBE_INTERVAL_SEC = 0.01
+PRIORITY_TO_FRONTEND = {'高': 'high', '中': 'medium', '低': 'low'}
+
+
+class StubModel:
+    """Stands in for PosturePomodoroModel: same read API, no camera or vision imports."""
+
+    def __init__(self, fps=30, gil_ms=5.0):
+        self.fps = fps
+        self.gil_sec = gil_ms / 1000.0
+        self.do_posture_test = False
+        self.do_drinking_test = False
+        self.is_calibrated = True
+        self.posture_status = "Good Posture"
+        self.last_drink_ts = time.time()
+        self.mode = "focus"
+        self.mode_seq = 0
+        self.mode_events = deque(maxlen=100)
+        self.frames = 0
+
+    @property
+    def last_drink_time(self):
+        return time.localtime(self.last_drink_ts)
+
+    def get_posture_status(self):
+        return self.posture_status
+
+    def mode_status(self, now=None):
+        return {"mode": self.mode, "since": self.last_drink_ts, "budget": {"pose_hz": None, "detector": True}}
+
+    def start_posture_detection(self):
+        self.do_posture_test = True
+
+    def start_drinking_detection(self):
+        self.do_drinking_test = True
+
+    def stop_posture_detection(self):
+        self.do_posture_test = False
+
+    def stop_drinking_detection(self):
+        self.do_drinking_test = False
+
+    def run(self):
+        interval = 1.0 / self.fps
+        while self.do_posture_test or self.do_drinking_test:
+            started = time.perf_counter()
+            # Pure-Python work never releases the GIL, the worst case for the API threads
+            while time.perf_counter() - started < self.gil_sec:
+                pass
+            self.frames += 1
+            if self.frames % 30 == 0:
+                self.posture_status = "Poor Posture" if self.posture_status == "Good Posture" else "Good Posture"
+            time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+
+
+def frontend_tasks(now, count, horizon_days, seed):
+    """generate_tasks() 的結果轉成桌面端送出的 JSON 格式"""
+    return [{
+        "id": seed * 1000 + i,
+        "name": task["name"],
+        "deadline": task["due_date"].isoformat(),
+        "priority": PRIORITY_TO_FRONTEND[task["priority"]],
+        "duration": task["duration_minutes"] / 60,
+        "completed": False,
+        "createdAt": now.isoformat(),
+    } for i, task in enumerate(generate_tasks(now, count, horizon_days, seed=seed))]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint, seconds, status):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][str(status)] += 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors[endpoint] += 1
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+# --- client behaviours ---
+def client_kinds(args, now):
+    tasks = frontend_tasks(now, args.tasks, args.days, seed=1)
+
+    def schedule_body(client_id, n):
+        # 預設所有客戶端送出同一份任務列表 (同一個使用者的多台電腦)；--vary-tasks 時每次都不同
+        if args.vary_tasks:
+            return frontend_tasks(now, args.tasks, args.days, seed=client_id * 100000 + n + 2)
+        return tasks
+
+    return {
+        "poll": ("GET", "/get_posture", None, args.poll_interval),
+        "drink": ("GET", "/get_last_drink_time", None, args.poll_interval),
+        "mode": ("GET", "/mode", None, args.poll_interval),
+        "schedule": ("POST", "/schedule", schedule_body, args.schedule_interval),
+        "sync": ("POST", "/schedule-and-sync", schedule_body, args.schedule_interval),
+    }
+
+
+async def client(http, kind, spec, client_id, deadline, recorder):
+    method, path, body, interval = spec
+    n = 0
+    while time.perf_counter() < deadline:
+        payload = body(client_id, n) if body else None
+        started = time.perf_counter()
+        try:
+            response = await http.request(method, path, json=payload)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        recorder.record(f"{method} {path}", time.perf_counter() - started, status)
+        n += 1
+        await asyncio.sleep(interval)
+
+
+# --- server side ---
+class LoopProbe:
+    """Runs inside the server's event loop and records how late each wakeup is."""
+
+    def __init__(self, interval=LOOP_PROBE_INTERVAL_SEC):
+        self.interval = interval
+        self.lags = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(time.perf_counter() - started - self.interval)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+
+def install_stubs(args, now):
+    service = FakeCalendarService(latency_ms=args.latency_ms)
+    generate_calendar(service, now, args.days + 1, meetings_per_day=4, seed=0)
+    schedule.get_calendar_service = lambda: service
+    model = StubModel(gil_ms=args.model_gil_ms)
+    health._model = model
+    return service, model
+
+
+class ServerThread:
+    def __init__(self, app, port, probe):
+        self.probe = probe
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+        self.server = uvicorn.Server(config)
+        app.router.on_startup.append(probe.start)
+        self.thread = threading.Thread(target=self.server.run, name="uvicorn", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+async def drive(args, base_url, transport=None):
+    now = dt.datetime.now().astimezone()
+    kinds = client_kinds(args, now)
+    recorder = Recorder()
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=args.timeout,
+                                 limits=httpx.Limits(max_connections=None)) as http:
+        await http.post("/start_posture_test")
+        deadline = time.perf_counter() + args.duration
+        tasks = []
+        client_id = 0
+        for kind, count in args.clients.items():
+            for _ in range(count):
+                client_id += 1
+                tasks.append(client(http, kind, kinds[kind], client_id, deadline, recorder))
+        started = time.perf_counter()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        await http.post("/stop_posture_test")
+    return recorder, elapsed
+
+
+def summarize(recorder, elapsed, lags, service, model, args):
+    endpoints = {}
+    for endpoint, values in sorted(recorder.latencies.items()):
+        values.sort()
+        endpoints[endpoint] = {
+            "requests": len(values),
+            "rps": len(values) / elapsed,
+            "error_rate": recorder.errors[endpoint] / len(values),
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p90_ms": percentile(values, 0.90) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "max_ms": values[-1] * 1000,
+            "statuses": dict(recorder.statuses[endpoint]),
+        }
+    lags = sorted(lags)
+    return {
+        "config": {"clients": args.clients, "duration": args.duration, "latency_ms": args.latency_ms,
+                   "model_gil_ms": args.model_gil_ms, "tasks": args.tasks, "vary_tasks": args.vary_tasks,
+                   "in_process": args.in_process},
+        "elapsed_sec": elapsed,
+        "endpoints": endpoints,
+        "event_loop_lag_ms": {"p50": (percentile(lags, 0.5) or 0) * 1000, "p99": (percentile(lags, 0.99) or 0) * 1000,
+                              "max": (lags[-1] if lags else 0) * 1000},
+        "calendar_calls": dict(service.calls),
+        "model_frames": model.frames,
+    }
+
+
+def print_report(summary):
+    print(f"{'endpoint':<28} {'reqs':>7} {'req/s':>8} {'err%':>6} {'p50(ms)':>9} {'p90(ms)':>9} {'p99(ms)':>9} {'max(ms)':>9}")
+    for endpoint, r in summary["endpoints"].items():
+        print(f"{endpoint:<28} {r['requests']:>7} {r['rps']:>8.1f} {100 * r['error_rate']:>6.1f} "
+              f"{r['p50_ms']:>9.1f} {r['p90_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['max_ms']:>9.1f}")
+    lag = summary["event_loop_lag_ms"]
+    print(f"\nevent loop lag: p50 {lag['p50']:.1f} ms, p99 {lag['p99']:.1f} ms, max {lag['max']:.1f} ms")
+    print(f"calendar API calls: {summary['calendar_calls']}, stub model frames: {summary['model_frames']}")
+
+
+def compare(summary, baseline, max_regression):
+    """以 p50 / p99 / 錯誤率與基準比較，回傳退步項目"""
+    regressions = []
+    print(f"\n{'endpoint':<28} {'p50 base→now':>20} {'p99 base→now':>20} {'err% base→now':>16}")
+    for endpoint, now in summary["endpoints"].items():
+        base = baseline["endpoints"].get(endpoint)
+        if base is None:
+            continue
+        print(f"{endpoint:<28} {base['p50_ms']:>9.1f}→{now['p50_ms']:<9.1f} {base['p99_ms']:>9.1f}→{now['p99_ms']:<9.1f} "
+              f"{100 * base['error_rate']:>7.1f}→{100 * now['error_rate']:<7.1f}")
+        for key in ("p50_ms", "p99_ms"):
+            if now[key] > base[key] * (1 + max_regression) and now[key] - base[key] > 1.0:
+                regressions.append(f"{endpoint} {key} {base[key]:.1f} -> {now[key]:.1f}")
+        if now["error_rate"] > base["error_rate"] + 0.01:
+            regressions.append(f"{endpoint} error rate {base['error_rate']:.1%} -> {now['error_rate']:.1%}")
+    return regressions
+
+
+def parse_clients(value):
+    clients = {}
+    for part in value.split(','):
+        kind, _, count = part.partition('=')
+        clients[kind.strip()] = int(count)
+    return clients
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the API with a stub model and a fake Calendar")
+    parser.add_argument("--clients", type=parse_clients, default=parse_clients(DEFAULT_CLIENTS),
+                        help="client mix, kinds: poll, drink, mode, schedule, sync (e.g. poll=100,sync=4)")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="seconds between polls per client")
+    parser.add_argument("--schedule-interval", type=float, default=1.0, help="seconds between schedules per client")
+    parser.add_argument("--tasks", type=int, default=20, help="tasks per schedule request")
+    parser.add_argument("--days", type=int, default=14, help="task horizon in days")
+    parser.add_argument("--vary-tasks", action="store_true", help="send a different task list on every request")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="simulated latency per Calendar API call")
+    parser.add_argument("--model-gil-ms", type=float, default=5.0, help="GIL-holding work per stub model frame")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--in-process", action="store_true", help="call the ASGI app directly instead of via uvicorn")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    parser.add_argument("--baseline-dir", default=BASELINE_DIR)
+    args = parser.parse_args(argv)
+    unknown = set(args.clients) - {"poll", "drink", "mode", "schedule", "sync"}
+    if unknown:
+        parser.error(f"unknown client kinds: {', '.join(sorted(unknown))}")
+
+    service, model = install_stubs(args, dt.datetime.now().astimezone())
+    probe = LoopProbe()
+    if args.in_process:
+        async def run_in_process():
+            probe.start()
+            return await drive(args, "http://loadtest", transport=httpx.ASGITransport(app=api_main.app))
+        recorder, elapsed = asyncio.run(run_in_process())
+    else:
+        with ServerThread(api_main.app, args.port, probe):
+            recorder, elapsed = asyncio.run(drive(args, f"http://127.0.0.1:{args.port}"))
+
+    summary = summarize(recorder, elapsed, probe.lags, service, model, args)
+    print_report(summary)
+
+    if args.save_baseline:
+        os.makedirs(args.baseline_dir, exist_ok=True)
+        path = os.path.join(args.baseline_dir, f"{args.save_baseline}.json")
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nSaved baseline to {path}")
+    if args.compare:
+        with open(os.path.join(args.baseline_dir, f"{args.compare}.json")) as f:
+            regressions = compare(summary, json.load(f), args.max_regression)
+        for r in regressions:
+            print(f"[REGRESSION] {r}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
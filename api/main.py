@@ -2,17 +2,23 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from posture.model import PosturePomodoroModel
-from scheduler.scheduler import schedule_all_tasks, get_calendar_service, get_calendar_events_as_tasks
-import threading
+from posture import metrics
+from posture.profiling import PROFILER
+from scheduler.scheduler import set_request_hook
+from scheduler.log import set_phase_hook
+try:
+    from api.routers import schedule
+except ImportError:
+    # 以 python api/main.py 直接執行時
+    from routers import schedule
+import asyncio
 import time
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Optional
-import datetime as dt
-import sys
-import io
+from fastapi.responses import Response
+
+# 姿勢/喝水檢測端點 (cv2、mediapipe、torch 在第一次使用時才載入)；設為 0 時完全不掛載，只提供排程服務
+ENABLE_VISION = os.environ.get('INLISTED_VISION', '1') != '0'
 
 app = FastAPI()
 origins = ["*"]
@@ -24,239 +30,58 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-model = PosturePomodoroModel()
-
-run_thread = threading.Thread(target=model.run)
-
-
-def query_posture_status():
-    status = model.get_posture_status()
-    print(f"Current Posture Status: {status}")
-
-def query_last_drink_time():
-    last_drink_time = model.last_drink_time
-    print(f"Last Drink Time: {last_drink_time}")
-
-def start_posture_test():
-    global run_thread
-    model.start_posture_detection()
-    print("Starting posture test...")
-    if not run_thread.is_alive():
-        model.is_calibrated = False
-        run_thread = threading.Thread(target=model.run)
-        run_thread.start()
-
-def start_drinking_test():
-    global run_thread
-    model.start_drinking_detection()
-    print("Starting drinking water test...")
-    if not run_thread.is_alive():
-        model.is_calibrated = False
-        run_thread = threading.Thread(target=model.run)
-        run_thread.start()
-
-def stop_posture_test():
-    model.stop_posture_detection()
-    print("Stopping posture test...")
-
-def stop_drinking_test():
-    model.stop_drinking_detection()
-    print("Stopping drinking water test...")
 
-# def temp_input():
-#     while True:
-#         command = input("Enter command: (A)start_posture_test (B)stop_posture_test (C)start_drinking_test, (D)stop_drinking_test, (E)posture_status, (F)last_drink_time: ")
-#         if command == "A":
-#             start_posture_test()
-#         elif command == "B":
-#             stop_posture_test()
-#         elif command == "C":
-#             start_drinking_test()
-#         elif command == "D":
-#             stop_drinking_test()
-#         elif command == "E":
-#             query_posture_status()
-#         elif command == "F":
-#             query_last_drink_time()
-
-# class StatusResponse(BaseModel):
-#     posture_status: str
-#     last_drink_time: str
-
-class PostureStatusResponse(BaseModel):
-    posture: str
-
-class DrinkStatusResponse(BaseModel):
-    year: int
-    month: int
-    day: int
-    hour: int
-    minute: int
-    second: int
-
-class Task(BaseModel):
-    id: int
-    name: str
-    deadline: str
-    priority: str
-    duration: float
-    completed: bool
-    createdAt: str
-
-class ScheduledTaskResult(BaseModel):
-    name: str
-    start: Optional[str] = None
-    end: Optional[str] = None
-    reason: Optional[str] = None
-
-class ScheduleResponse(BaseModel):
-    successful: List[ScheduledTaskResult]
-    failed: List[ScheduledTaskResult]
-    logs: List[str]
-
-class Capturing(list):
-    def __enter__(self):
-        self._stdout = sys.stdout
-        sys.stdout = self._stringio = io.StringIO()
-        return self
-    def __exit__(self, *args):
-        self.extend(self._stringio.getvalue().splitlines())
-        sys.stdout = self._stdout
-
-class TaskFromCalendar(BaseModel):
-    id: str
-    name: str
-    deadline: str
-    startTime: str
-    priority: str
-    duration: float
-    completed: bool
-    createdAt: Optional[str]
-    source: str
-
-ScheduleSyncResponse = List[TaskFromCalendar]
+# 每個 Google Calendar API 請求計數一次 (以 methodId 分類)
+set_request_hook(lambda method_id: metrics.CALENDAR_API_CALLS.labels(method_id or "unknown").inc())
+# 排程各階段也寫入 profiler 的 trace (profiler 停用時直接返回)
+set_phase_hook(PROFILER.scheduler_phase)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # 以路由樣板分類 (例如 /schedule/jobs/{job_id})，避免每個 id 產生一條序列
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    metrics.ENDPOINT_LATENCY.labels(request.method, path, response.status_code).observe(time.perf_counter() - start)
+    return response
+
+
+app.include_router(schedule.router)
+if ENABLE_VISION:
+    try:
+        from api.routers import health
+    except ImportError as e:
+        if e.name not in ('api', 'api.routers'):
+            # 缺少的是相依套件而不是路徑問題: 不能默默改用另一條匯入路徑
+            print(f"無法載入姿勢/喝水端點 (INLISTED_VISION=1，設為 0 只提供排程服務): {e}")
+            raise
+        from routers import health
+    app.include_router(health.router)
 
 @app.get("/")
 async def root():
-    return {"message": "Welcome to the PosturePomodoroModel API!"}
-
-@app.post("/start_posture_test")
-async def start_posture():
-    start_posture_test()
-    return {"message": "Posture test started."}
-
-
-@app.post("/start_drinking_test")
-async def start_drinking():
-    start_drinking_test()
-    return {"message": "Drinking water test started."}
-
-
-@app.post("/stop_posture_test")
-async def stop_posture():
-    stop_posture_test()
-    return {"message": "Posture test stopped."}
-
-
-@app.post("/stop_drinking_test")
-async def stop_drinking():
-    stop_drinking_test()
-    return {"message": "Drinking water test stopped."}
-
-
-@app.get("/get_posture", response_model=PostureStatusResponse)
-async def get_posture():
-    posture_status = model.get_posture_status()
-    return PostureStatusResponse(posture=posture_status)
-
-@app.get("/get_last_drink_time", response_model=DrinkStatusResponse)
-async def get_last_drink_time():
-    last_drink_time = model.last_drink_time
-    return DrinkStatusResponse(
-        year=last_drink_time.tm_year,
-        month=last_drink_time.tm_mon,
-        day=last_drink_time.tm_mday,
-        hour=last_drink_time.tm_hour,
-        minute=last_drink_time.tm_min,
-        second=last_drink_time.tm_sec
-    )
-
-@app.post("/schedule", response_model=ScheduleResponse)
-async def schedule_tasks_endpoint(tasks_from_frontend: List[Task]):
-    # ... (保留之前的數據格式轉換邏輯)
-    priority_map_frontend_to_backend = {'high': '高', 'medium': '中', 'low': '低'}
-    tasks_for_scheduler = []
-    local_tz = dt.datetime.now().astimezone().tzinfo
-
-    for task in tasks_from_frontend:
-        if not task.completed:
-            tasks_for_scheduler.append({
-                "name": task.name,
-                "duration_minutes": int(task.duration * 60),
-                "due_date": dt.datetime.fromisoformat(task.deadline).astimezone(local_tz),
-                "priority": priority_map_frontend_to_backend.get(task.priority, '中')
-            })
-
-    # --- 執行排程邏輯 ---
-    service = get_calendar_service()
-    if not service:
-        raise HTTPException(status_code=500, detail="Failed to authenticate with Google Calendar API")
-
-    results = None
-    with Capturing() as output_logs:
-        # 執行並接收回傳結果
-        results = schedule_all_tasks(service, tasks_for_scheduler)
-    
-    print("Scheduler logs:", output_logs)
-
-    if not results:
-         raise HTTPException(status_code=500, detail="Scheduler failed to return results.")
-
-    return {
-        "successful": results["successful"],
-        "failed": results["failed"],
-        "logs": output_logs
-    }
-
-@app.post("/schedule-and-sync", response_model=ScheduleSyncResponse) # 更改路徑和回應模型
-async def schedule_and_sync_endpoint(tasks_from_frontend: List[Task]):
-    # ... (保留之前的數據格式轉換邏輯)
-    priority_map_frontend_to_backend = {'high': '高', 'medium': '中', 'low': '低'}
-    tasks_for_scheduler = []
-    local_tz = dt.datetime.now().astimezone().tzinfo
-    now = dt.datetime.now(local_tz)
-    last_due_date = now
-
-    for task in tasks_from_frontend:
-        if not task.completed:
-            due_date = dt.datetime.fromisoformat(task.deadline).astimezone(local_tz)
-            if due_date > last_due_date:
-                last_due_date = due_date
-            tasks_for_scheduler.append({
-                "name": task.name,
-                "duration_minutes": int(task.duration * 60),
-                "due_date": due_date,
-                "priority": priority_map_frontend_to_backend.get(task.priority, '中')
-            })
-
-    # 1. 執行排程
-    service = get_calendar_service()
-    if not service:
-        raise HTTPException(status_code=500, detail="Failed to authenticate with Google Calendar API")
-    
-    with Capturing() as output_logs:
-        schedule_all_tasks(service, tasks_for_scheduler)
-    
-    print("Scheduler logs:", output_logs)
-
-    # 2. 排程後，讀取整個行事曆的事件
-    # 將讀取範圍擴大一天，以包含可能的跨日排程
-    end_range = last_due_date + dt.timedelta(days=1)
-    
-    synced_tasks = get_calendar_events_as_tasks(service, now, end_range)
-
-    # 3. 回傳完整的、已排序的任務列表
-    return synced_tasks
+    return {"message": "Welcome to the PosturePomodoroModel API!", "vision": ENABLE_VISION}
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+# 效能分析: 每幀各步驟的 trace (Chrome trace / Perfetto JSON) 與模型執行緒的堆疊取樣，停用時不記錄任何資料
+@app.post("/profiling/start")
+async def start_profiling():
+    PROFILER.start()
+    return PROFILER.status()
+
+@app.post("/profiling/stop")
+async def stop_profiling():
+    # 停止時會寫出最後一個檔案，不在 event loop 上等待
+    await asyncio.to_thread(PROFILER.stop)
+    return PROFILER.status()
+
+@app.get("/profiling")
+async def get_profiling():
+    return PROFILER.status()
 
 if __name__ == "__main__":
     import uvicorn
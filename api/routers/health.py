@@ -0,0 +1,161 @@
+# 姿勢 / 喝水檢測、狀態機與即時預覽的端點
+# cv2、mediapipe、torch 在第一次呼叫這些端點時才載入，只用排程功能的部署不需負擔
+import asyncio
+import threading
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+router = APIRouter()
+
+_model = None
+_model_lock = threading.Lock()
+run_thread = None
+_run_lock = threading.Lock()
+
+
+def get_model():
+    """第一次呼叫時才匯入並建立模型 (載入 YOLO 可能需要數秒)"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from posture.model import PosturePomodoroModel
+                _model = PosturePomodoroModel()
+    return _model
+
+
+async def vision_model():
+    # 建立模型時不阻塞 event loop
+    if _model is not None:
+        return _model
+    return await asyncio.to_thread(get_model)
+
+
+def ensure_running(model):
+    global run_thread
+    # 啟動端點在執行緒池中執行，檢查與啟動必須一起鎖住，否則兩個請求可能各自啟動一個 model.run
+    with _run_lock:
+        if run_thread is None or not run_thread.is_alive():
+            model.is_calibrated = False
+            run_thread = threading.Thread(target=model.run)
+            run_thread.start()
+
+
+def query_posture_status():
+    status = get_model().get_posture_status()
+    print(f"Current Posture Status: {status}")
+
+def query_last_drink_time():
+    last_drink_time = get_model().last_drink_time
+    print(f"Last Drink Time: {last_drink_time}")
+
+def start_posture_test():
+    model = get_model()
+    model.start_posture_detection()
+    print("Starting posture test...")
+    ensure_running(model)
+
+def start_drinking_test():
+    model = get_model()
+    model.start_drinking_detection()
+    print("Starting drinking water test...")
+    ensure_running(model)
+
+def stop_posture_test():
+    if _model is not None:
+        _model.stop_posture_detection()
+    print("Stopping posture test...")
+
+def stop_drinking_test():
+    if _model is not None:
+        _model.stop_drinking_detection()
+    print("Stopping drinking water test...")
+
+
+class PostureStatusResponse(BaseModel):
+    posture: str
+
+class DrinkStatusResponse(BaseModel):
+    year: int
+    month: int
+    day: int
+    hour: int
+    minute: int
+    second: int
+
+
+@router.post("/start_posture_test")
+async def start_posture():
+    await asyncio.to_thread(start_posture_test)
+    return {"message": "Posture test started."}
+
+
+@router.post("/start_drinking_test")
+async def start_drinking():
+    await asyncio.to_thread(start_drinking_test)
+    return {"message": "Drinking water test started."}
+
+
+@router.post("/stop_posture_test")
+async def stop_posture():
+    stop_posture_test()
+    return {"message": "Posture test stopped."}
+
+
+@router.post("/stop_drinking_test")
+async def stop_drinking():
+    stop_drinking_test()
+    return {"message": "Drinking water test stopped."}
+
+
+@router.get("/get_posture", response_model=PostureStatusResponse)
+async def get_posture(model=Depends(vision_model)):
+    posture_status = model.get_posture_status()
+    return PostureStatusResponse(posture=posture_status)
+
+@router.get("/get_last_drink_time", response_model=DrinkStatusResponse)
+async def get_last_drink_time(model=Depends(vision_model)):
+    last_drink_time = model.last_drink_time
+    return DrinkStatusResponse(
+        year=last_drink_time.tm_year,
+        month=last_drink_time.tm_mon,
+        day=last_drink_time.tm_mday,
+        hour=last_drink_time.tm_hour,
+        minute=last_drink_time.tm_min,
+        second=last_drink_time.tm_sec
+    )
+
+# 專注/休息/離開 狀態機: 目前狀態、計時與推論預算
+@router.get("/mode")
+async def get_mode(model=Depends(vision_model)):
+    return model.mode_status()
+
+# 狀態轉換事件; 以 after=上次看到的 seq 輪詢即可只取新事件
+@router.get("/mode/events")
+async def get_mode_events(after: int = 0, model=Depends(vision_model)):
+    return {"events": [e for e in list(model.mode_events) if e["seq"] > after], "seq": model.mode_seq}
+
+# 即時預覽: 只在有人連線時才繪製與編碼影像 (需先啟動姿勢或喝水檢測)
+async def mjpeg_frames(model):
+    with model.preview.subscription() as sub:
+        while True:
+            jpeg = await sub.next_frame()
+            yield (b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(jpeg)).encode() +
+                   b"\r\n\r\n" + jpeg + b"\r\n")
+
+@router.get("/preview.mjpg")
+async def preview_mjpeg(model=Depends(vision_model)):
+    return StreamingResponse(mjpeg_frames(model), media_type="multipart/x-mixed-replace; boundary=frame")
+
+@router.websocket("/ws/preview")
+async def preview_websocket(websocket: WebSocket):
+    # 每則 binary 訊息是一張 JPEG
+    await websocket.accept()
+    model = await vision_model()
+    try:
+        with model.preview.subscription() as sub:
+            while True:
+                await websocket.send_bytes(await sub.next_frame())
+    except WebSocketDisconnect:
+        pass
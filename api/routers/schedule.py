@@ -0,0 +1,318 @@
+# 排程相關端點: 只依賴 scheduler/，不會載入任何影像相關套件
+import asyncio
+import hashlib
+import hmac
+import json
+import threading
+import datetime as dt
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from google.auth.exceptions import RefreshError
+from googleapiclient.errors import HttpError
+from pydantic import BaseModel
+from typing import Any, Dict, List, Literal, Optional
+from scheduler.scheduler import schedule_all_tasks, get_calendar_service, PrimaryEventSnapshot, sync_calendar_tasks, CredentialsRequired
+from scheduler.jobs import SchedulerJobManager, JobQueueFull
+from scheduler.log import ScheduleLog
+from scheduler.tenants import ClientPool, TENANT_WORKERS, TENANT_MAX_PENDING, ADMIN_KEY
+
+router = APIRouter()
+# 排程工作在獨立的執行緒池中執行，避免阻塞 event loop
+scheduler_jobs = SchedulerJobManager()
+# 預設 (token.json) 只有一個行事曆: 內容不同的排程也不能同時比對同一份行事曆，否則會各自建立相同任務的事件
+default_calendar_lock = threading.Lock()
+# 多使用者: 每個使用者各自的 token 與 Calendar client，另一個較大的執行緒池，Calendar 請求受全域與個別使用者的配額限制
+client_pool = ClientPool()
+tenant_jobs = SchedulerJobManager(max_workers=TENANT_WORKERS, max_pending=TENANT_MAX_PENDING)
+
+class Task(BaseModel):
+    id: int
+    name: str
+    deadline: str
+    priority: str
+    duration: float
+    completed: bool
+    createdAt: str
+
+class ScheduledTaskResult(BaseModel):
+    name: str
+    start: Optional[str] = None
+    end: Optional[str] = None
+    reason: Optional[str] = None
+    action: Optional[str] = None   # unchanged / created / moved
+
+class ScheduleResponse(BaseModel):
+    successful: List[ScheduledTaskResult]
+    failed: List[ScheduledTaskResult]
+    logs: List[str]
+    records: List[Dict[str, Any]] = []
+    timings: Dict[str, Dict[str, float]] = {}
+    optimizer: Optional[Dict[str, Any]] = None
+    writes: Dict[str, int] = {}
+
+class TaskFromCalendar(BaseModel):
+    id: str
+    name: str
+    deadline: str
+    startTime: str
+    priority: str
+    duration: float
+    completed: bool
+    createdAt: Optional[str]
+    source: str
+
+ScheduleSyncResponse = List[TaskFromCalendar]
+
+# 'greedy': 依優先級逐一排入；'optimized': 整體規劃，可分段並盡量排入更多任務
+SchedulerMode = Literal['greedy', 'optimized']
+
+class ScheduleJobResponse(BaseModel):
+    job_id: str
+    status: str
+
+def to_scheduler_tasks(tasks_from_frontend):
+    """將前端任務格式轉換為排程器格式，並回傳最晚的截止時間"""
+    priority_map_frontend_to_backend = {'high': '高', 'medium': '中', 'low': '低'}
+    tasks_for_scheduler = []
+    local_tz = dt.datetime.now().astimezone().tzinfo
+    last_due_date = dt.datetime.now(local_tz)
+
+    for task in tasks_from_frontend:
+        if not task.completed:
+            due_date = dt.datetime.fromisoformat(task.deadline).astimezone(local_tz)
+            if due_date > last_due_date:
+                last_due_date = due_date
+            tasks_for_scheduler.append({
+                "id": task.id,
+                "name": task.name,
+                "duration_minutes": int(task.duration * 60),
+                "due_date": due_date,
+                "priority": priority_map_frontend_to_backend.get(task.priority, '中')
+            })
+    return tasks_for_scheduler, last_due_date
+
+def run_schedule(tasks_for_scheduler, mode='greedy', progress=None, service=None):
+    # 在排程執行緒中執行 (阻塞的 Google API 呼叫)
+    if service is None:
+        service = get_calendar_service()
+    if not service:
+        raise RuntimeError("Failed to authenticate with Google Calendar API")
+
+    # 每個請求各自的 log 收集器，並行的排程不會互相干擾
+    log = ScheduleLog()
+    results = schedule_all_tasks(service, tasks_for_scheduler, progress=progress, log=log, mode=mode)
+
+    print("Scheduler timings:", log.timings)
+
+    if not results:
+        raise RuntimeError("Scheduler failed to return results.")
+
+    return {
+        "successful": results["successful"],
+        "failed": results["failed"],
+        "logs": log.lines(),
+        "records": log.records,
+        "timings": log.timings,
+        "optimizer": results.get("optimizer"),
+        "writes": results.get("writes", {})
+    }
+
+def run_schedule_and_sync(tasks_for_scheduler, last_due_date, mode='greedy', progress=None, service=None):
+    now = dt.datetime.now(last_due_date.tzinfo)
+
+    # 1. 執行排程
+    if service is None:
+        service = get_calendar_service()
+    if not service:
+        raise RuntimeError("Failed to authenticate with Google Calendar API")
+
+    # 將讀取範圍擴大一天，以包含可能的跨日排程；排程時讀到的主要行事曆事件與寫入的事件都記在 snapshot 中
+    end_range = last_due_date + dt.timedelta(days=1)
+    snapshot = PrimaryEventSnapshot(now, end_range)
+
+    log = ScheduleLog()
+    schedule_all_tasks(service, tasks_for_scheduler, progress=progress, log=log, mode=mode, snapshot=snapshot)
+
+    # 2. 排程後不再重新下載整個行事曆，只檢查排程期間的變更
+    # 3. 回傳完整的、已排序的任務列表
+    with log.phase("sync"):
+        synced_tasks = sync_calendar_tasks(service, snapshot, log=log)
+
+    print("Scheduler timings:", log.timings)
+    return synced_tasks
+
+def schedule_request_key(kind, mode, tasks_from_frontend):
+    """相同內容的請求得到相同的 key，並行時只計算一次"""
+    payload = json.dumps([kind, mode, [t.model_dump() for t in tasks_from_frontend]], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def run_on_default_calendar(fn, *args, progress=None):
+    # 與多使用者的 client_pool.user_lock 相同: 同一個行事曆的排程依序執行
+    with default_calendar_lock:
+        return fn(*args, progress=progress)
+
+def submit_schedule_job(fn, *args, key=None):
+    try:
+        return scheduler_jobs.submit(run_on_default_calendar, fn, *args, key=key)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+async def wait_schedule_job(job):
+    # 409: 需要重新授權 (沒有 token 或 refresh token 失效)；502: Google Calendar API 回傳錯誤
+    try:
+        return await asyncio.wrap_future(job.future)
+    except (CredentialsRequired, RefreshError) as e:
+        raise HTTPException(status_code=409, detail=f"Google authorization required: {e}")
+    except HttpError as e:
+        raise HTTPException(status_code=502, detail=f"Google Calendar API error: {e}")
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/schedule", response_model=ScheduleResponse)
+async def schedule_tasks_endpoint(tasks_from_frontend: List[Task], mode: SchedulerMode = 'greedy'):
+    tasks_for_scheduler, _ = to_scheduler_tasks(tasks_from_frontend)
+    job = submit_schedule_job(run_schedule, tasks_for_scheduler, mode,
+                              key=schedule_request_key("schedule", mode, tasks_from_frontend))
+    return await wait_schedule_job(job)
+
+@router.post("/schedule-and-sync", response_model=ScheduleSyncResponse) # 更改路徑和回應模型
+async def schedule_and_sync_endpoint(tasks_from_frontend: List[Task], mode: SchedulerMode = 'greedy'):
+    tasks_for_scheduler, last_due_date = to_scheduler_tasks(tasks_from_frontend)
+    job = submit_schedule_job(run_schedule_and_sync, tasks_for_scheduler, last_due_date, mode,
+                              key=schedule_request_key("sync", mode, tasks_from_frontend))
+    return await wait_schedule_job(job)
+
+@router.post("/schedule/jobs", response_model=ScheduleJobResponse)
+async def submit_schedule_job_endpoint(tasks_from_frontend: List[Task], sync: bool = False, mode: SchedulerMode = 'greedy'):
+    # 非同步版本: 立即回傳 job id，之後以 GET /schedule/jobs/{job_id} 查詢進度與結果
+    tasks_for_scheduler, last_due_date = to_scheduler_tasks(tasks_from_frontend)
+    if sync:
+        job = submit_schedule_job(run_schedule_and_sync, tasks_for_scheduler, last_due_date, mode,
+                                  key=schedule_request_key("sync", mode, tasks_from_frontend))
+    else:
+        job = submit_schedule_job(run_schedule, tasks_for_scheduler, mode,
+                                  key=schedule_request_key("schedule", mode, tasks_from_frontend))
+    return ScheduleJobResponse(job_id=job.id, status=job.status)
+
+@router.get("/schedule/jobs/{job_id}")
+async def get_schedule_job(job_id: str):
+    # 只查詢預設行事曆的工作；多使用者的工作要以 GET /users/{user_id}/jobs/{job_id} 驗證後查詢
+    job = scheduler_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+# --- 多使用者 ---
+class UserScheduleRequest(BaseModel):
+    user: str
+    tasks: List[Task]
+    mode: SchedulerMode = 'greedy'
+    sync: bool = False
+
+def run_user_schedule(user, tasks_for_scheduler, last_due_date, mode='greedy', sync=False, progress=None):
+    # 同一個使用者的排程依序執行 (避免重複建立事件)，不同使用者並行
+    def run(service):
+        if sync:
+            return run_schedule_and_sync(tasks_for_scheduler, last_due_date, mode, progress, service=service)
+        return run_schedule(tasks_for_scheduler, mode, progress, service=service)
+    return client_pool.call(user, run)
+
+def submit_user_job(user, tasks_from_frontend, mode, sync):
+    tasks_for_scheduler, last_due_date = to_scheduler_tasks(tasks_from_frontend)
+    key = schedule_request_key(f"{'sync' if sync else 'schedule'}:{user}", mode, tasks_from_frontend)
+    return tenant_jobs.submit(run_user_schedule, user, tasks_for_scheduler, last_due_date, mode, sync, key=key, owner=user)
+
+# 驗證: Authorization: Bearer <key>。使用者的 key 只能操作自己的 token 與行事曆，管理金鑰 (SCHEDULER_ADMIN_KEY) 可操作所有使用者
+def bearer_key(authorization: Optional[str] = Header(None)):
+    scheme, _, key = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not key.strip():
+        raise HTTPException(status_code=401, detail="Missing API key", headers={"WWW-Authenticate": "Bearer"})
+    return key.strip()
+
+def is_admin_key(key):
+    return ADMIN_KEY is not None and hmac.compare_digest(key.encode('utf-8'), ADMIN_KEY.encode('utf-8'))
+
+def require_admin(key: str = Depends(bearer_key)):
+    if not is_admin_key(key):
+        raise HTTPException(status_code=403, detail="Admin key required")
+
+def authorize_user(user_id: str, key: str = Depends(bearer_key)):
+    if not (is_admin_key(key) or client_pool.store.check_key(user_id, key)):
+        raise HTTPException(status_code=403, detail=f"API key is not valid for user '{user_id}'")
+    return user_id
+
+@router.post("/users/{user_id}/key", dependencies=[Depends(require_admin)])
+async def issue_user_key(user_id: str):
+    # 產生 (或更換) 使用者的 API key，明文只在這次回應中出現
+    return {"user": user_id, "api_key": client_pool.store.issue_key(user_id)}
+
+@router.put("/users/{user_id}/token", dependencies=[Depends(authorize_user)])
+async def put_user_token(user_id: str, token: Dict[str, Any]):
+    # 內容與 token.json 相同 (桌面端完成 OAuth 後上傳)；之後的排程不會再開啟瀏覽器授權
+    try:
+        client_pool.store.save_info(user_id, token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid token: {e}")
+    client_pool.evict(user_id)
+    return {"user": user_id, "stored": True}
+
+@router.delete("/users/{user_id}/token", dependencies=[Depends(authorize_user)])
+async def delete_user_token(user_id: str):
+    client_pool.evict(user_id)
+    return {"user": user_id, "deleted": client_pool.store.delete(user_id)}
+
+@router.post("/users/{user_id}/schedule", dependencies=[Depends(authorize_user)])
+async def schedule_user_endpoint(user_id: str, tasks_from_frontend: List[Task], sync: bool = False, mode: SchedulerMode = 'greedy'):
+    try:
+        job = submit_user_job(user_id, tasks_from_frontend, mode, sync)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return await wait_schedule_job(job)
+
+@router.get("/users/{user_id}/jobs/{job_id}", dependencies=[Depends(authorize_user)])
+async def get_user_job(user_id: str, job_id: str):
+    # 其他使用者的工作一律回傳 404，不透露該 id 是否存在
+    job = tenant_jobs.get(job_id)
+    if job is None or job.owner != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+def bulk_line(request, job=None, status="done", result=None, error=None):
+    line = {"user": request.user, "job_id": job.id if job else None, "status": status}
+    if result is not None:
+        line["result"] = result
+    if error is not None:
+        line["error"] = error
+    return json.dumps(line, ensure_ascii=False, default=str) + "\n"
+
+@router.post("/schedule/bulk", dependencies=[Depends(require_admin)])
+async def bulk_schedule_endpoint(requests: List[UserScheduleRequest]):
+    """
+    一次送出多個使用者的任務列表 (跨使用者，需要管理金鑰)，每個使用者完成時輸出一行 JSON (NDJSON)，先完成的先輸出。
+    status: done / failed / credentials_required / rejected (佇列已滿)
+    """
+    submitted = []
+    rejected = []
+    for request in requests:
+        try:
+            submitted.append((request, submit_user_job(request.user, request.tasks, request.mode, request.sync)))
+        except JobQueueFull as e:
+            rejected.append((request, str(e)))
+
+    async def lines():
+        for request, error in rejected:
+            yield bulk_line(request, status="rejected", error=error)
+        pending = {asyncio.wrap_future(job.future): (request, job) for request, job in submitted}
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                request, job = pending.pop(future)
+                try:
+                    yield bulk_line(request, job, result=future.result())
+                except CredentialsRequired as e:
+                    yield bulk_line(request, job, status="credentials_required", error=str(e))
+                except Exception as e:
+                    yield bulk_line(request, job, status="failed", error=str(e))
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
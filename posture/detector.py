@@ -0,0 +1,418 @@
+"""
+CPU loading profile for the YOLOv5 drink detector, plus a latency benchmark.
+
+    python -m posture.detector --model yolov5m --size 896 --image frame.jpg
+    python -m posture.detector --model yolov5s --size 640 --runs 50 --quantize --out bench.json
+
+The benchmark loads the detector twice, each time in a fresh process because
+torch thread settings are process-wide. The first load is the old path: a
+plain torch hub load called under no_grad, with rectangular ROIs. The second
+load uses the tuned CPU profile. For each load it reports the load time, the
+latency of the first full-frame call, and p50/p90/p99 latency for full frames
+and for head-sized ROIs.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+try:
+    import torch
+    TORCH_OK = True
+except Exception:
+    TORCH_OK = False
+
+# CPU profile defaults (overridable through the model config)
+POSE_RESERVED_THREADS = 2       # cores left to MediaPipe, the camera and the API when sizing torch's pool
+DETECTOR_WARMUP_RUNS = 2        # passes per input shape before the first real frame
+DETECTOR_CACHE_DIR = os.path.abspath(os.path.expanduser(os.environ.get("POSTURE_DETECTOR_CACHE") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join("~", ".cache"), "inlisted", "detector")))
+PAD_VALUE = 114                 # YOLOv5's letterbox gray
+HUB_REPO = "ultralytics/yolov5"
+LOCAL_REPO = "yolov5"           # offline fallback: a clone of the yolov5 repo next to the weights
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def detector_threads(reserved=POSE_RESERVED_THREADS, cpus=None):
+    """Intra-op threads for torch once `reserved` cores are set aside for pose and the rest of the loop."""
+    return max(1, (cpus or available_cpus()) - reserved)
+
+
+def configure_threads(threads):
+    """
+    Size torch's process-wide thread pools. The detector runs a single graph
+    per call, so only intra-op parallelism helps. The inter-op pool is
+    pinned to one thread so it cannot spin up extra workers that compete
+    with MediaPipe.
+    """
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass    # only allowed once per process, before any inter-op work
+    return torch.get_num_threads()
+
+
+def pad_to_square(img, value=PAD_VALUE):
+    """
+    Pad the right and bottom edges so the image is square. Boxes found in the
+    padded image keep the original image's coordinates. Only the part that
+    reaches into the padding has to be clipped (see clip_boxes).
+    """
+    h, w = img.shape[:2]
+    if h == w:
+        return img
+    side = max(h, w)
+    return cv2.copyMakeBorder(img, 0, side - h, 0, side - w, cv2.BORDER_CONSTANT, value=(value, value, value))
+
+
+def clip_boxes(boxes, w, h):
+    """Clip [(x1, y1, x2, y2, name, conf)] to a w x h image, dropping boxes that lie entirely in the padding."""
+    clipped = []
+    for x1, y1, x2, y2, name, conf in boxes:
+        if x1 >= w or y1 >= h:
+            continue
+        clipped.append((x1, y1, min(x2, w), min(y2, h), name, conf))
+    return clipped
+
+
+def hub_load(name):
+    try:
+        # Torch hub online
+        return torch.hub.load(HUB_REPO, name, pretrained=True)
+    except Exception:
+        # Local fallback: clone repo to ./yolov5 and place <name>.pt in working directory
+        return torch.hub.load(LOCAL_REPO, 'custom', path=f'{name}.pt', source='local')
+
+
+def prepare_cpu(model, channels_last=True, quantize=False):
+    """
+    Prepare a hub model for CPU inference and return what was applied:
+
+    - switch to eval mode and fuse Conv+BN. The hub loader usually fuses
+      already, and fusing twice is a no-op.
+    - if `channels_last`, convert conv weights to NHWC, the layout oneDNN's
+      CPU convolutions prefer.
+    - if `quantize`, apply dynamic int8 quantization. This covers only
+      nn.Linear layers. Plain YOLOv5 is all convolutions, so the count
+      stays 0 there.
+    """
+    info = {"fused": False, "channels_last": False, "quantized_layers": 0}
+    model.eval()
+    inner = getattr(getattr(model, "model", None), "model", None)     # AutoShape -> DetectMultiBackend -> DetectionModel
+    if inner is not None and hasattr(inner, "fuse"):
+        inner.fuse()
+        info["fused"] = True
+    if channels_last:
+        model.to(memory_format=torch.channels_last)
+        info["channels_last"] = True
+    if quantize:
+        target = inner if inner is not None else model
+        linear = sum(isinstance(m, torch.nn.Linear) for m in target.modules())
+        if linear:
+            torch.ao.quantization.quantize_dynamic(target, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        info["quantized_layers"] = linear
+    return info
+
+
+def cache_path(cache_dir, name, channels_last, quantize):
+    tag = f"{name}-{'int8' if quantize else 'fp32'}{'-cl' if channels_last else ''}-torch{torch.__version__.split('+')[0]}"
+    return os.path.join(cache_dir, f"{tag}.pt")
+
+
+def _repo_dirs():
+    return [d for d in (os.path.join(torch.hub.get_dir(), "ultralytics_yolov5_master"), os.path.abspath(LOCAL_REPO))
+            if os.path.isdir(d)]
+
+
+def _owned_private(path):
+    """True if `path` belongs to this user and nobody else can write to it."""
+    if not hasattr(os, "getuid"):  # Windows: rely on the per-user cache location
+        return True
+    st = os.stat(path)
+    return st.st_uid == os.getuid() and not st.st_mode & 0o022
+
+
+def load_cached(path):
+    """
+    Unpickle a prepared model, or return None if there is no usable cache entry.
+
+    A full AutoShape pickle cannot be loaded with weights_only=True, so the
+    cache only lives in a directory this app created for itself, and files
+    that anyone else could have written are ignored.
+    """
+    if not os.path.exists(path):
+        return None
+    if not (_owned_private(path) and _owned_private(os.path.dirname(path))):
+        print(f"Detector cache {path} is not private to this user, loading from torch hub")
+        return None
+    # The pickled classes (models.common.AutoShape, ...) live in the yolov5 repo,
+    # which torch hub only puts on sys.path while it loads
+    added = [d for d in _repo_dirs() if d not in sys.path]
+    sys.path[:0] = added
+    try:
+        return torch.load(path, map_location="cpu", weights_only=False)
+    except Exception as e:
+        print(f"Detector cache {path} unusable ({e}), loading from torch hub")
+        return None
+    finally:
+        for d in added:
+            sys.path.remove(d)
+
+
+def save_cached(model, path):
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        torch.save(model, tmp)
+        os.replace(tmp, path)
+        return True
+    except Exception as e:
+        print(f"Could not cache detector to {path}: {e}")
+        return False
+
+
+def infer(model, img_bgr, size):
+    with torch.inference_mode():
+        return model(img_bgr, size=size)
+
+
+def warmup(model, shapes, size, runs=DETECTOR_WARMUP_RUNS, done=None):
+    """
+    Run `runs` dummy passes for each (h, w) input shape that is not in `done`.
+    oneDNN builds its kernels the first time it sees a shape, so this moves
+    that cost out of the first real frames.
+    """
+    done = set() if done is None else done
+    for shape in shapes:
+        shape = tuple(shape)
+        if shape in done:
+            continue
+        img = np.full((shape[0], shape[1], 3), PAD_VALUE, np.uint8)
+        for _ in range(runs):
+            infer(model, img, size)
+        done.add(shape)
+    return done
+
+
+def load_detector(name, size, cpu=True, threads=None, reserved=POSE_RESERVED_THREADS, channels_last=True,
+                  quantize=False, warmup_runs=DETECTOR_WARMUP_RUNS, warmup_shapes=(), cache_dir=DETECTOR_CACHE_DIR):
+    """
+    Load the hub detector. With `cpu` (and no CUDA device) the CPU profile
+    is applied:
+
+    - size torch's thread pools
+    - reuse a prepared model from `cache_dir`, or prepare one and cache it
+    - warm up each shape in `warmup_shapes` plus the square ROI shape
+
+    Returns (model, info). `info` reports the settings that were applied and
+    the set of warmed shapes.
+    """
+    started = time.perf_counter()
+    cuda = torch.cuda.is_available()
+    cpu = cpu and not cuda
+    info = {"name": name, "cpu_profile": cpu, "device": "cuda" if cuda else "cpu", "cache": None}
+    if not cpu:
+        model = hub_load(name)
+        if cuda:
+            model.to('cuda')
+        info["load_sec"] = time.perf_counter() - started
+        return model, info
+
+    info["threads"] = configure_threads(threads or detector_threads(reserved))
+    path = cache_path(cache_dir, name, channels_last, quantize) if cache_dir else None
+    model = load_cached(path) if path else None
+    if model is not None:
+        info["cache"] = "hit"
+        info.update(getattr(model, "cpu_profile", {}))
+    else:
+        model = hub_load(name)
+        prepared = prepare_cpu(model, channels_last=channels_last, quantize=quantize)
+        info.update(prepared)
+        if path:
+            model.cpu_profile = prepared
+            info["cache"] = "saved" if save_cached(model, path) else "failed"
+    info["load_sec"] = time.perf_counter() - started
+
+    t0 = time.perf_counter()
+    info["warm_shapes"] = warmup(model, [*warmup_shapes, (size, size)], size, runs=warmup_runs)
+    info["warmup_sec"] = time.perf_counter() - t0
+    return model, info
+
+
+def describe(info):
+    if not info["cpu_profile"]:
+        return f"Detector {info['name']} on {info['device']} ({info['load_sec']:.1f}s)"
+    applied = [f"{info['threads']} threads"]
+    if info.get("fused"):
+        applied.append("fused")
+    if info.get("channels_last"):
+        applied.append("channels-last")
+    if info.get("quantized_layers"):
+        applied.append(f"int8 x{info['quantized_layers']}")
+    if info["cache"]:
+        applied.append(f"cache {info['cache']}")
+    return (f"Detector {info['name']} on cpu: {', '.join(applied)} "
+            f"(load {info['load_sec']:.1f}s, warm-up {info['warmup_sec']:.1f}s)")
+
+
+# --- Benchmark ---
+
+def percentiles(samples_ms):
+    arr = np.asarray(samples_ms, dtype=float)
+    return {"n": int(arr.size), "mean": float(arr.mean()), "p50": float(np.percentile(arr, 50)),
+            "p90": float(np.percentile(arr, 90)), "p99": float(np.percentile(arr, 99))}
+
+
+def bench_frame(args):
+    if args.image:
+        frame = cv2.imread(args.image)
+        if frame is None:
+            raise SystemExit(f"cannot read {args.image}")
+        return frame
+    # Smooth noise: no detections, so NMS cost is at its minimum
+    rng = np.random.default_rng(0)
+    h, w = args.frame_shape
+    small = rng.integers(0, 255, (h // 16, w // 16, 3), dtype=np.uint8)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)
+
+
+def head_rois(frame, count, seed=0):
+    """Crops sized like the head ROI (about a quarter to half of the frame height, varying aspect ratio)."""
+    rng = np.random.default_rng(seed)
+    H, W = frame.shape[:2]
+    rois = []
+    for _ in range(count):
+        h = int(rng.uniform(0.25, 0.5) * H)
+        w = int(h * rng.uniform(0.8, 1.4))
+        y = int(rng.integers(0, H - h))
+        x = int(rng.integers(0, max(1, W - w)))
+        rois.append(frame[y:y + h, x:x + w])
+    return rois
+
+
+def bench_child(args):
+    """One profile in this process; prints a JSON line with its numbers."""
+    frame = bench_frame(args)
+    rois = head_rois(frame, args.runs)
+    if args.profile == "baseline":
+        t0 = time.perf_counter()
+        model = hub_load(args.model)
+        model.conf, model.iou = args.conf, 0.45
+        result = {"load_sec": time.perf_counter() - t0, "threads": torch.get_num_threads()}
+
+        def call(img):
+            with torch.no_grad():
+                model(img, size=args.size)
+        call_roi = call
+    else:
+        model, info = load_detector(args.model, args.size, threads=args.threads, reserved=args.reserved,
+                                    channels_last=not args.no_channels_last, quantize=args.quantize,
+                                    warmup_runs=args.warmup_runs, warmup_shapes=[frame.shape[:2]],
+                                    cache_dir=None if args.no_cache else args.cache_dir)
+        model.conf, model.iou = args.conf, 0.45
+        result = {k: v for k, v in info.items() if k != "warm_shapes"}
+
+        def call(img):
+            infer(model, img, args.size)
+
+        def call_roi(img):
+            infer(model, pad_to_square(img), args.size)
+
+    def timed(fn, img):
+        t = time.perf_counter()
+        fn(img)
+        return (time.perf_counter() - t) * 1000.0
+
+    result["first_full_ms"] = timed(call, frame)
+    result["full"] = percentiles([timed(call, frame) for _ in range(args.runs)])
+    result["roi"] = percentiles([timed(call_roi, roi) for roi in rois])
+    print(json.dumps(result))
+
+
+def child_argv(args):
+    argv = ["--model", args.model, "--size", str(args.size), "--conf", str(args.conf), "--runs", str(args.runs),
+            "--frame-shape", *map(str, args.frame_shape), "--reserved", str(args.reserved),
+            "--warmup-runs", str(args.warmup_runs), "--cache-dir", args.cache_dir]
+    if args.image:
+        argv += ["--image", os.path.abspath(args.image)]
+    if args.threads:
+        argv += ["--threads", str(args.threads)]
+    for flag in ("no_channels_last", "quantize", "no_cache"):
+        if getattr(args, flag):
+            argv.append("--" + flag.replace("_", "-"))
+    return argv
+
+
+def run_profile(args, profile):
+    cmd = [sys.executable, "-m", "posture.detector", "--child", profile, *child_argv(args)]
+    # Same working directory as the caller (the local yolov5 fallback and the cache are relative to it)
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [repo_root, os.environ.get("PYTHONPATH")])))
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{profile} benchmark failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def report(results):
+    print(f"{'profile':<10} {'threads':>7} {'load(s)':>8} {'first(ms)':>10} "
+          f"{'full p50/p90/p99 (ms)':>24} {'roi p50/p90/p99 (ms)':>24}")
+    for profile, r in results.items():
+        full = "{p50:.1f}/{p90:.1f}/{p99:.1f}".format(**r["full"])
+        roi = "{p50:.1f}/{p90:.1f}/{p99:.1f}".format(**r["roi"])
+        print(f"{profile:<10} {r['threads']:>7} {r['load_sec']:>8.1f} {r['first_full_ms']:>10.1f} {full:>24} {roi:>24}")
+    if "baseline" in results and "cpu" in results:
+        base, cpu = results["baseline"], results["cpu"]
+        for kind in ("full", "roi"):
+            print(f"{kind}: p50 {base[kind]['p50'] / cpu[kind]['p50']:.2f}x, "
+                  f"p99 {base[kind]['p99'] / cpu[kind]['p99']:.2f}x faster with the CPU profile")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detector latency before/after the CPU profile")
+    parser.add_argument("--model", default="yolov5m")
+    parser.add_argument("--size", type=int, default=896)
+    parser.add_argument("--conf", type=float, default=0.20)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--image", help="a real camera frame (default: synthetic 480x640)")
+    parser.add_argument("--frame-shape", type=int, nargs=2, default=(480, 640), metavar=("H", "W"))
+    parser.add_argument("--threads", type=int, help="torch intra-op threads (default: cores - --reserved)")
+    parser.add_argument("--reserved", type=int, default=POSE_RESERVED_THREADS)
+    parser.add_argument("--no-channels-last", action="store_true")
+    parser.add_argument("--quantize", action="store_true")
+    parser.add_argument("--warmup-runs", type=int, default=DETECTOR_WARMUP_RUNS)
+    parser.add_argument("--cache-dir", default=DETECTOR_CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--profiles", nargs="+", default=["baseline", "cpu"], choices=["baseline", "cpu"])
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument("--child", dest="profile", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if not TORCH_OK:
+        raise SystemExit("torch is not installed")
+    if args.profile:
+        return bench_child(args)
+
+    results = {}
+    for profile in args.profiles:
+        results[profile] = run_profile(args, profile)
+        print(f"{profile}: done")
+    report(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
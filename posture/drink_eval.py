@@ -0,0 +1,256 @@
+"""
+Drink-detection config sweep over a labeled clip set: drink-event
+precision/recall and detector cost per frame, plus the Pareto frontier.
+
+    python -m posture.drink_eval --labels clips/labels.json
+    python -m posture.drink_eval --labels clips/labels.json --models yolov5n yolov5s \\
+        --sizes 320 416 640 --min-precision 0.9 --min-recall 0.8 --out sweep.json
+
+labels.json (clip paths are relative to the file):
+
+    {"clips": [{"path": "drink_01.mp4", "drinks": [[3.2, 5.0], [40.1, 42.5]]},
+               {"path": "no_drink_01.mp4", "drinks": []}]}
+
+Each clip is decoded once; pose runs once per frame and every detector
+variant (model x input size x ROI padding) runs once per frame. Thresholds
+that do not change the detector output (YOLO_CONF, DRINK_MIN_FRAMES) are
+swept by replaying the cached boxes through the same heuristics the live
+loop uses (choose_drink_box / update_drink_state).
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+import cv2
+
+try:
+    from posture.model import PosturePomodoroModel
+except ImportError:
+    from model import PosturePomodoroModel
+
+DEFAULT_MODELS = ["yolov5n", "yolov5s", "yolov5m"]
+DEFAULT_SIZES = [320, 416, 640, 896]
+DEFAULT_ROIS = ["off", "1.2x0.8", "1.6x1.1", "2.0x1.4"]   # pad_scale x up_pad, "off" = full frame only
+DEFAULT_CONFS = [0.20, 0.30, 0.40]
+DEFAULT_MIN_FRAMES = [1, 2, 3, 5]
+MATCH_TOLERANCE_SEC = 1.0
+
+
+class Frame:
+    __slots__ = ("t", "landmarks", "boxes", "cost")
+
+    def __init__(self, t, landmarks):
+        self.t = t
+        self.landmarks = landmarks
+        self.boxes = {}     # variant -> [(x1, y1, x2, y2, name, conf)]
+        self.cost = {}      # variant -> detector seconds
+
+
+def parse_roi(roi):
+    if roi == "off":
+        return None
+    pad_scale, up_pad = roi.split("x")
+    return float(pad_scale), float(up_pad)
+
+
+def load_labels(path):
+    with open(path) as f:
+        data = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    return [{"path": os.path.join(base, c["path"]), "drinks": [tuple(d) for d in c.get("drinks", [])]}
+            for c in data["clips"]]
+
+
+def process_clip(model, detectors, clip, variants, fps):
+    """Decode a clip and cache pose + every detector variant's boxes per frame."""
+    cap = cv2.VideoCapture(clip["path"])
+    native_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    step = max(1, int(round(native_fps / fps))) if fps else 1
+    frames = []
+    index = 0
+    size = None
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        if index % step:
+            index += 1
+            continue
+        t = index / native_fps
+        index += 1
+        frame = cv2.flip(frame, 1)     # same orientation as the live loop
+        H, W = frame.shape[:2]
+        size = (W, H)
+        results = model.pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        landmarks = results.pose_landmarks.landmark if results.pose_landmarks is not None else None
+        entry = Frame(t, landmarks)
+        full = {}   # the full-frame pass does not depend on ROI padding: run it once per (model, size)
+        for variant in variants:
+            name, img_size, roi = variant
+            model.yolo_model = detectors[name]
+            model.config["YOLO_IMG_SIZE"] = img_size
+            if (name, img_size) not in full:
+                started = time.perf_counter()
+                boxes, _ = model.detect_drink_containers(frame, None, W, H)
+                full[(name, img_size)] = (boxes, time.perf_counter() - started)
+            full_boxes, full_cost = full[(name, img_size)]
+            pad = parse_roi(roi)
+            roi_boxes, roi_cost = [], 0.0
+            if pad is not None and landmarks is not None:
+                model.config["ROI_PAD_SCALE"], model.config["ROI_UP_PAD"] = pad
+                started = time.perf_counter()
+                _, roi_boxes = model.detect_drink_containers(frame, landmarks, W, H, full_frame=False)
+                roi_cost = time.perf_counter() - started
+            entry.cost[variant] = full_cost + roi_cost
+            entry.boxes[variant] = full_boxes + roi_boxes
+        frames.append(entry)
+    cap.release()
+    return frames, size
+
+
+def replay(model, frames, size, variant, conf, min_frames):
+    """Run the live drink heuristics over cached detections; returns event times (clip seconds)."""
+    W, H = size
+    model.config["DRINK_MIN_FRAMES"] = min_frames
+    model.drink_consec = 0
+    model.last_drink_ts = float("-inf")
+    events = []
+    for frame in frames:
+        pose_ok = frame.landmarks is not None
+        chosen = None
+        if pose_ok:
+            boxes = [b for b in frame.boxes[variant] if b[5] >= conf]
+            chosen = model.choose_drink_box(frame.landmarks, boxes, W, H)
+        if model.update_drink_state(chosen, pose_ok, frame.t):
+            model.last_drink_ts = frame.t
+            events.append(frame.t)
+    return events
+
+
+def match_events(events, drinks, tolerance=MATCH_TOLERANCE_SEC):
+    """Each labeled drink matches at most one event; extra events (double counts) are false positives."""
+    matched = [None] * len(drinks)
+    false_positives = 0
+    for t in events:
+        for i, (start, end) in enumerate(drinks):
+            if matched[i] is None and start - tolerance <= t <= end + tolerance:
+                matched[i] = t
+                break
+        else:
+            false_positives += 1
+    delays = [max(0.0, t - drinks[i][0]) for i, t in enumerate(matched) if t is not None]
+    return sum(m is not None for m in matched), false_positives, delays
+
+
+def pareto_front(rows):
+    """Rows not dominated on (lower ms_per_frame, higher f1)."""
+    front = []
+    for r in sorted(rows, key=lambda r: (r["ms_per_frame"], -r["f1"])):
+        if not front or r["f1"] > front[-1]["f1"]:
+            front.append(r)
+    return front
+
+
+def sweep(args):
+    clips = load_labels(args.labels)
+    model = PosturePomodoroModel(config={"YOLO_ENABLED": False})
+    model.config["YOLO_ENABLED"] = True
+    # Detect once at the lowest confidence; higher thresholds are applied while replaying
+    model.config["YOLO_CONF"] = min(args.confs)
+    detectors = {}
+    for name in args.models:
+        model.config["YOLO_MODEL_NAME"] = name
+        detectors[name] = model.load_yolov5()
+        print(f"Loaded {name}")
+
+    variants = list(itertools.product(args.models, args.sizes, args.rois))
+    processed = []
+    for clip in clips:
+        started = time.perf_counter()
+        frames, size = process_clip(model, detectors, clip, variants, args.fps)
+        processed.append((clip, frames, size))
+        print(f"{os.path.basename(clip['path'])}: {len(frames)} frames, {len(clip['drinks'])} drinks "
+              f"({time.perf_counter() - started:.1f}s)")
+
+    total_drinks = sum(len(c["drinks"]) for c in clips)
+    rows = []
+    for variant in variants:
+        cost = [f.cost[variant] for _, frames, _ in processed for f in frames]
+        ms_per_frame = 1000.0 * sum(cost) / max(1, len(cost))
+        for conf, min_frames in itertools.product(args.confs, args.min_frames):
+            tp = fp = 0
+            delays = []
+            for clip, frames, size in processed:
+                if size is None:
+                    continue
+                events = replay(model, frames, size, variant, conf, min_frames)
+                hits, false_pos, clip_delays = match_events(events, clip["drinks"], args.tolerance)
+                tp += hits
+                fp += false_pos
+                delays += clip_delays
+            precision = tp / (tp + fp) if tp + fp else 1.0
+            recall = tp / total_drinks if total_drinks else 1.0
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+            rows.append({
+                "model": variant[0], "img_size": variant[1], "roi": variant[2], "conf": conf,
+                "min_frames": min_frames, "precision": precision, "recall": recall, "f1": f1,
+                "ms_per_frame": ms_per_frame,
+                "median_delay_sec": sorted(delays)[len(delays) // 2] if delays else None,
+            })
+    return rows
+
+
+def report(rows, args):
+    front = pareto_front(rows)
+    front_ids = {id(r) for r in front}
+    print(f"\n{'model':<9} {'size':>5} {'roi':>8} {'conf':>5} {'minF':>5} {'prec':>6} {'recall':>7} {'f1':>6} "
+          f"{'ms/frame':>9} {'delay(s)':>9}")
+    for r in sorted(rows, key=lambda r: (r["ms_per_frame"], -r["f1"])):
+        if args.frontier_only and id(r) not in front_ids:
+            continue
+        delay = f"{r['median_delay_sec']:.2f}" if r["median_delay_sec"] is not None else "-"
+        mark = "*" if id(r) in front_ids else " "
+        print(f"{r['model']:<9} {r['img_size']:>5} {r['roi']:>8} {r['conf']:>5.2f} {r['min_frames']:>5} "
+              f"{r['precision']:>6.2f} {r['recall']:>7.2f} {r['f1']:>6.2f} {r['ms_per_frame']:>9.1f} {delay:>9} {mark}")
+    print("* = Pareto frontier (cost vs F1)")
+
+    passing = [r for r in rows if r["precision"] >= args.min_precision and r["recall"] >= args.min_recall]
+    best = min(passing, key=lambda r: (r["ms_per_frame"], -r["f1"])) if passing else None
+    if best:
+        print(f"\nCheapest config meeting precision>={args.min_precision} recall>={args.min_recall}: "
+              f"YOLO_MODEL_NAME={best['model']!r} YOLO_IMG_SIZE={best['img_size']} ROI={best['roi']} "
+              f"YOLO_CONF={best['conf']} DRINK_MIN_FRAMES={best['min_frames']} ({best['ms_per_frame']:.1f} ms/frame)")
+    else:
+        print(f"\nNo config meets precision>={args.min_precision} recall>={args.min_recall}.")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"rows": rows, "frontier": front, "recommended": best}, f, indent=2)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drink-detection accuracy vs latency sweep over labeled clips")
+    parser.add_argument("--labels", required=True, help="labels.json describing the clip set")
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS)
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--rois", nargs="+", default=DEFAULT_ROIS, help='"off" or PAD_SCALExUP_PAD, e.g. 1.6x1.1')
+    parser.add_argument("--confs", nargs="+", type=float, default=DEFAULT_CONFS)
+    parser.add_argument("--min-frames", nargs="+", type=int, default=DEFAULT_MIN_FRAMES)
+    parser.add_argument("--fps", type=float, default=None, help="resample clips to the live loop rate")
+    parser.add_argument("--tolerance", type=float, default=MATCH_TOLERANCE_SEC,
+                        help="seconds an event may fall outside a labeled drink and still match")
+    parser.add_argument("--min-precision", type=float, default=0.9)
+    parser.add_argument("--min-recall", type=float, default=0.8)
+    parser.add_argument("--frontier-only", action="store_true")
+    parser.add_argument("--out", help="write all rows, the frontier and the recommendation as JSON")
+    args = parser.parse_args(argv)
+    report(sweep(args), args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
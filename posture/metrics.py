@@ -0,0 +1,254 @@
+import bisect
+import os
+import threading
+import time
+
+try:
+    import psutil
+    PSUTIL_OK = True
+except Exception:
+    PSUTIL_OK = False
+
+# Latency buckets in seconds (1 ms .. 10 s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Metric:
+    """
+    Base for counters/histograms. Each thread writes into its own shard
+    (found through threading.local), so recording takes no lock; the shards
+    are only summed when /metrics is scraped.
+    """
+
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()   # only taken when a new thread writes for the first time
+        self._children = {}
+        self._function = None
+        registry.register(self)
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def labels(self, *values):
+        """Bound child for one label combination; cache it at the call site in hot paths."""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._child_class(self, tuple(str(v) for v in values)))
+        return child
+
+    def set_function(self, fn):
+        """Read the value(s) from fn() at scrape time instead: a number, or {label_values: number}."""
+        self._function = fn
+        return self
+
+    def _label_str(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    def _function_samples(self):
+        value = self._function()
+        if value is None:
+            return {}
+        if isinstance(value, dict):
+            return {tuple(str(v) for v in (k if isinstance(k, tuple) else (k,))): v for k, v in value.items()}
+        return {(): value}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("_metric", "_key")
+
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount=1):
+        shard = self._metric._shard()
+        shard[self._key] = shard.get(self._key, 0) + amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+    _child_class = _CounterChild
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_samples(self):
+        if self._function is not None:
+            totals = self._function_samples()
+        else:
+            totals = {}
+            for shard in list(self._shards):
+                for key, value in list(shard.items()):
+                    totals[key] = totals.get(key, 0) + value
+        return [f"{self.name}{self._label_str(key)} {value}" for key, value in sorted(totals.items())]
+
+
+class _HistogramChild:
+    __slots__ = ("_metric", "_key")
+
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def observe(self, value):
+        shard = self._metric._shard()
+        data = shard.get(self._key)
+        if data is None:
+            # [bucket counts..., +Inf count, sum]
+            data = shard[self._key] = [0] * (len(self._metric.buckets) + 1) + [0.0]
+        data[bisect.bisect_left(self._metric.buckets, value)] += 1
+        data[-1] += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    _child_class = _HistogramChild
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(registry, name, documentation, labelnames)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_samples(self):
+        totals = {}
+        for shard in list(self._shards):
+            for key, data in list(shard.items()):
+                total = totals.setdefault(key, [0] * len(data))
+                for i, v in enumerate(data):
+                    total[i] += v
+        lines = []
+        for key, data in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), data[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._label_str(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_str(key)} {data[-1]}")
+            lines.append(f"{self.name}_count{self._label_str(key)} {cumulative}")
+        return lines
+
+
+class _GaugeChild:
+    __slots__ = ("_metric", "_key")
+
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def set(self, value):
+        # A single dict store; last writer wins, which is what a gauge means
+        self._metric._values[self._key] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    _child_class = _GaugeChild
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self._values = {}
+        super().__init__(registry, name, documentation, labelnames)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def _render_samples(self):
+        values = self._function_samples() if self._function is not None else dict(self._values)
+        return [f"{self.name}{self._label_str(key)} {float(value)}" for key, value in sorted(values.items())]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+REGISTRY = Registry()
+
+
+def process_rss_bytes():
+    if PSUTIL_OK:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# --- Model loop ---
+STAGE_LATENCY = Histogram(REGISTRY, "posture_stage_latency_seconds", "Per-frame latency of each model loop stage",
+                          ["stage"])
+FRAMES = Counter(REGISTRY, "posture_frames_total", "Frames processed by the model loop")
+DROPPED_FRAMES = Counter(REGISTRY, "posture_dropped_frames_total", "Camera reads that returned no frame")
+DETECTOR_CALLS = Counter(REGISTRY, "posture_detector_calls_total", "YOLO detector invocations", ["kind"])
+DRINK_EVENTS = Counter(REGISTRY, "posture_drink_events_total", "Detected drink events")
+FPS = Gauge(REGISTRY, "posture_fps", "Model loop frames per second (exponential moving average)")
+CALIBRATED = Gauge(REGISTRY, "posture_calibrated", "1 when posture thresholds are calibrated")
+MODE = Gauge(REGISTRY, "posture_mode", "1 for the current focus/break/absent mode", ["mode"])
+MODE_TRANSITIONS = Counter(REGISTRY, "posture_mode_transitions_total", "Focus/break/absent transitions",
+                           ["from_mode", "to_mode"])
+PRESENCE_GATE_CHECKS = Counter(REGISTRY, "posture_presence_gate_checks_total",
+                               "Presence gate decisions while absent (skip = pose not run)", ["decision"])
+PRESENCE_GATE_POSE_RESULTS = Counter(REGISTRY, "posture_presence_gate_pose_results_total",
+                                     "Pose results after the gate woke up, by trigger and whether a person was found",
+                                     ["decision", "person"])
+TIMER_FIRED = Counter(REGISTRY, "posture_timers_fired_total", "Reminder/cooldown timers that fired", ["timer"])
+TIMER_LATENESS = Histogram(REGISTRY, "posture_timer_lateness_seconds", "Delay between a timer's deadline and its firing",
+                           buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5))
+
+# --- API ---
+ENDPOINT_LATENCY = Histogram(REGISTRY, "api_request_latency_seconds", "HTTP request latency by route",
+                             ["method", "route", "status"])
+CALENDAR_API_CALLS = Counter(REGISTRY, "calendar_api_calls_total", "Google Calendar API requests", ["method"])
+
+# --- Process ---
+RSS = Gauge(REGISTRY, "process_resident_memory_bytes", "Resident memory size in bytes").set_function(process_rss_bytes)
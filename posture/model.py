@@ -2,60 +2,109 @@ import cv2
 import mediapipe as mp
 import numpy as np
 import time
+import threading
 from playsound import playsound
 import os
 import math
 from collections import deque
 try:
-    import torch
-    TORCH_OK = True
-except Exception:
-    TORCH_OK = False
-
+    from posture.preview import PreviewStream, PREVIEW_FPS, PREVIEW_MAX_WIDTH, PREVIEW_JPEG_QUALITY
+    from posture import metrics
+    from posture.profiling import PROFILER
+    from posture.presence import PresenceGate, PRESENCE_GATE_HZ, PRESENCE_MOTION_RATIO, PRESENCE_RECHECK_SEC
+    from posture.timers import TimerService, TIMER_STATE_FILE
+    from posture import detector
+except ImportError:
+    from preview import PreviewStream, PREVIEW_FPS, PREVIEW_MAX_WIDTH, PREVIEW_JPEG_QUALITY
+    import metrics
+    from profiling import PROFILER
+    from presence import PresenceGate, PRESENCE_GATE_HZ, PRESENCE_MOTION_RATIO, PRESENCE_RECHECK_SEC
+    from timers import TimerService, TIMER_STATE_FILE
+    import detector
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 
+# Metric children bound once, so the hot loop only does a per-thread dict update
+STAGE_READ = metrics.STAGE_LATENCY.labels("read")
+STAGE_CONVERT = metrics.STAGE_LATENCY.labels("convert")
+STAGE_PRESENCE = metrics.STAGE_LATENCY.labels("presence")
+STAGE_POSE = metrics.STAGE_LATENCY.labels("pose")
+STAGE_YOLO_FULL = metrics.STAGE_LATENCY.labels("yolo_full")
+STAGE_YOLO_ROI = metrics.STAGE_LATENCY.labels("yolo_roi")
+STAGE_POSTPROCESS = metrics.STAGE_LATENCY.labels("postprocess")
+DETECTOR_FULL = metrics.DETECTOR_CALLS.labels("full")
+DETECTOR_ROI = metrics.DETECTOR_CALLS.labels("roi")
+FRAMES = metrics.FRAMES.labels()
+DROPPED_FRAMES = metrics.DROPPED_FRAMES.labels()
+DRINK_EVENTS = metrics.DRINK_EVENTS.labels()
+MODE_TRANSITIONS = metrics.MODE_TRANSITIONS
+
+
+DEFAULT_CONFIG = {
+    # Config
+    "POMODORO_MINUTES": 25,       # Focus duration before break
+    "BREAK_MINUTES": 5,           # Break duration
+    "MOVEMENT_WINDOW_SEC": 3.0,   # Window to estimate motion (seconds)
+    "STILL_SPEED_THRESH": 15.0,   # px/sec; below this = "still"
+    "STANDUP_MOVE_THRESH": 100.0, # px displacement that counts as "stood/moved"
+    "ABSENCE_RESET_SEC": 3.0,     # If away > this, reset focus timer
+    "SOUND_FILE": "alert.mp3",    # sound file to play if exists
+    "REQUIRE_CONTINUOUS_SIT": True,  # focus timer resets on large movement/absence
+    "POSE_HZ_BY_MODE": {"focus": None, "break": 2.0, "absent": 1.0},  # pose rate per mode, None = every frame
+    "PRESENCE_GATE_ENABLED": True,              # while absent, only run pose on motion or a periodic recheck
+    "PRESENCE_GATE_HZ": PRESENCE_GATE_HZ,       # motion checks per second while absent
+    "PRESENCE_MOTION_RATIO": PRESENCE_MOTION_RATIO,
+    "PRESENCE_RECHECK_SEC": PRESENCE_RECHECK_SEC,
+
+    # --- Hydration reminder (new) ---
+    "HYDRATE_EVERY_MINUTES": 45,          # remind to drink every N minutes
+    "HYDRATE_ALERT_COOLDOWN": 300,        # seconds between hydration alert beeps
+    "TIMER_STATE_FILE": TIMER_STATE_FILE,   # persisted reminder deadlines (None = don't persist)
+    "BABY_BLUE_BGR": (240, 207, 137),     # Baby blue (#89CFF0) in OpenCV's BGR
+
+    # Visual preferences
+    "SHOW_POSE_IN_BREAK": False,      # <<< Hide skeleton/angles in break mode (still detect)
+    "DIM_BACKGROUND_ON_BREAK": True,  # Dim screen behind the break banner
+    "PREVIEW_FPS": PREVIEW_FPS,                 # preview stream frame rate cap (only while subscribed)
+    "PREVIEW_MAX_WIDTH": PREVIEW_MAX_WIDTH,     # preview frames are downscaled to this width
+    "PREVIEW_JPEG_QUALITY": PREVIEW_JPEG_QUALITY,
+    "PROFILE_ENABLED": False,                   # per-frame trace + stack sampling (also toggled via API)
+
+    "YOLO_ENABLED": detector.TORCH_OK,         # auto-disabled if torch missing
+    "YOLO_MODEL_NAME": 'yolov5m',               # stronger than 's' (better recall)
+    "YOLO_CONF": 0.20,                          # more sensitive
+    "YOLO_IOU": 0.45,
+    "YOLO_IMG_SIZE": 896,                       # better for small bottles (must be multiple of 32)
+    "YOLO_CLASSES": ['bottle', 'cup'],          # classes considered as drink containers
+    "YOLO_INTERVAL_SEC": 1.0,                   # run YOLO roughly every 3 seconds
+    "YOLO_IN_FOCUS_ONLY": True,                 # skip YOLO during break (never runs while absent)
+    "DRAW_YOLO_BOX": True,                       # show the detected container box
+    # CPU loading profile (see posture/detector.py; ignored on CUDA)
+    "YOLO_CPU_PROFILE": True,                   # size torch threads, prepare + cache the model, warm up
+    "YOLO_THREADS": None,                       # torch intra-op threads, None = cores minus POSE_RESERVED_THREADS
+    "POSE_RESERVED_THREADS": detector.POSE_RESERVED_THREADS,  # cores left to MediaPipe / camera / API
+    "YOLO_CHANNELS_LAST": True,                 # NHWC conv weights
+    "YOLO_QUANTIZE": False,                     # dynamic int8 (Linear layers only; plain YOLOv5 has none)
+    "YOLO_FIXED_ROI_SHAPE": True,               # pad the head ROI to a square: one detector input shape
+    "YOLO_WARMUP_RUNS": detector.DETECTOR_WARMUP_RUNS,
+    "YOLO_WARMUP_FRAME_SHAPE": (480, 640),      # expected camera (H, W); the real one is warmed when the camera opens
+    "YOLO_CACHE_DIR": detector.DETECTOR_CACHE_DIR,  # prepared model cache (None = always load from torch hub)
+
+    # Proximity heuristic: bottle/cup near the mouth
+    "ROI_PAD_SCALE": 1.6,                       # head ROI width factor (see head_roi_from_pose)
+    "ROI_UP_PAD": 1.1,                          # head ROI padding above the ears
+    "DRINK_DIST_SCALE": 0.60,                   # threshold = scale * face_width_px
+    "DRINK_MIN_FRAMES": 3,                      # need this many consecutive frames near mouth
+    "DRINK_COOLDOWN_SEC": 3,                   # min seconds between drink events
+    "HYDRATION_BANNER_SEC": 2.5,                 # banner duration after detection
+}
+
 
 class PosturePomodoroModel:
     def __init__(self, config=None):
         print("Model initialized")
-        self.config = config or {
-            # Config
-            "POMODORO_MINUTES": 0.5,      # Focus duration before break
-            "BREAK_MINUTES": 5,           # Break duration
-            "MOVEMENT_WINDOW_SEC": 3.0,   # Window to estimate motion (seconds)
-            "STILL_SPEED_THRESH": 15.0,   # px/sec; below this = "still"
-            "STANDUP_MOVE_THRESH": 100.0, # px displacement that counts as "stood/moved"
-            "ABSENCE_RESET_SEC": 3.0,     # If away > this, reset focus timer
-            "POSTURE_ALERT_COOLDOWN": 5,  # seconds for posture alert sound
-            "SOUND_FILE": "alert.mp3",    # sound file to play if exists
-            "REQUIRE_CONTINUOUS_SIT": True,  # focus timer resets on large movement/absence
-
-            # --- Hydration reminder (new) ---
-            "HYDRATE_EVERY_MINUTES": 0.25,          # remind to drink every N minutes
-            "HYDRATE_ALERT_COOLDOWN": 30,         # seconds between hydration alert beeps
-            "BABY_BLUE_BGR": (240, 207, 137),     # Baby blue (#89CFF0) in OpenCV's BGR
-
-            # Visual preferences
-            "SHOW_POSE_IN_BREAK": False,      # <<< Hide skeleton/angles in break mode (still detect)
-            "DIM_BACKGROUND_ON_BREAK": True,  # Dim screen behind the break banner
-
-            "YOLO_ENABLED": TORCH_OK,                  # auto-disabled if torch missing
-            "YOLO_MODEL_NAME": 'yolov5m',               # stronger than 's' (better recall)
-            "YOLO_CONF": 0.20,                          # more sensitive
-            "YOLO_IOU": 0.45,
-            "YOLO_IMG_SIZE": 896,                       # better for small bottles (must be multiple of 32)
-            "YOLO_CLASSES": ['bottle', 'cup'],          # classes considered as drink containers
-            "YOLO_INTERVAL_SEC": 1.0,                   # run YOLO roughly every 3 seconds
-            "YOLO_IN_FOCUS_ONLY": False,                # set True to skip YOLO during break
-            "DRAW_YOLO_BOX": True,                       # show the detected container box
-
-            # Proximity heuristic: bottle/cup near the mouth
-            "DRINK_DIST_SCALE": 0.60,                   # threshold = scale * face_width_px
-            "DRINK_MIN_FRAMES": 3,                      # need this many consecutive frames near mouth
-            "DRINK_COOLDOWN_SEC": 3,                   # min seconds between drink events
-            "HYDRATION_BANNER_SEC": 2.5                  # banner duration after detection
-        }
+        # Missing keys fall back to DEFAULT_CONFIG
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
 
         # MediaPipe
         self.mp_pose = mp.solutions.pose
@@ -70,20 +119,24 @@ class PosturePomodoroModel:
         self.calibration_shoulder_angles, self.calibration_neck_angles = [], []
         self.shoulder_threshold = None
         self.neck_threshold = None
-        self.last_posture_alert_time = 0
 
         self.pomodoro_seconds = self.config["POMODORO_MINUTES"] * 60
         self.break_seconds = self.config["BREAK_MINUTES"] * 60
         self.hydrate_seconds = self.config["HYDRATE_EVERY_MINUTES"] * 60  # (new)
 
-        self.mode = "focus"               # "focus" or "break"
-        self.sit_timer_start = None       # focus start time
-        self.break_timer_start = None     # break start time
+        # Reminders and cooldowns: pomodoro ("focus_end", "break_end"), "hydrate"
+        # and "drink_banner" all live in the timer service
+        self.timers = TimerService(self.config["TIMER_STATE_FILE"])
+
+        self.mode = "absent"              # "focus", "break" or "absent" (see update_mode)
+        self.mode_since = time.time()
         self.last_seen_time = None
+        self.last_pose_time = None
+        self.mode_seq = 0
+        self.mode_events = deque(maxlen=100)
+        self.mode_listeners = []
 
-        # Hydration timers (new)
-        self.hydrate_timer_start = time.time()
-        self.last_hydrate_alert_time = 0
+        self.hydrate_reminder = False     # set by the "hydrate" timer, cleared by a drink
 
         self.centroid_history = deque()   # (t, (x,y))
         self.last_centroid_for_standup = None
@@ -91,15 +144,41 @@ class PosturePomodoroModel:
         self.posture_status = None
         self.do_posture_test = False
         self.do_drinking_test = False
-        self.last_drink_time = time.localtime(time.time())
+        self.last_drink_ts = time.time()
 
+        self.detector_info = {}
         self.yolo_model = self.load_yolov5()
         # YOLO drinking detection state
         self.last_yolo_time = 0.0
         self.last_yolo_det = []           # cached boxes between runs
         self.drink_consec = 0
-        self.drink_banner_until = 0
+        self.drink_banner = False         # cleared by the "drink_banner" timer
         self.hydration_count = 0          # number of detected drinks
+        self.bottle_boxes = []
+        self.chosen_box = None
+
+        # Latest pose keypoints/angles, kept for the preview overlay
+        self.keypoints = None
+        self.angles = None
+        self.pose_ok = False
+        self.fps = 0.0
+        self.last_frame_time = None
+        metrics.FPS.set_function(lambda: self.fps)
+        metrics.CALIBRATED.set_function(lambda: int(self.is_calibrated))
+        metrics.MODE.set_function(lambda: {m: int(m == self.mode) for m in ("focus", "break", "absent")})
+
+        # Motion gate in front of pose inference while nobody is at the desk
+        self.presence = None
+        if self.config["PRESENCE_GATE_ENABLED"]:
+            self.presence = PresenceGate(hz=self.config["PRESENCE_GATE_HZ"],
+                                         motion_ratio=self.config["PRESENCE_MOTION_RATIO"],
+                                         recheck_sec=self.config["PRESENCE_RECHECK_SEC"])
+
+        # Annotated preview, encoded in its own thread only while a client is connected
+        self.preview = PreviewStream(self.draw_preview,
+                                     fps=self.config["PREVIEW_FPS"],
+                                     max_width=self.config["PREVIEW_MAX_WIDTH"],
+                                     jpeg_quality=self.config["PREVIEW_JPEG_QUALITY"])
 
     def calculate_angle(self, a, b, c):
         a = np.array(a, dtype=np.float32)
@@ -116,7 +195,8 @@ class PosturePomodoroModel:
         cv2.line(image, a, b, color, 2)
         cv2.line(image, b, c, color, 2)
         cv2.circle(image, b, 5, color, -1)
-        cv2.putText(image, f"{int(angle)}°", (b[0]+6, b[1]-6), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+        # Hershey fonts have no degree sign
+        self.preview.overlays.put_text(image, f"{int(angle)} deg", (b[0]+6, b[1]-6), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
 
     def play_beep(self):
         if os.path.exists(self.config["SOUND_FILE"]):
@@ -125,19 +205,83 @@ class PosturePomodoroModel:
             except Exception:
                 pass
 
+    def beep_async(self):
+        # playsound blocks for the length of the sound; keep it off the model and timer threads
+        threading.Thread(target=self.play_beep, name="beep", daemon=True).start()
+
+    @property
+    def last_drink_time(self):
+        return time.localtime(self.last_drink_ts)
+
+    # --- Timer callbacks (run on the timer thread) ---
+    def on_hydrate_due(self):
+        self.hydrate_reminder = True
+        print("Hydration: time to drink some water!")
+        self.beep_async()
+        # Keep reminding until a drink is detected
+        self.timers.schedule("hydrate", self.config["HYDRATE_ALERT_COOLDOWN"], self.on_hydrate_due, persist=True)
+
+    def clear_drink_banner(self):
+        self.drink_banner = False
+
     def format_mmss(self, seconds):
         seconds = max(0, int(seconds))
         return f"{seconds//60:02d}:{seconds%60:02d}"
 
     def draw_centered_text(self, img, text, y, font, scale, color, thickness):
-        (tw, th), _ = cv2.getTextSize(text, font, scale, thickness)
+        tw, th = self.preview.overlays.text_size(text, font, scale, thickness)
         x = (img.shape[1] - tw) // 2
-        cv2.putText(img, text, (x, y), font, scale, color, thickness, cv2.LINE_AA)
+        self.preview.overlays.put_text(img, text, (x, y), font, scale, color, thickness)
 
     def draw_dim_overlay(self, img, alpha=0.35):
-        overlay = img.copy()
-        cv2.rectangle(overlay, (0, 0), (img.shape[1], img.shape[0]), (0, 0, 0), -1)
-        cv2.addWeighted(overlay, alpha, img, 1 - alpha, 0, img)
+        self.preview.overlays.dim(img, alpha)
+
+    def preview_state(self, now):
+        """Small snapshot of what the preview draws; taken only when a frame is offered."""
+        return {
+            "keypoints": self.keypoints if self.pose_ok else None,
+            "angles": self.angles,
+            "posture": self.posture_status,
+            "calibrated": self.is_calibrated,
+            "mode": self.mode,
+            "boxes": list(self.bottle_boxes) if self.do_drinking_test else [],
+            "chosen_box": self.chosen_box if self.do_drinking_test else None,
+            "drink_banner": self.drink_banner,
+        }
+
+    def draw_preview(self, img, state, scale):
+        """Render overlays onto a (downscaled) preview frame. Runs in the preview encoder thread."""
+        def pt(p):
+            return (int(p[0] * scale), int(p[1] * scale))
+
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        in_break = state["mode"] == "break"
+        if in_break and self.config["DIM_BACKGROUND_ON_BREAK"]:
+            self.draw_dim_overlay(img)
+
+        if state["keypoints"] and state["angles"] and (not in_break or self.config["SHOW_POSE_IN_BREAK"]):
+            kp = state["keypoints"]
+            shoulder_angle, neck_angle = state["angles"]
+            color = (0, 0, 255) if state["posture"] == "Poor Posture" else (0, 255, 0)
+            l_sh, r_sh, l_ear = pt(kp["l_sh"]), pt(kp["r_sh"]), pt(kp["l_ear"])
+            self.draw_angle(img, l_sh, r_sh, (r_sh[0], 0), shoulder_angle, color)
+            self.draw_angle(img, l_ear, l_sh, (l_sh[0], 0), neck_angle, color)
+
+        if self.config["DRAW_YOLO_BOX"]:
+            for (x1, y1, x2, y2, name, conf) in state["boxes"]:
+                chosen = state["chosen_box"] is not None and state["chosen_box"][:4] == (x1, y1, x2, y2)
+                color = self.config["BABY_BLUE_BGR"] if chosen else (200, 200, 200)
+                cv2.rectangle(img, pt((x1, y1)), pt((x2, y2)), color, 2)
+                self.preview.overlays.put_text(img, name, pt((x1, y1 - 4)), font, 0.5, color, 1)
+
+        status = state["posture"] if state["calibrated"] else "Calibrating..."
+        if status:
+            self.preview.overlays.put_text(img, status, (10, 25), font, 0.7, (255, 255, 255), 2)
+        if in_break:
+            self.draw_centered_text(img, "BREAK", img.shape[0] // 2, font, 1.4, (255, 255, 255), 3)
+        if state["drink_banner"]:
+            self.draw_centered_text(img, "Hydration +1", img.shape[0] - 30, font, 1.0,
+                                    self.config["BABY_BLUE_BGR"], 2)
 
     def add_centroid(self, xy, now):
         self.centroid_history.append((now, xy))
@@ -197,27 +341,36 @@ class PosturePomodoroModel:
         if not self.config["YOLO_ENABLED"]:
             # print("YOLO is not enabled !!!!!!!!!!!!!!!!!.")
             return None
-        # else:
-            # print("YOLO is enabled ++++++++++++++++++++.")
-        try:
-            # Torch hub online
-            model = torch.hub.load('ultralytics/yolov5', self.config["YOLO_MODEL_NAME"], pretrained=True)
-            # print("YOLO model loaded successfully.")
-        except Exception:
-            # Local fallback: clone repo to ./yolov5 and place yolov5m.pt in working directory
-            model = torch.hub.load('yolov5', 'custom', path=f'{self.config["YOLO_MODEL_NAME"]}.pt', source='local')
-        model.conf = self.config["YOLO_CONF"]
-        model.iou  = self.config["YOLO_IOU"]
-        if torch.cuda.is_available():
-            model.to('cuda')
+        cfg = self.config
+        model, self.detector_info = detector.load_detector(
+            cfg["YOLO_MODEL_NAME"], cfg["YOLO_IMG_SIZE"], cpu=cfg["YOLO_CPU_PROFILE"],
+            threads=cfg["YOLO_THREADS"], reserved=cfg["POSE_RESERVED_THREADS"],
+            channels_last=cfg["YOLO_CHANNELS_LAST"], quantize=cfg["YOLO_QUANTIZE"],
+            warmup_runs=cfg["YOLO_WARMUP_RUNS"], warmup_shapes=[cfg["YOLO_WARMUP_FRAME_SHAPE"]],
+            cache_dir=cfg["YOLO_CACHE_DIR"])
+        print(detector.describe(self.detector_info))
+        model.conf = cfg["YOLO_CONF"]
+        model.iou  = cfg["YOLO_IOU"]
         return model
-    
+
+    def warmup_detector(self, frame_shape):
+        """
+        Warm the detector for the camera's real frame shape (no-op if already warm or not on the CPU profile).
+        Called from the run loop so it never overlaps with inference on the same model.
+        """
+        warm = self.detector_info.get("warm_shapes")
+        if self.yolo_model is None or warm is None or min(frame_shape) <= 0 or tuple(frame_shape) in warm:
+            return
+        t0 = time.perf_counter()
+        detector.warmup(self.yolo_model, [frame_shape], self.config["YOLO_IMG_SIZE"],
+                        runs=self.config["YOLO_WARMUP_RUNS"], done=warm)
+        print(f"Detector warmed up for {frame_shape[1]}x{frame_shape[0]} frames ({time.perf_counter() - t0:.1f}s)")
+
     def run_yolo_on_image(self, model, img_bgr, size):
         """Return [(x1,y1,x2,y2,name,conf), ...]"""
         if model is None:
             return []
-        with torch.no_grad():
-            res = model(img_bgr, size=size)
+        res = detector.infer(model, img_bgr, size)
         boxes = []
         try:
             df = res.pandas().xyxy[0]
@@ -240,67 +393,198 @@ class PosturePomodoroModel:
     def get_posture_status(self):
         return self.posture_status
     
-    def drinking_water_test(self):
-        # Ensure YOLO is run frequently
-        self.full_boxes = self.run_yolo_on_image(self.yolo_model, self.frame, self.config["YOLO_IMG_SIZE"])
-        self.roi_boxes_global = []
-
-        if self.pose_ok:
-            lm = self.results.pose_landmarks.landmark
-            l_sh = (int(lm[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value].x * self.W),
-                    int(lm[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value].y * self.H))
-            r_sh = (int(lm[self.mp_pose.PoseLandmark.RIGHT_SHOULDER.value].x * self.W),
-                    int(lm[self.mp_pose.PoseLandmark.RIGHT_SHOULDER.value].y * self.H))
-            l_ear = (int(lm[self.mp_pose.PoseLandmark.LEFT_EAR.value].x * self.W),
-                    int(lm[self.mp_pose.PoseLandmark.LEFT_EAR.value].y * self.H))
-            r_ear = (int(lm[self.mp_pose.PoseLandmark.RIGHT_EAR.value].x * self.W),
-                    int(lm[self.mp_pose.PoseLandmark.RIGHT_EAR.value].y * self.H))
-
-            # Detect head region for better water detection
-            rx1, ry1, rx2, ry2 = self.head_roi_from_pose(l_ear, r_ear, l_sh, r_sh, self.W, self.H)
-            self.roi = self.frame[ry1:ry2, rx1:rx2]
-
-            if self.roi.size > 0:
-                self.roi_boxes = self.run_yolo_on_image(self.yolo_model, self.roi, self.config["YOLO_IMG_SIZE"])
-                for x1, y1, x2, y2, name, conf in self.roi_boxes:
-                    self.roi_boxes_global.append((x1 + rx1, y1 + ry1, x2 + rx1, y2 + ry1, name, conf))
+    def landmark_px(self, landmarks, part, W, H):
+        lm = landmarks[self.mp_pose.PoseLandmark[part].value]
+        return (int(lm.x * W), int(lm.y * H))
 
-        self.bottle_boxes = self.full_boxes + self.roi_boxes_global
+    def detect_drink_containers(self, frame, landmarks, W, H, full_frame=True):
+        """
+        Run YOLO on the full frame and, when a pose is available, on the head ROI.
+        Returns (full_boxes, roi_boxes) with ROI boxes mapped to frame coordinates.
+        """
+        full_boxes = []
+        if full_frame:
+            t0 = time.perf_counter()
+            full_boxes = self.run_yolo_on_image(self.yolo_model, frame, self.config["YOLO_IMG_SIZE"])
+            t1 = time.perf_counter()
+            STAGE_YOLO_FULL.observe(t1 - t0)
+            PROFILER.span("yolo_full", t0, t1)
+            DETECTOR_FULL.inc()
+        roi_boxes = []
+
+        if landmarks is not None:
+            l_sh = self.landmark_px(landmarks, "LEFT_SHOULDER", W, H)
+            r_sh = self.landmark_px(landmarks, "RIGHT_SHOULDER", W, H)
+            l_ear = self.landmark_px(landmarks, "LEFT_EAR", W, H)
+            r_ear = self.landmark_px(landmarks, "RIGHT_EAR", W, H)
 
-        self.chosen_box = None
-        if self.results.pose_landmarks is not None:
-            landmarks = self.results.pose_landmarks.landmark
-            # Mouth detection
-            l_mouth = (int(landmarks[self.mp_pose.PoseLandmark.MOUTH_LEFT.value].x * self.W),
-                    int(landmarks[self.mp_pose.PoseLandmark.MOUTH_LEFT.value].y * self.H))
-            r_mouth = (int(landmarks[self.mp_pose.PoseLandmark.MOUTH_RIGHT.value].x * self.W),
-                    int(landmarks[self.mp_pose.PoseLandmark.MOUTH_RIGHT.value].y * self.H))
-            mouth_center = ((l_mouth[0] + r_mouth[0]) // 2, (l_mouth[1] + r_mouth[1]) // 2)
-
-            face_width_px = max(1.0, math.hypot(r_mouth[0] - l_mouth[0], r_mouth[1] - l_mouth[1]))
-
-            prox_thresh = max(30.0, self.config["DRINK_DIST_SCALE"] * face_width_px)
-            best_d = 1e9
-            for (x1, y1, x2, y2, name, conf) in self.bottle_boxes:
-                d = self.point_to_rect_distance(mouth_center[0], mouth_center[1], x1, y1, x2, y2)
-                near_vert = (y1 <= mouth_center[1] + 0.35 * face_width_px)
-                if d < best_d and d <= prox_thresh and near_vert:
-                    best_d = d
-                    self.chosen_box = (x1, y1, x2, y2, name, conf)
-
-            if self.chosen_box is not None:
+            # Detect head region for better water detection
+            rx1, ry1, rx2, ry2 = self.head_roi_from_pose(l_ear, r_ear, l_sh, r_sh, W, H,
+                                                         pad_scale=self.config["ROI_PAD_SCALE"],
+                                                         up_pad=self.config["ROI_UP_PAD"])
+            roi = frame[ry1:ry2, rx1:rx2]
+
+            if roi.size > 0:
+                t2 = time.perf_counter()
+                if self.config["YOLO_FIXED_ROI_SHAPE"]:
+                    # Square input -> the detector always sees YOLO_IMG_SIZE x YOLO_IMG_SIZE
+                    boxes = self.run_yolo_on_image(self.yolo_model, detector.pad_to_square(roi), self.config["YOLO_IMG_SIZE"])
+                    boxes = detector.clip_boxes(boxes, rx2 - rx1, ry2 - ry1)
+                else:
+                    boxes = self.run_yolo_on_image(self.yolo_model, roi, self.config["YOLO_IMG_SIZE"])
+                t3 = time.perf_counter()
+                STAGE_YOLO_ROI.observe(t3 - t2)
+                PROFILER.span("yolo_roi", t2, t3)
+                DETECTOR_ROI.inc()
+                for x1, y1, x2, y2, name, conf in boxes:
+                    roi_boxes.append((x1 + rx1, y1 + ry1, x2 + rx1, y2 + ry1, name, conf))
+        return full_boxes, roi_boxes
+
+    def choose_drink_box(self, landmarks, boxes, W, H):
+        """Proximity heuristic: the container box closest to the mouth (within range), or None."""
+        # Mouth detection
+        l_mouth = self.landmark_px(landmarks, "MOUTH_LEFT", W, H)
+        r_mouth = self.landmark_px(landmarks, "MOUTH_RIGHT", W, H)
+        mouth_center = ((l_mouth[0] + r_mouth[0]) // 2, (l_mouth[1] + r_mouth[1]) // 2)
+
+        face_width_px = max(1.0, math.hypot(r_mouth[0] - l_mouth[0], r_mouth[1] - l_mouth[1]))
+
+        prox_thresh = max(30.0, self.config["DRINK_DIST_SCALE"] * face_width_px)
+        best_d = 1e9
+        chosen = None
+        for (x1, y1, x2, y2, name, conf) in boxes:
+            d = self.point_to_rect_distance(mouth_center[0], mouth_center[1], x1, y1, x2, y2)
+            near_vert = (y1 <= mouth_center[1] + 0.35 * face_width_px)
+            if d < best_d and d <= prox_thresh and near_vert:
+                best_d = d
+                chosen = (x1, y1, x2, y2, name, conf)
+        return chosen
+
+    def update_drink_state(self, chosen_box, pose_ok, now):
+        """Debounce near-mouth frames into drink events. Returns True when a drink is detected at `now`."""
+        if pose_ok:
+            if chosen_box is not None:
                 self.drink_consec += 1
             else:
                 self.drink_consec = max(0, self.drink_consec - 2)
+        return (chosen_box is not None and self.drink_consec >= self.config["DRINK_MIN_FRAMES"]
+                and (now - self.last_drink_ts) >= self.config["DRINK_COOLDOWN_SEC"])
 
-        if self.chosen_box is not None and (self.drink_consec >= self.config["DRINK_MIN_FRAMES"]) and ((time.time() - time.mktime(self.last_drink_time)) >= self.config["DRINK_COOLDOWN_SEC"]):
-            # print("Hydration: drink detected!")
-            self.last_drink_time = time.localtime(time.time())
-            self.drink_banner_until = time.time() + self.config["HYDRATION_BANNER_SEC"]
+    def drinking_water_test(self):
+        # Ensure YOLO is run frequently
+        t0 = time.perf_counter()
+        landmarks = self.results.pose_landmarks.landmark if self.pose_ok else None
+        self.full_boxes, self.roi_boxes_global = self.detect_drink_containers(self.frame, landmarks, self.W, self.H)
+        self.bottle_boxes = self.full_boxes + self.roi_boxes_global
+        t4 = time.perf_counter()
+
+        self.chosen_box = self.choose_drink_box(landmarks, self.bottle_boxes, self.W, self.H) if self.pose_ok else None
+        now = time.time()
+        if self.update_drink_state(self.chosen_box, self.pose_ok, now):
+            self.last_drink_ts = now
+            self.hydration_count += 1
+            DRINK_EVENTS.inc()
             print("Hydration: drink detected!")
+            self.drink_banner = True
+            self.timers.schedule("drink_banner", self.config["HYDRATION_BANNER_SEC"], self.clear_drink_banner)
+            self.hydrate_reminder = False
+            self.timers.schedule("hydrate", self.hydrate_seconds, self.on_hydrate_due, persist=True)
+
+        if PROFILER.enabled:
+            end = time.perf_counter()
+            PROFILER.span("drink_heuristic", t4, end)
+            PROFILER.span("drinking_water_test", t0, end, args={"boxes": len(self.bottle_boxes)})
+
+    # --- Focus / break / absent state machine ---
+    def inference_budget(self):
+        """What the current mode may spend: pose rate (None = every frame) and whether YOLO runs."""
+        if self.mode == "focus":
+            detector = True
+        elif self.mode == "break":
+            detector = not self.config["YOLO_IN_FOCUS_ONLY"]
+        else:
+            detector = False
+        return {"pose_hz": self.config["POSE_HZ_BY_MODE"].get(self.mode), "detector": detector,
+                "presence_gate": self.mode == "absent" and self.presence is not None}
+
+    def pose_due(self, now, budget):
+        pose_hz = budget["pose_hz"]
+        return pose_hz is None or self.last_pose_time is None or now - self.last_pose_time >= 1.0 / pose_hz
+
+    def add_mode_listener(self, listener):
+        """listener(event) is called from the model thread on every mode transition."""
+        self.mode_listeners.append(listener)
+
+    def set_mode(self, mode, now, reason):
+        previous = self.mode
+        self.mode = mode
+        self.mode_since = now
+        self.mode_seq += 1
+        event = {"seq": self.mode_seq, "from": previous, "to": mode, "at": now, "reason": reason}
+        self.mode_events.append(event)
+        MODE_TRANSITIONS.labels(previous, mode).inc()
+        if mode == "focus":
+            self.timers.schedule("focus_end", self.pomodoro_seconds)
+        elif mode == "break":
+            self.timers.cancel("focus_end")
+            self.timers.schedule("break_end", self.break_seconds)
+        else:
+            self.timers.cancel("focus_end")
+            self.timers.cancel("break_end")
+            if self.presence is not None:
+                self.presence.reset()
+        print(f"Mode: {previous} -> {mode} ({reason})")
+        for listener in list(self.mode_listeners):
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"Mode listener failed: {e}")
+
+    def update_mode(self, now, centroid):
+        """Advance the state machine with one pose result (centroid is None when nobody was found)."""
+        if centroid is not None:
+            self.last_seen_time = now
+        away = self.last_seen_time is None or now - self.last_seen_time > self.config["ABSENCE_RESET_SEC"]
+
+        if self.mode == "focus":
+            if away:
+                self.set_mode("absent", now, "no person detected")
+            elif centroid is not None and self.config["REQUIRE_CONTINUOUS_SIT"]:
+                # Large displacement while moving = stood up; restart the focus timer
+                if self.last_centroid_for_standup is None or self.is_still():
+                    self.last_centroid_for_standup = centroid
+                elif math.hypot(centroid[0] - self.last_centroid_for_standup[0],
+                                centroid[1] - self.last_centroid_for_standup[1]) > self.config["STANDUP_MOVE_THRESH"]:
+                    self.timers.schedule("focus_end", self.pomodoro_seconds)
+                    self.last_centroid_for_standup = centroid
+        elif self.mode == "absent" and centroid is not None:
+            self.last_centroid_for_standup = centroid
+            self.set_mode("focus", now, "person detected")
+
+    def on_timer_event(self, name, now):
+        """Pomodoro timers fire as events and are applied here, on the model thread."""
+        if name == "focus_end" and self.mode == "focus":
+            self.set_mode("break", now, "focus session complete")
+        elif name == "break_end" and self.mode == "break":
+            away = self.last_seen_time is None or now - self.last_seen_time > self.config["ABSENCE_RESET_SEC"]
+            if away:
+                self.set_mode("absent", now, "break over, nobody at the desk")
+            else:
+                self.set_mode("focus", now, "break over")
+
+    def mode_status(self, now=None):
+        now = now or time.time()
+        status = {"mode": self.mode, "since": self.mode_since, "budget": self.inference_budget()}
+        if self.mode == "focus":
+            status["focus_remaining_sec"] = self.timers.remaining("focus_end")
+        if self.mode == "break":
+            status["break_remaining_sec"] = self.timers.remaining("break_end")
+        status["hydrate_reminder"] = self.hydrate_reminder
+        status["timers"] = self.timers.status()
+        if self.presence is not None:
+            status["presence_gate"] = self.presence.stats()
+        return status
 
-        
-    
     def posture_test(self, shoulder_angle, neck_angle):
         if shoulder_angle < self.shoulder_threshold or neck_angle < self.neck_threshold:
             status = "Poor Posture"
@@ -319,6 +603,9 @@ class PosturePomodoroModel:
         self.do_drinking_test = True
         if self.cap is None:
             self.cap = cv2.VideoCapture(0)
+        # Resumes a reminder deadline persisted before a restart
+        if not self.timers.pending("hydrate"):
+            self.timers.restore("hydrate", self.hydrate_seconds, self.on_hydrate_due)
 
     
     def stop_posture_detection(self):
@@ -326,22 +613,72 @@ class PosturePomodoroModel:
     
     def stop_drinking_detection(self):
         self.do_drinking_test = False
+        # Keeps the deadline on disk so restarting drinking detection resumes it
+        self.timers.pause("hydrate")
+        self.hydrate_reminder = False
 
     def run(self):
+        self.last_frame_time = None
+        PROFILER.sample_thread_id = threading.get_ident()
+        if self.config["PROFILE_ENABLED"]:
+            PROFILER.start()
         while self.cap.isOpened() and (self.do_posture_test or self.do_drinking_test):
+            now = time.time()
+            if self.timers.events:
+                for name in self.timers.drain():
+                    self.on_timer_event(name, now)
+            budget = self.inference_budget()
+            gated = budget["presence_gate"]
+            due = self.presence.due(now) if gated else self.pose_due(now, budget)
+            if not due and not self.preview.wants_frame(now):
+                # Off-budget frame: drain the camera buffer without decoding
+                self.cap.grab()
+                continue
+
+            t0 = time.perf_counter()
             ret, frame = self.cap.read()
+            t1 = time.perf_counter()
+            STAGE_READ.observe(t1 - t0)
             if not ret:
+                DROPPED_FRAMES.inc()
                 continue
 
             self.frame = cv2.flip(frame, 1)
             self.H, self.W = self.frame.shape[:2]
+            if self.do_drinking_test:
+                self.warmup_detector((self.H, self.W))
             now = time.time()
 
+            if not due:
+                # Only the preview wants this frame
+                self.preview.offer(self.frame, self.preview_state(now))
+                continue
+
+            if gated:
+                awake = self.presence.check(self.frame, now)
+                t_gate = time.perf_counter()
+                STAGE_PRESENCE.observe(t_gate - t1)
+                if PROFILER.enabled:
+                    PROFILER.span("presence", t1, t_gate, args={"motion": self.presence.last_motion})
+                if not awake:
+                    if self.preview.wants_frame(now):
+                        self.preview.offer(self.frame, self.preview_state(now))
+                    continue
+                t1 = t_gate
+
             rgb_frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB)
+            t2 = time.perf_counter()
+            STAGE_CONVERT.observe(t2 - t1)
             self.results = self.pose.process(rgb_frame)
             self.pose_ok = self.results.pose_landmarks is not None
+            self.last_pose_time = now
+            if gated:
+                self.presence.record_pose(self.pose_ok)
+            t3 = time.perf_counter()
+            STAGE_POSE.observe(t3 - t2)
 
             # Extract landmarks (even in break mode, to keep detecting)
+            centroid = None
             if self.pose_ok:
                 landmarks = self.results.pose_landmarks.landmark
                 l_sh = (int(landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value].x * self.W),
@@ -356,6 +693,8 @@ class PosturePomodoroModel:
 
                 shoulder_angle = self.calculate_angle(l_sh, r_sh, (r_sh[0], 0))
                 neck_angle = self.calculate_angle(l_ear, l_sh, (l_sh[0], 0))
+                self.keypoints = {"l_sh": l_sh, "r_sh": r_sh, "l_ear": l_ear}
+                self.angles = (shoulder_angle, neck_angle)
 
                 # Calibration
                 if not self.is_calibrated and self.calibration_frames < 30:
@@ -367,12 +706,45 @@ class PosturePomodoroModel:
                     self.neck_threshold = float(np.mean(self.calibration_neck_angles) - 10.0)
                     self.is_calibrated = True
                     print(f"Calibration complete. Shoulder threshold: {self.shoulder_threshold:.1f}, Neck threshold: {self.neck_threshold:.1f}")
-            
+
+            self.update_mode(now, centroid)
+
             if self.is_calibrated:
-                if self.do_posture_test:
+                if self.do_posture_test and self.pose_ok:
                     self.posture_test(shoulder_angle, neck_angle)
-                if self.do_drinking_test:
+                t4 = time.perf_counter()
+                STAGE_POSTPROCESS.observe(t4 - t3)
+                # The budget of the (possibly new) mode decides whether the detector runs
+                if self.do_drinking_test and self.inference_budget()["detector"]:
                     self.drinking_water_test()
-
+                else:
+                    self.bottle_boxes, self.chosen_box = [], None
+            else:
+                t4 = time.perf_counter()
+                STAGE_POSTPROCESS.observe(t4 - t3)
+
+            if PROFILER.enabled:
+                end = time.perf_counter()
+                PROFILER.span("read", t0, t1)
+                PROFILER.span("convert", t1, t2)
+                PROFILER.span("pose", t2, t3, args={"pose_ok": self.pose_ok})
+                PROFILER.span("postprocess", t3, t4)
+                PROFILER.span("frame", t0, end, args={"mode": self.mode})
+
+            FRAMES.inc()
+            if self.last_frame_time is not None and now > self.last_frame_time:
+                instant = 1.0 / (now - self.last_frame_time)
+                self.fps = instant if self.fps == 0 else 0.9 * self.fps + 0.1 * instant
+            self.last_frame_time = now
+
+            # No subscribers -> a single length check, nothing is copied or drawn
+            if self.preview.wants_frame(now):
+                self.preview.offer(self.frame, self.preview_state(now))
+
+        self.fps = 0.0
+        # Stop the pomodoro: a focus_end/break_end left pending would fire into the next run
+        if self.mode != "absent":
+            self.set_mode("absent", time.time(), "stopped")
+        self.timers.drain()
         print("Exiting run loop ~~~~~~~~~~~~~~~~~~~.")
  
\ No newline at end of file
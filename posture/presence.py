@@ -0,0 +1,120 @@
+import cv2
+import numpy as np
+
+try:
+    from posture import metrics
+except ImportError:
+    import metrics
+
+# Presence gate defaults (overridable through the model config)
+PRESENCE_GATE_HZ = 5.0          # gate checks per second while nobody is at the desk
+PRESENCE_WIDTH = 64             # frames are downscaled to this width (grayscale) before differencing
+PRESENCE_PIXEL_DIFF = 25        # per-pixel intensity change that counts as motion
+PRESENCE_MOTION_RATIO = 0.02    # share of changed pixels that wakes up pose inference
+PRESENCE_RECHECK_SEC = 10.0     # run pose anyway this often, in case someone sits perfectly still
+PRESENCE_BG_ALPHA = 0.05        # background adaptation rate (absorbs slow lighting changes)
+
+GATE_CHECKS = metrics.PRESENCE_GATE_CHECKS
+GATE_POSE_RESULTS = metrics.PRESENCE_GATE_POSE_RESULTS
+
+
+class PresenceGate:
+    """
+    Cheap motion check in front of MediaPipe Pose for an empty desk.
+
+    Each checked frame is reduced to a tiny blurred grayscale image and
+    compared against a running-average background. Pose only runs when
+    enough pixels changed (motion) or when the periodic recheck is due;
+    otherwise the frame is dropped after a resize and an absdiff.
+
+    Every decision is counted, and pose results are attributed back to the
+    decision that triggered them, so stats() can report how often the gate
+    saved a pose call and how often a wake-up actually found someone.
+    """
+
+    def __init__(self, hz=PRESENCE_GATE_HZ, width=PRESENCE_WIDTH, pixel_diff=PRESENCE_PIXEL_DIFF,
+                 motion_ratio=PRESENCE_MOTION_RATIO, recheck_sec=PRESENCE_RECHECK_SEC, bg_alpha=PRESENCE_BG_ALPHA):
+        self.interval = 1.0 / hz
+        self.width = width
+        self.pixel_diff = pixel_diff
+        self.motion_ratio = motion_ratio
+        self.recheck_sec = recheck_sec
+        self.bg_alpha = bg_alpha
+        self.last_check = None
+        self.last_pose = None
+        self.last_motion = 0.0
+        self.pending = None         # decision waiting for its pose result
+        self.counts = {"skip": 0, "motion": 0, "recheck": 0}
+        self.found = {"motion": 0, "recheck": 0}
+        self._background = None
+        self._small = None
+        self._diff = None
+
+    def reset(self):
+        """Forget the background; call when the desk becomes empty so the new scene is learned."""
+        self._background = None
+        self.last_pose = None
+        self.pending = None
+
+    def due(self, now):
+        return self.last_check is None or now - self.last_check >= self.interval
+
+    def motion(self, frame):
+        """Share of pixels that differ from the background (0.0 while the background is being seeded)."""
+        h, w = frame.shape[:2]
+        size = (self.width, max(1, int(h * self.width / w)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0, dst=gray)
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray.astype(np.float32)
+            self._small = np.empty_like(gray)
+            self._diff = np.empty_like(gray)
+            return 0.0
+        cv2.convertScaleAbs(self._background, dst=self._small)
+        cv2.absdiff(gray, self._small, dst=self._diff)
+        ratio = cv2.countNonZero(cv2.threshold(self._diff, self.pixel_diff, 255, cv2.THRESH_BINARY)[1]) / gray.size
+        cv2.accumulateWeighted(gray, self._background, self.bg_alpha)
+        return ratio
+
+    def check(self, frame, now):
+        """Decide whether this frame should go through pose inference."""
+        self.last_check = now
+        self.last_motion = self.motion(frame)
+        if self.last_motion >= self.motion_ratio:
+            decision = "motion"
+        elif self.last_pose is None or now - self.last_pose >= self.recheck_sec:
+            decision = "recheck"
+        else:
+            decision = "skip"
+        self.counts[decision] += 1
+        GATE_CHECKS.labels(decision).inc()
+        if decision == "skip":
+            return False
+        self.pending = decision
+        self.last_pose = now
+        return True
+
+    def record_pose(self, person):
+        """Attribute a pose result to the gate decision that asked for it."""
+        decision, self.pending = self.pending, None
+        if decision is None:
+            return
+        if person:
+            self.found[decision] += 1
+        GATE_POSE_RESULTS.labels(decision, "yes" if person else "no").inc()
+
+    def stats(self):
+        checks = sum(self.counts.values())
+        woken = self.counts["motion"]
+        return {
+            "checks": checks,
+            **self.counts,
+            # share of gate checks that avoided a pose call
+            "skip_rate": self.counts["skip"] / checks if checks else None,
+            # share of motion wake-ups where pose actually found a person
+            "hit_rate": self.found["motion"] / woken if woken else None,
+            # people only found by the periodic recheck (the gate missed them)
+            "missed": self.found["recheck"],
+            "last_motion_ratio": self.last_motion,
+        }
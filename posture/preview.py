@@ -0,0 +1,203 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+# Preview defaults (overridable through the model config)
+PREVIEW_FPS = 10
+PREVIEW_MAX_WIDTH = 640
+PREVIEW_JPEG_QUALITY = 70
+TEXT_SPRITE_CACHE_SIZE = 256
+
+
+class OverlayCache:
+    """
+    Cached overlay primitives for the preview. Text is rasterized once per
+    (text, font, scale, color, thickness) into a sprite + mask and blitted
+    afterwards; dimming is done in place. Only used from the encoder thread.
+    """
+
+    def __init__(self, max_sprites=TEXT_SPRITE_CACHE_SIZE):
+        self.max_sprites = max_sprites
+        self._sprites = OrderedDict()
+
+    def _sprite(self, text, font, scale, color, thickness):
+        key = (text, font, scale, color, thickness)
+        sprite = self._sprites.get(key)
+        if sprite is not None:
+            self._sprites.move_to_end(key)
+            return sprite
+        (tw, th), baseline = cv2.getTextSize(text, font, scale, thickness)
+        h, w = th + baseline + 2 * thickness, tw + 2 * thickness
+        mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.putText(mask, text, (thickness, th + thickness), font, scale, 255, thickness, cv2.LINE_AA)
+        image = np.zeros((h, w, 3), dtype=np.uint8)
+        image[:] = color
+        # (image, mask, ascent) - ascent maps putText's baseline origin onto the sprite
+        sprite = (image, mask > 127, th + thickness)
+        self._sprites[key] = sprite
+        if len(self._sprites) > self.max_sprites:
+            self._sprites.popitem(last=False)
+        return sprite
+
+    def text_size(self, text, font, scale, thickness):
+        return cv2.getTextSize(text, font, scale, thickness)[0]
+
+    def put_text(self, img, text, org, font, scale, color, thickness):
+        """Same placement as cv2.putText: org is the bottom-left corner of the text."""
+        image, mask, ascent = self._sprite(text, font, scale, tuple(color), thickness)
+        x, y = org[0] - thickness, org[1] - ascent
+        h, w = mask.shape
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x + w, img.shape[1]), min(y + h, img.shape[0])
+        if x1 >= x2 or y1 >= y2:
+            return
+        sx, sy = x1 - x, y1 - y
+        np.copyto(img[y1:y2, x1:x2], image[sy:sy + (y2 - y1), sx:sx + (x2 - x1)],
+                  where=mask[sy:sy + (y2 - y1), sx:sx + (x2 - x1), None])
+
+    def dim(self, img, alpha=0.35):
+        # Equivalent to blending with a black overlay, without allocating one
+        cv2.convertScaleAbs(img, dst=img, alpha=1 - alpha)
+
+
+class PreviewSubscription:
+    """One connected client. Waits on the event loop for the next encoded frame."""
+
+    def __init__(self, stream, loop):
+        self._stream = stream
+        self._loop = loop
+        self._event = asyncio.Event()
+        self._seq = 0
+
+    def _notify(self):
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            pass  # loop already closed
+
+    async def next_frame(self):
+        """Latest JPEG that this subscriber has not seen yet (slow clients skip frames)."""
+        while True:
+            await self._event.wait()
+            self._event.clear()
+            seq, jpeg = self._stream.latest()
+            if jpeg is not None and seq != self._seq:
+                self._seq = seq
+                return jpeg
+
+
+class PreviewStream:
+    """
+    Annotated camera preview, produced only while someone is watching.
+
+    The capture loop calls wants_frame() (a counter check) and, at most `fps`
+    times per second, offer() with the raw frame and a small overlay state.
+    A single encoder thread, alive only while there are subscribers, resizes
+    to `max_width`, draws the overlays via `render(img, state, scale)` and
+    JPEG-encodes. With no subscribers nothing is copied, drawn or encoded.
+    """
+
+    def __init__(self, render, fps=PREVIEW_FPS, max_width=PREVIEW_MAX_WIDTH, jpeg_quality=PREVIEW_JPEG_QUALITY):
+        self.render = render
+        self.interval = 1.0 / fps
+        self.max_width = max_width
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), int(jpeg_quality)]
+        self.overlays = OverlayCache()
+
+        self._cond = threading.Condition()
+        self._subscribers = []
+        self._thread = None
+        self._pending = None
+        self._last_offer = 0.0
+        self._seq = 0
+        self._jpeg = None
+        self._buffer = None
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    # --- producer side (capture loop) ---
+    def wants_frame(self, now):
+        return bool(self._subscribers) and now - self._last_offer >= self.interval
+
+    def offer(self, frame, state):
+        """Hand over the latest frame; an unencoded older frame is simply replaced."""
+        with self._cond:
+            self._last_offer = time.time()
+            self._pending = (frame, state)
+            self._cond.notify()
+
+    # --- consumer side ---
+    def latest(self):
+        with self._cond:
+            return self._seq, self._jpeg
+
+    def subscribe(self, loop=None):
+        sub = PreviewSubscription(self, loop or asyncio.get_running_loop())
+        with self._cond:
+            self._subscribers.append(sub)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="preview-encoder", daemon=True)
+                self._thread.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._cond:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+            if not self._subscribers:
+                self._cond.notify()
+
+    @contextmanager
+    def subscription(self):
+        sub = self.subscribe()
+        try:
+            yield sub
+        finally:
+            self.unsubscribe(sub)
+
+    # --- encoder thread ---
+    def _worker(self):
+        while True:
+            with self._cond:
+                while self._pending is None and self._subscribers:
+                    self._cond.wait()
+                if not self._subscribers:
+                    # Last viewer left: drop frames and buffers so an idle preview holds nothing
+                    self._thread = None
+                    self._pending = None
+                    self._jpeg = None
+                    self._buffer = None
+                    return
+                frame, state = self._pending
+                self._pending = None
+
+            jpeg = self._encode(frame, state)
+            if jpeg is None:
+                continue
+            with self._cond:
+                self._seq += 1
+                self._jpeg = jpeg
+                subscribers = list(self._subscribers)
+            for sub in subscribers:
+                sub._notify()
+
+    def _encode(self, frame, state):
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.max_width / float(w))
+        size = (int(w * scale), int(h * scale))
+        if self._buffer is None or self._buffer.shape[:2] != (size[1], size[0]):
+            self._buffer = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        if scale < 1.0:
+            cv2.resize(frame, size, dst=self._buffer, interpolation=cv2.INTER_AREA)
+        else:
+            np.copyto(self._buffer, frame)
+        self.render(self._buffer, state, scale)
+        ok, encoded = cv2.imencode(".jpg", self._buffer, self.encode_params)
+        return encoded.tobytes() if ok else None
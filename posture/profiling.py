@@ -0,0 +1,148 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+# Profiling defaults (overridable through environment variables)
+PROFILE_DIR = os.environ.get("POSTURE_PROFILE_DIR", "profiles")
+PROFILE_FLUSH_SEC = 10.0        # one trace file per flush window
+PROFILE_KEEP_FILES = 6          # rotating: older trace/stack files are deleted
+SAMPLE_INTERVAL_SEC = 0.02      # stack sampler period for the model thread
+MAX_STACK_DEPTH = 64
+
+
+class Profiler:
+    """
+    Opt-in per-frame tracing and statistical stack sampling.
+
+    Callers pass perf_counter() timestamps they already took to span(), which
+    is a no-op returning immediately while disabled. When enabled, spans are
+    buffered in memory and a background thread (which also samples the model
+    thread's stack every SAMPLE_INTERVAL_SEC) writes them out every
+    PROFILE_FLUSH_SEC as Chrome trace JSON (chrome://tracing, ui.perfetto.dev)
+    plus a folded-stack file (speedscope, flamegraph.pl).
+    """
+
+    def __init__(self, out_dir=PROFILE_DIR, flush_sec=PROFILE_FLUSH_SEC, keep_files=PROFILE_KEEP_FILES,
+                 sample_interval=SAMPLE_INTERVAL_SEC):
+        self.out_dir = out_dir
+        self.flush_sec = flush_sec
+        self.keep_files = keep_files
+        self.sample_interval = sample_interval
+        self.enabled = False
+        self.sample_thread_id = None
+        self._events = deque()
+        self._stacks = Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._file_index = 0
+
+    # --- recording ---
+    def span(self, name, start, end, cat="model", args=None):
+        """Record a complete event from two perf_counter() timestamps."""
+        if not self.enabled:
+            return
+        event = {"name": name, "cat": cat, "ph": "X", "ts": start * 1e6, "dur": (end - start) * 1e6,
+                 "pid": self._pid, "tid": threading.get_ident()}
+        if args:
+            event["args"] = args
+        # deque.append is thread-safe; the flush thread drains with popleft, never swaps the deque
+        self._events.append(event)
+
+    def scheduler_phase(self, name, start, end):
+        self.span(name, start, end, cat="scheduler")
+
+    # --- control ---
+    def start(self, sample_thread_id=None):
+        with self._lock:
+            if sample_thread_id is not None:
+                self.sample_thread_id = sample_thread_id
+            if self.enabled:
+                return
+            os.makedirs(self.out_dir, exist_ok=True)
+            self._stop.clear()
+            self.enabled = True
+            self._thread = threading.Thread(target=self._background, name="profiler", daemon=True)
+            self._thread.start()
+        print(f"Profiling enabled, writing traces to {os.path.abspath(self.out_dir)}")
+
+    def stop(self):
+        with self._lock:
+            if not self.enabled:
+                return
+            self.enabled = False
+            self._stop.set()
+            thread, self._thread = self._thread, None
+        thread.join()
+        print("Profiling disabled")
+
+    def status(self):
+        return {
+            "enabled": self.enabled,
+            "dir": os.path.abspath(self.out_dir),
+            "files": self._files(),
+            "sample_interval_sec": self.sample_interval,
+        }
+
+    # --- background thread ---
+    def _background(self):
+        next_flush = time.perf_counter() + self.flush_sec
+        while not self._stop.wait(self.sample_interval):
+            self._sample()
+            if time.perf_counter() >= next_flush:
+                self._flush()
+                next_flush = time.perf_counter() + self.flush_sec
+        self._flush()
+
+    def _sample(self):
+        tid = self.sample_thread_id
+        if tid is None:
+            return
+        frame = sys._current_frames().get(tid)
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        if stack:
+            self._stacks[";".join(reversed(stack))] += 1
+
+    def _flush(self):
+        events = [self._events.popleft() for _ in range(len(self._events))]
+        stacks, self._stacks = self._stacks, Counter()
+        if not events and not stacks:
+            return
+        names = {t.ident: t.name for t in threading.enumerate()}
+        metadata = [{"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": names[tid]}}
+                    for tid in {e["tid"] for e in events} if tid in names]
+
+        self._file_index += 1
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{self._file_index:04d}"
+        with open(os.path.join(self.out_dir, f"trace-{stamp}.json"), "w") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+        if stacks:
+            with open(os.path.join(self.out_dir, f"stacks-{stamp}.folded"), "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        self._rotate()
+
+    def _files(self):
+        if not os.path.isdir(self.out_dir):
+            return []
+        return sorted(n for n in os.listdir(self.out_dir) if n.startswith(("trace-", "stacks-")))
+
+    def _rotate(self):
+        for prefix in ("trace-", "stacks-"):
+            names = [n for n in self._files() if n.startswith(prefix)]
+            for name in names[:-self.keep_files]:
+                try:
+                    os.remove(os.path.join(self.out_dir, name))
+                except OSError:
+                    pass
+
+
+PROFILER = Profiler()
@@ -0,0 +1,185 @@
+import heapq
+import json
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    from posture import metrics
+except ImportError:
+    import metrics
+
+# Deadlines of persistent timers are kept here (wall clock) so reminders survive restarts
+TIMER_STATE_FILE = os.environ.get("POSTURE_TIMER_STATE", "posture_timers.json")
+
+TIMER_FIRED = metrics.TIMER_FIRED
+TIMER_LATENESS = metrics.TIMER_LATENESS
+
+
+class _Timer:
+    __slots__ = ("due", "seq", "name", "callback", "persist", "cancelled")
+
+    def __init__(self, due, seq, name, callback, persist):
+        self.due = due
+        self.seq = seq
+        self.name = name
+        self.callback = callback
+        self.persist = persist
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.due, self.seq) < (other.due, other.seq)
+
+
+class TimerService:
+    """
+    Named one-shot timers on the monotonic clock.
+
+    A min-heap holds the deadlines and a single thread sleeps on a condition
+    until the earliest one is due, so nothing is polled per frame. Scheduling
+    a name that is already pending replaces it; cancelled entries are dropped
+    lazily when they reach the top of the heap.
+
+    When a timer fires its callback runs on the timer thread (keep it short),
+    or, without a callback, its name is queued for drain() so the owner can
+    handle it on its own thread. Timers scheduled with persist=True have their
+    wall-clock deadline written to `state_file`; restore() picks them up after
+    a restart, firing immediately if the deadline passed while we were down.
+    pause() stops a persistent timer but keeps its deadline for restore(),
+    while cancel() forgets it.
+    """
+
+    def __init__(self, state_file=TIMER_STATE_FILE):
+        self.state_file = state_file
+        self.events = deque()
+        self._heap = []
+        self._timers = {}
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._save_lock = threading.Lock()
+        self._thread = None
+        self._saved = self._load()
+
+    # --- scheduling ---
+    def schedule(self, name, delay, callback=None, persist=False):
+        with self._cond:
+            self._cancel(name)
+            self._seq += 1
+            timer = _Timer(time.monotonic() + max(0.0, delay), self._seq, name, callback, persist)
+            self._timers[name] = timer
+            heapq.heappush(self._heap, timer)
+            if self._heap[0] is timer:
+                self._cond.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="timers", daemon=True)
+                self._thread.start()
+        if persist:
+            self._save()
+
+    def restore(self, name, default_delay, callback=None):
+        """Schedule a persistent timer at its saved deadline, or after default_delay if none was saved."""
+        with self._cond:
+            deadline = self._saved.pop(name, None)
+        delay = default_delay if deadline is None else deadline - time.time()
+        self.schedule(name, delay, callback, persist=True)
+
+    def cancel(self, name):
+        with self._cond:
+            timer = self._cancel(name)
+            forgotten = self._saved.pop(name, None) is not None
+        if (timer is not None and timer.persist) or forgotten:
+            self._save()
+
+    def pause(self, name):
+        """Stop a persistent timer but keep its wall-clock deadline, so restore() resumes it."""
+        with self._cond:
+            timer = self._cancel(name)
+            if timer is None or not timer.persist:
+                return
+            self._saved[name] = timer.due + time.time() - time.monotonic()
+        self._save()
+
+    def _cancel(self, name):
+        timer = self._timers.pop(name, None)
+        if timer is not None:
+            timer.cancelled = True
+        return timer
+
+    # --- queries ---
+    def pending(self, name):
+        return name in self._timers
+
+    def remaining(self, name):
+        timer = self._timers.get(name)
+        if timer is None:
+            return None
+        return max(0.0, timer.due - time.monotonic())
+
+    def drain(self):
+        """Names of fired callback-less timers, oldest first."""
+        fired = []
+        while self.events:
+            fired.append(self.events.popleft())
+        return fired
+
+    def status(self):
+        now = time.monotonic()
+        with self._cond:
+            return {name: max(0.0, t.due - now) for name, t in self._timers.items()}
+
+    # --- timer thread ---
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    while self._heap and self._heap[0].cancelled:
+                        heapq.heappop(self._heap)
+                    if self._heap:
+                        wait = self._heap[0].due - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                timer = heapq.heappop(self._heap)
+                del self._timers[timer.name]
+            TIMER_LATENESS.observe(time.monotonic() - timer.due)
+            TIMER_FIRED.labels(timer.name).inc()
+            if timer.persist:
+                self._save()
+            if timer.callback is None:
+                self.events.append(timer.name)
+                continue
+            try:
+                timer.callback()
+            except Exception as e:
+                print(f"Timer '{timer.name}' callback failed: {e}")
+
+    # --- persistence ---
+    def _load(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file) as f:
+                return {name: float(deadline) for name, deadline in json.load(f).items()}
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Ignoring unreadable timer state {self.state_file}: {e}")
+            return {}
+
+    def _save(self):
+        if not self.state_file:
+            return
+        tmp = f"{self.state_file}.tmp"
+        with self._save_lock:
+            offset = time.time() - time.monotonic()
+            with self._cond:
+                # Paused or not yet restored deadlines are kept as well
+                state = dict(self._saved)
+                state.update({name: t.due + offset for name, t in self._timers.items() if t.persist})
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(state, f)
+                os.replace(tmp, self.state_file)
+            except OSError as e:
+                print(f"Could not save timer state: {e}")
@@ -0,0 +1,201 @@
+import datetime as dt
+import math
+import os
+
+import numpy as np
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+# --- 設定 ---
+RESOLUTION_MINUTES = 5
+DEFAULT_WORKING_HOURS = (dt.time(9), dt.time(18))
+DEFAULT_LUNCH_BREAK = (dt.time(12), dt.time(13))
+
+
+class WorkCalendar:
+    """
+    Working-time model: per-weekday hours (None = day off), a lunch break,
+    holidays and the timezone the hours are expressed in.
+    """
+
+    def __init__(self, tz=None, weekly_hours=None, lunch_break=DEFAULT_LUNCH_BREAK, holidays=(),
+                 resolution_minutes=RESOLUTION_MINUTES):
+        self.tz = tz or dt.datetime.now().astimezone().tzinfo
+        # 預設與舊版相同: 每天 (含週末) 9:00-18:00
+        self.weekly_hours = weekly_hours or {weekday: DEFAULT_WORKING_HOURS for weekday in range(7)}
+        self.lunch_break = lunch_break
+        self.holidays = set(holidays)
+        self.resolution_minutes = resolution_minutes
+
+    @classmethod
+    def from_env(cls):
+        """
+        SCHEDULER_TIMEZONE=Asia/Taipei, SCHEDULER_WORKDAYS=0,1,2,3,4 (0 = Monday),
+        SCHEDULER_HOLIDAYS=2025-10-10,2025-12-25
+        """
+        tz = None
+        if os.environ.get('SCHEDULER_TIMEZONE') and ZoneInfo is not None:
+            tz = ZoneInfo(os.environ['SCHEDULER_TIMEZONE'])
+        weekly_hours = None
+        if os.environ.get('SCHEDULER_WORKDAYS'):
+            workdays = {int(d) for d in os.environ['SCHEDULER_WORKDAYS'].split(',') if d.strip()}
+            weekly_hours = {weekday: DEFAULT_WORKING_HOURS if weekday in workdays else None for weekday in range(7)}
+        holidays = [dt.date.fromisoformat(d.strip()) for d in os.environ.get('SCHEDULER_HOLIDAYS', '').split(',') if d.strip()]
+        return cls(tz=tz, weekly_hours=weekly_hours, holidays=holidays)
+
+    def now(self):
+        return dt.datetime.now(self.tz)
+
+    def working_periods(self, date):
+        """當天可工作的時段 (已扣除午休)，以 tz-aware datetime 表示"""
+        hours = self.weekly_hours.get(date.weekday())
+        if hours is None or date in self.holidays:
+            return []
+        start, end = (dt.datetime.combine(date, t, tzinfo=self.tz) for t in hours)
+        if self.lunch_break is None:
+            return [(start, end)]
+        lunch_start, lunch_end = (dt.datetime.combine(date, t, tzinfo=self.tz) for t in self.lunch_break)
+        periods = [(start, min(end, lunch_start)), (max(start, lunch_end), end)]
+        return [(s, e) for s, e in periods if s < e]
+
+
+DEFAULT_WORK_CALENDAR = WorkCalendar.from_env()
+
+
+class AvailabilityGrid:
+    """
+    Rasterizes [start, end) into fixed-size cells (RESOLUTION_MINUTES). Each
+    cell is working or not, and busy or not; busy events are painted in with
+    a vectorized difference array. Searches run on the "work axis", which
+    keeps only working cells, so a run can bridge lunch but never a day
+    boundary.
+    """
+
+    def __init__(self, calendar, start, end):
+        self.calendar = calendar
+        self.res = dt.timedelta(minutes=calendar.resolution_minutes)
+        # 起點進位到格線；內部以 UTC 計算，避免夏令時間造成的牆上時間誤差
+        midnight = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        minutes = math.ceil((start - midnight).total_seconds() / 60 / calendar.resolution_minutes) * calendar.resolution_minutes
+        self.start = (midnight + dt.timedelta(minutes=minutes)).astimezone(dt.timezone.utc)
+        self.size = max(0, math.ceil((end - self.start) / self.res))
+
+        self.working = np.zeros(self.size, dtype=bool)
+        day_id = np.full(self.size, -1, dtype=np.int32)
+        date = self.start.astimezone(calendar.tz).date()
+        last_date = (self.start + self.size * self.res).astimezone(calendar.tz).date()
+        while date <= last_date:
+            for period_start, period_end in calendar.working_periods(date):
+                a, b = self.index(period_start), self.index(period_end)
+                if a < b:
+                    self.working[a:b] = True
+                    day_id[a:b] = date.toordinal()
+            date += dt.timedelta(days=1)
+        self.busy = np.zeros(self.size, dtype=bool)
+
+        # 工作軸: 只保留可工作的格子；day_break 標記每天的第一格
+        self.work_cells = np.flatnonzero(self.working)
+        work_days = day_id[self.work_cells]
+        self.day_break = np.ones(len(self.work_cells), dtype=bool)
+        self.day_break[1:] = work_days[1:] != work_days[:-1]
+
+    # --- 時間與格子互轉 ---
+    def index(self, when, round_up=False):
+        """datetime -> 格子索引 (夾在 [0, size] 之間)"""
+        cells = (when - self.start) / self.res
+        cells = math.ceil(cells) if round_up else math.floor(cells)
+        return min(max(cells, 0), self.size)
+
+    def time_at(self, index):
+        return (self.start + index * self.res).astimezone(self.calendar.tz)
+
+    def cells_for(self, minutes):
+        return math.ceil(minutes / self.calendar.resolution_minutes)
+
+    def trim(self, pieces, minutes):
+        """格子數進位多出的部分從最後一段的結尾扣掉，讓事件總長度等於任務時長 (格子仍整格保留)"""
+        excess = self.cells_for(minutes) * self.res - dt.timedelta(minutes=minutes)
+        if not pieces or not excess:
+            return pieces
+        start, end = pieces[-1]
+        return [*pieces[:-1], (start, end - excess)]
+
+    def deadline_index(self, due):
+        """工作軸上在 due 之前結束的格子數"""
+        return int(np.searchsorted(self.work_cells, self.index(due), side='left'))
+
+    def to_pieces(self, first, last):
+        """工作軸範圍 [first, last) -> 實際時段列表 (遇到午休等不連續處會分段)"""
+        cells = self.work_cells[first:last]
+        cuts = np.flatnonzero(np.diff(cells) != 1) + 1
+        return [(self.time_at(int(run[0])), self.time_at(int(run[-1]) + 1)) for run in np.split(cells, cuts)]
+
+    # --- 忙碌時段 ---
+    def paint(self, intervals):
+        """將忙碌時段畫進格子 (向量化差分陣列)"""
+        if not intervals:
+            return
+        starts = np.array([self.index(s) for s, _ in intervals], dtype=np.int64)
+        ends = np.array([self.index(e, round_up=True) for _, e in intervals], dtype=np.int64)
+        keep = starts < ends
+        diff = np.zeros(self.size + 1, dtype=np.int32)
+        np.add.at(diff, starts[keep], 1)
+        np.add.at(diff, ends[keep], -1)
+        self.busy |= np.cumsum(diff[:-1]) > 0
+
+    def reserve(self, pieces):
+        for start, end in pieces:
+            self.busy[self.index(start):self.index(end, round_up=True)] = True
+
+    def is_free(self, pieces):
+        """這些時段是否都落在工作時間內且沒有被佔用 (已過去的部分不計)"""
+        for start, end in pieces:
+            a, b = self.index(start), self.index(end, round_up=True)
+            if not (self.working[a:b].all() and not self.busy[a:b].any()):
+                return False
+        return True
+
+    def free_on_work_axis(self):
+        return ~self.busy[self.work_cells]
+
+    # --- 查詢 ---
+    def first_fit(self, minutes, deadline):
+        """
+        Earliest run of enough free working cells that ends by the deadline and
+        stays within one day. Returns the pieces or None.
+        """
+        k = self.cells_for(minutes)
+        hi = self.deadline_index(deadline)
+        if k <= 0 or hi < k:
+            return None
+        free = self.free_on_work_axis()[:hi].astype(np.int32)
+        breaks = self.day_break[:hi].astype(np.int32)
+        free_sum = np.concatenate(([0], np.cumsum(free)))
+        break_sum = np.concatenate(([0], np.cumsum(breaks)))
+        # 視窗 [i, i+k) 全部空閒，且 (i, i+k) 之間沒有跨日
+        candidates = (free_sum[k:] - free_sum[:-k] == k) & (break_sum[k:] - break_sum[1:hi - k + 2] == 0)
+        hits = np.flatnonzero(candidates)
+        if len(hits) == 0:
+            return None
+        first = int(hits[0])
+        return self.trim(self.to_pieces(first, first + k), minutes)
+
+    def free_runs(self):
+        """工作軸上所有連續空閒區段 [start, end)，不跨日"""
+        free = self.free_on_work_axis()
+        edges = np.diff(np.concatenate(([0], free.astype(np.int8), [0])))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        runs = []
+        day_starts = np.flatnonzero(self.day_break)
+        for s, e in zip(starts.tolist(), ends.tolist()):
+            # 在每天的第一格切開
+            lo = int(np.searchsorted(day_starts, s, side='right'))
+            hi = int(np.searchsorted(day_starts, e, side='left'))
+            for cut in day_starts[lo:hi].tolist():
+                runs.append([s, cut])
+                s = cut
+            runs.append([s, e])
+        return runs
@@ -0,0 +1,184 @@
+"""
+Offline scheduler benchmark and invariant checks against FakeCalendarService.
+
+    python -m scheduler.bench                       # 各情境的效能數據
+    python -m scheduler.bench --check --seeds 50    # 隨機情境的性質檢查 (property tests)
+"""
+import argparse
+import datetime as dt
+import sys
+import time
+
+from scheduler.availability import WorkCalendar, DEFAULT_WORKING_HOURS
+from scheduler.fake_calendar import FakeCalendarService, generate_calendar, generate_tasks, TASK_DURATIONS
+from scheduler.log import ScheduleLog
+from scheduler.scheduler import PrimaryEventSnapshot, get_calendar_events_as_tasks, schedule_all_tasks, sync_calendar_tasks
+
+SCENARIOS = {
+    "normal": dict(meetings_per_day=4),
+    "dense": dict(meetings_per_day=10, calendars=3),
+    "all_day": dict(meetings_per_day=3, all_day_ratio=0.3),
+    "multi_tz": dict(meetings_per_day=5, multi_timezone=True),
+    "workweek": dict(meetings_per_day=4),
+}
+# 性質檢查另外加入不是 5 分鐘倍數的時長 (例如前端的 0.33 小時 = 19 分鐘)，事件長度不能被格子進位
+CHECK_DURATIONS = (*TASK_DURATIONS, 19, 50, 97)
+
+
+def scenario_calendar(scenario, now):
+    if scenario == "workweek":
+        # 週末休假，外加一天國定假日
+        weekly_hours = {weekday: DEFAULT_WORKING_HOURS if weekday < 5 else None for weekday in range(7)}
+        return WorkCalendar(tz=now.tzinfo, weekly_hours=weekly_hours, holidays=[(now + dt.timedelta(days=2)).date()])
+    return WorkCalendar(tz=now.tzinfo)
+
+
+def _parse(value):
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return dt.datetime.fromisoformat(value)
+
+
+def _busy_intervals(service, tz):
+    """與排程器相同的規則計算既有的忙碌時段 (全天事件以當地日期計算)"""
+    busy = []
+    for calendar in service.calendars.values():
+        for event in calendar["events"]:
+            if event.get('_inserted') or event.get('transparency') == 'transparent' or event.get('status') == 'cancelled':
+                continue
+            if 'dateTime' in event['start']:
+                busy.append((_parse(event['start']['dateTime']), _parse(event['end']['dateTime'])))
+            else:
+                start = dt.datetime.fromisoformat(event['start']['date']).replace(tzinfo=tz)
+                busy.append((start, start + dt.timedelta(days=1)))
+    return busy
+
+
+def check_invariants(service, tasks, results, calendar):
+    """Return a list of violated invariants for one scheduling run."""
+    violations = []
+    tz = calendar.tz
+    created = sorted((_parse(e['start']['dateTime']).astimezone(tz), _parse(e['end']['dateTime']).astimezone(tz),
+                      e['summary']) for e in service.inserted_events())
+
+    # 1. 新建事件彼此不重疊
+    for (s1, e1, n1), (s2, e2, n2) in zip(created, created[1:]):
+        if s2 < e1:
+            violations.append(f"overlap: '{n1}' {s1:%m-%d %H:%M}-{e1:%H:%M} / '{n2}' {s2:%m-%d %H:%M}")
+
+    busy = _busy_intervals(service, tz)
+    for start, end, name in created:
+        # 2. 不與既有的忙碌事件重疊
+        for b_start, b_end in busy:
+            if start < b_end and b_start < end:
+                violations.append(f"busy conflict: '{name}' {start:%m-%d %H:%M}-{end:%H:%M}")
+                break
+        # 3. 落在當天的某個工作時段內 (工作時間、非午休、非假日)
+        if not any(p_start <= start and end <= p_end for p_start, p_end in calendar.working_periods(start.date())):
+            violations.append(f"outside working time: '{name}' {start:%a %m-%d %H:%M}-{end:%H:%M}")
+
+    # 4. 成功的任務在截止前完成，且總時長正確
+    by_name = {t['name']: t for t in tasks}
+    for entry in results["successful"]:
+        task = by_name[entry['name']]
+        if dt.datetime.fromisoformat(entry['end']) > task['due_date']:
+            violations.append(f"past due: '{entry['name']}'")
+        pieces = [(s, e) for s, e, n in created if n == task['name'] or n.startswith(f"{task['name']} (部分 ")]
+        total = sum((e - s).total_seconds() for s, e in pieces) / 60
+        if abs(total - task['duration_minutes']) > 1e-6:
+            violations.append(f"duration mismatch: '{entry['name']}' {total:.0f} != {task['duration_minutes']}")
+
+    # 5. 最佳化排程排入的任務不少於同一個行事曆上的貪婪排程
+    stats = results.get("optimizer")
+    if stats and len(results["successful"]) < stats["greedy_placed"]:
+        violations.append(f"optimized placed {len(results['successful'])} < greedy {stats['greedy_placed']}")
+    return violations
+
+
+def run_once(scenario, mode, task_count, horizon_days, latency_ms, seed, durations=TASK_DURATIONS):
+    now = dt.datetime.now().astimezone()
+    calendar = scenario_calendar(scenario, now)
+    service = FakeCalendarService(latency_ms=latency_ms)
+    generate_calendar(service, now, horizon_days + 1, seed=seed, **SCENARIOS[scenario])
+    tasks = generate_tasks(now, task_count, horizon_days, seed=seed, durations=durations)
+
+    log = ScheduleLog()
+    started = time.perf_counter()
+    results = schedule_all_tasks(service, tasks, log=log, mode=mode, calendar=calendar)
+    wall = time.perf_counter() - started
+    calls = dict(service.calls)
+
+    # 相同的任務列表再排一次 (與 /schedule-and-sync 相同流程)：增量排程不應該有任何寫入，
+    # 且由 snapshot 組出的同步結果必須與完整讀取一致
+    service.reset_calls()
+    sync_log = ScheduleLog()
+    snapshot = PrimaryEventSnapshot(now, now + dt.timedelta(days=horizon_days + 1))
+    rerun = schedule_all_tasks(service, tasks, log=sync_log, mode=mode, calendar=calendar, snapshot=snapshot)
+    synced = sync_calendar_tasks(service, snapshot, log=sync_log)
+    violations = check_invariants(service, tasks, results, calendar)
+    if rerun["writes"]:
+        violations.append(f"rerun wrote events: {rerun['writes']}")
+    if synced != get_calendar_events_as_tasks(service, snapshot.start, snapshot.end, log=ScheduleLog()):
+        violations.append("synced tasks differ from a full calendar read")
+    return {
+        "scenario": scenario,
+        "mode": mode,
+        "tasks": task_count,
+        "placed": len(results["successful"]),
+        "wall_sec": wall,
+        "tasks_per_sec": task_count / wall if wall else float('inf'),
+        "api_calls": sum(calls.values()),
+        "calls": calls,
+        "rerun_api_calls": service.total_calls(),
+        "timings": log.timings,
+        "violations": violations,
+    }
+
+
+def benchmark(args):
+    print(f"{'scenario':<10} {'mode':<10} {'tasks':>6} {'placed':>7} {'wall(s)':>9} {'tasks/s':>9} {'API calls':>10} {'rerun':>6}  phases")
+    for scenario in args.scenarios:
+        for mode in args.modes:
+            r = run_once(scenario, mode, args.tasks, args.days, args.latency_ms, args.seed)
+            phases = ", ".join(f"{k}={v['seconds']:.3f}s" for k, v in r["timings"].items())
+            print(f"{r['scenario']:<10} {r['mode']:<10} {r['tasks']:>6} {r['placed']:>7} {r['wall_sec']:>9.3f} "
+                  f"{r['tasks_per_sec']:>9.1f} {r['api_calls']:>10} {r['rerun_api_calls']:>6}  {phases}")
+            for v in r["violations"]:
+                print(f"    ! {v}")
+
+
+def check(args):
+    failures = 0
+    for seed in range(args.seeds):
+        for scenario in args.scenarios:
+            for mode in args.modes:
+                r = run_once(scenario, mode, args.tasks, args.days, 0, seed, durations=CHECK_DURATIONS)
+                if r["violations"]:
+                    failures += 1
+                    print(f"[FAIL] seed={seed} scenario={scenario} mode={mode}")
+                    for v in r["violations"][:5]:
+                        print(f"    {v}")
+    runs = args.seeds * len(args.scenarios) * len(args.modes)
+    print(f"{runs - failures}/{runs} runs satisfied all invariants.")
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline scheduler benchmark with a fake Calendar backend")
+    parser.add_argument("--tasks", type=int, default=30)
+    parser.add_argument("--days", type=int, default=14, help="planning horizon in days")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated latency per API call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--modes", nargs="+", default=["greedy", "optimized"], choices=["greedy", "optimized"])
+    parser.add_argument("--check", action="store_true", help="run invariant checks over many seeds")
+    parser.add_argument("--seeds", type=int, default=20)
+    args = parser.parse_args(argv)
+    if args.check:
+        return check(args)
+    benchmark(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
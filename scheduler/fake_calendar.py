@@ -0,0 +1,260 @@
+import datetime as dt
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+
+# --- 離線用的假 Google Calendar 後端 ---
+# 只實作排程器會用到的呼叫：calendarList().list、events().list/insert/patch/delete、freebusy().query
+
+TASK_DURATIONS = (30, 45, 60, 90, 120, 180, 240)   # generate_tasks 預設的任務時長 (分鐘)
+
+
+def _parse(value):
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return dt.datetime.fromisoformat(value)
+
+
+def _event_bounds(event):
+    start, end = event['start'], event['end']
+    if 'dateTime' in start:
+        return _parse(start['dateTime']), _parse(end['dateTime'])
+    # 全天事件以 UTC 午夜近似，足以判斷是否落在查詢範圍內
+    return (dt.datetime.fromisoformat(start['date']).replace(tzinfo=dt.timezone.utc),
+            dt.datetime.fromisoformat(end['date']).replace(tzinfo=dt.timezone.utc))
+
+
+class _Request:
+    def __init__(self, backend, method, fn):
+        self._backend = backend
+        self._method = method
+        self._fn = fn
+
+    def execute(self):
+        self._backend.record_call(self._method)
+        return self._fn()
+
+
+class _CalendarListResource:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def list(self, **kwargs):
+        items = [{"id": cal_id, "summary": cal["summary"], "primary": cal_id == "primary"}
+                 for cal_id, cal in self._backend.calendars.items()]
+        return _Request(self._backend, "calendarList.list", lambda: {"items": items})
+
+
+class _EventsResource:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def list(self, calendarId, timeMin=None, timeMax=None, singleEvents=True, orderBy=None,
+             pageToken=None, maxResults=None, updatedMin=None, showDeleted=False, privateExtendedProperty=None,
+             **kwargs):
+        return _Request(self._backend, "events.list",
+                        lambda: self._backend.list_events(calendarId, timeMin, timeMax, pageToken, maxResults,
+                                                          updatedMin, showDeleted, privateExtendedProperty))
+
+    def insert(self, calendarId, body, **kwargs):
+        return _Request(self._backend, "events.insert", lambda: self._backend.insert_event(calendarId, body))
+
+    def patch(self, calendarId, eventId, body, **kwargs):
+        return _Request(self._backend, "events.patch", lambda: self._backend.patch_event(calendarId, eventId, body))
+
+    def delete(self, calendarId, eventId, **kwargs):
+        return _Request(self._backend, "events.delete", lambda: self._backend.delete_event(calendarId, eventId))
+
+
+class _FreeBusyResource:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def query(self, body):
+        return _Request(self._backend, "freebusy.query", lambda: self._backend.query_freebusy(body))
+
+
+class FakeCalendarService:
+    """
+    In-memory stand-in for the googleapiclient Calendar service. Every
+    execute() sleeps for the configured latency and is counted per method, so
+    benchmarks can report API calls per schedule without a Google account.
+    """
+
+    def __init__(self, latency_ms=0.0, page_size=250, limiter=None, user=None):
+        self.latency_sec = latency_ms / 1000.0
+        # 與 tenants.LimitedHttpRequest 相同: 每次呼叫先取得該使用者的配額
+        self.limiter = limiter
+        self.user = user
+        self.page_size = page_size
+        self.calendars = {"primary": {"summary": "Primary", "events": []}}
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    # --- googleapiclient 介面 ---
+    def calendarList(self):
+        return _CalendarListResource(self)
+
+    def events(self):
+        return _EventsResource(self)
+
+    def freebusy(self):
+        return _FreeBusyResource(self)
+
+    # --- 測試輔助 ---
+    def add_calendar(self, cal_id, summary=None):
+        self.calendars.setdefault(cal_id, {"summary": summary or cal_id, "events": []})
+
+    def add_event(self, cal_id, event):
+        self.add_calendar(cal_id)
+        event = dict(event)
+        event.setdefault('id', f"fake{next(self._ids)}")
+        event.setdefault('created', dt.datetime.now(dt.timezone.utc).isoformat())
+        event.setdefault('updated', event['created'])
+        self.calendars[cal_id]["events"].append(event)
+        return event
+
+    def record_call(self, method):
+        with self._lock:
+            self.calls[method] += 1
+        if self.limiter is not None:
+            with self.limiter.slot(self.user):
+                if self.latency_sec:
+                    time.sleep(self.latency_sec)
+        elif self.latency_sec:
+            time.sleep(self.latency_sec)
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def reset_calls(self):
+        self.calls.clear()
+
+    def inserted_events(self):
+        return [e for e in self.calendars["primary"]["events"] if e.get('_inserted') and e.get('status') != 'cancelled']
+
+    # --- 實作 ---
+    def list_events(self, cal_id, time_min, time_max, page_token=None, max_results=None, updated_min=None,
+                    show_deleted=False, private_property=None):
+        lo = _parse(time_min) if time_min else None
+        # privateExtendedProperty='name=value'
+        prop = tuple(private_property.split('=', 1)) if private_property else None
+        hi = _parse(time_max) if time_max else None
+        since = _parse(updated_min) if updated_min else None
+        # 與 Google 相同: 指定 updatedMin 時一律包含已刪除的事件
+        show_deleted = show_deleted or since is not None
+        matched = []
+        for event in self.calendars[cal_id]["events"]:
+            if event.get('status') == 'cancelled' and not show_deleted:
+                continue
+            if since is not None and _parse(event['updated']) < since:
+                continue
+            if prop is not None and event.get('extendedProperties', {}).get('private', {}).get(prop[0]) != prop[1]:
+                continue
+            start, end = _event_bounds(event)
+            if (hi is None or start < hi) and (lo is None or end > lo):
+                matched.append((start, event))
+        matched.sort(key=lambda item: item[0])
+        size = max_results or self.page_size
+        offset = int(page_token or 0)
+        page = [dict(e) for _, e in matched[offset:offset + size]]
+        result = {"items": page}
+        if offset + size < len(matched):
+            result["nextPageToken"] = str(offset + size)
+        return result
+
+    def insert_event(self, cal_id, body):
+        event = dict(body)
+        event['_inserted'] = True
+        return dict(self.add_event(cal_id, event))
+
+    def _find_event(self, cal_id, event_id):
+        for event in self.calendars[cal_id]["events"]:
+            if event['id'] == event_id:
+                return event
+        raise KeyError(f"event not found: {event_id}")
+
+    def patch_event(self, cal_id, event_id, body):
+        event = self._find_event(cal_id, event_id)
+        event.update(body)
+        event['updated'] = dt.datetime.now(dt.timezone.utc).isoformat()
+        return dict(event)
+
+    def delete_event(self, cal_id, event_id):
+        # 保留已刪除的事件 (status=cancelled)，讓 updatedMin 查詢能回傳刪除紀錄
+        event = self._find_event(cal_id, event_id)
+        event['status'] = 'cancelled'
+        event['updated'] = dt.datetime.now(dt.timezone.utc).isoformat()
+        return ""
+
+    def query_freebusy(self, body):
+        lo, hi = _parse(body['timeMin']), _parse(body['timeMax'])
+        result = {}
+        for item in body.get('items', []):
+            busy = []
+            for event in self.calendars.get(item['id'], {"events": []})["events"]:
+                if event.get('transparency') == 'transparent' or event.get('status') == 'cancelled':
+                    continue
+                start, end = _event_bounds(event)
+                if start < hi and end > lo:
+                    busy.append({"start": max(start, lo).isoformat(), "end": min(end, hi).isoformat()})
+            result[item['id']] = {"busy": sorted(busy, key=lambda b: b['start'])}
+        return {"kind": "calendar#freeBusy", "calendars": result}
+
+
+# --- 合成行事曆產生器 ---
+TIMEZONES = [dt.timezone(dt.timedelta(hours=8)), dt.timezone.utc, dt.timezone(dt.timedelta(hours=-5)),
+             dt.timezone(dt.timedelta(hours=9))]
+
+
+def generate_calendar(service, start, days, meetings_per_day=4, all_day_ratio=0.05, calendars=2,
+                      multi_timezone=False, transparent_ratio=0.1, seed=0):
+    """
+    Fill a FakeCalendarService with synthetic events over `days` days from
+    `start`: meetings within and around working hours, some all-day events,
+    some transparent (free) events and optionally event times written in
+    other timezones or with a 'Z' suffix.
+    """
+    rng = random.Random(seed)
+    cal_ids = ["primary"] + [f"team{i}@example.com" for i in range(1, calendars)]
+    for cal_id in cal_ids:
+        service.add_calendar(cal_id)
+
+    day0 = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    for day in range(days):
+        date = day0 + dt.timedelta(days=day)
+        if rng.random() < all_day_ratio:
+            service.add_event(rng.choice(cal_ids), {
+                "summary": "全天活動",
+                "start": {"date": date.date().isoformat()},
+                "end": {"date": (date + dt.timedelta(days=1)).date().isoformat()},
+            })
+        for _ in range(meetings_per_day):
+            begin = date + dt.timedelta(hours=rng.randint(7, 19), minutes=rng.choice([0, 15, 30, 45]))
+            end = begin + dt.timedelta(minutes=rng.choice([15, 30, 45, 60, 90, 120]))
+            if multi_timezone:
+                tz = rng.choice(TIMEZONES)
+                start_str, end_str = begin.astimezone(tz).isoformat(), end.astimezone(tz).isoformat()
+                if tz is dt.timezone.utc:
+                    start_str, end_str = start_str.replace('+00:00', 'Z'), end_str.replace('+00:00', 'Z')
+            else:
+                start_str, end_str = begin.isoformat(), end.isoformat()
+            event = {"summary": "會議", "start": {"dateTime": start_str}, "end": {"dateTime": end_str}}
+            if rng.random() < transparent_ratio:
+                event["transparency"] = "transparent"
+            service.add_event(rng.choice(cal_ids), event)
+    return service
+
+
+def generate_tasks(now, count, horizon_days, seed=0, durations=TASK_DURATIONS):
+    """產生排程器格式的隨機待辦事項"""
+    rng = random.Random(seed)
+    return [{
+        "name": f"任務 {i + 1}",
+        "duration_minutes": rng.choice(durations),
+        "due_date": now + dt.timedelta(hours=rng.randint(4, horizon_days * 24)),
+        "priority": rng.choice(['高', '中', '低']),
+    } for i in range(count)]
@@ -0,0 +1,114 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 設定 ---
+MAX_CONCURRENT_JOBS = 2      # 同時執行的排程工作數
+MAX_PENDING_JOBS = 16        # 排隊 + 執行中的上限，超過則拒絕
+KEEP_FINISHED_JOBS = 100     # 保留多少筆已完成工作供查詢
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class SchedulerJob:
+    def __init__(self, job_id, key=None, owner=None):
+        self.id = job_id
+        self.key = key
+        self.owner = owner           # 多使用者: 只有該使用者 (或管理金鑰) 可以查詢
+        self.status = "queued"       # queued / running / done / failed
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+
+    def report_progress(self, done, total):
+        self.done = done
+        self.total = total
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": {"done": self.done, "total": self.total},
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class SchedulerJobManager:
+    """
+    Runs blocking scheduling work on a bounded thread pool so the API event
+    loop never waits on Google Calendar. Jobs can be awaited directly via
+    job.future or polled by id. Submissions with the same key while a job is
+    queued or running share that job (single-flight) instead of running twice.
+    """
+
+    def __init__(self, max_workers=MAX_CONCURRENT_JOBS, max_pending=MAX_PENDING_JOBS, keep_finished=KEEP_FINISHED_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scheduler-job")
+        self._max_pending = max_pending
+        self._keep_finished = keep_finished
+        self._jobs = {}
+        self._inflight = {}          # key -> 排隊或執行中的工作
+        self._finished_order = []
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, key=None, owner=None, **kwargs):
+        """
+        fn 會以 progress=job.report_progress 關鍵字參數被呼叫。
+        若提供 key 且相同 key 的工作仍在排隊或執行中，直接回傳該工作。
+        job id 是完整的隨機 uuid，無法由其他工作的 id 推測。
+        """
+        with self._lock:
+            if key is not None and key in self._inflight:
+                return self._inflight[key]
+            if self._pending >= self._max_pending:
+                raise JobQueueFull(f"已有 {self._pending} 個排程工作在等待或執行中")
+            self._pending += 1
+            job = SchedulerJob(uuid.uuid4().hex, key=key, owner=owner)
+            # future 要在工作可被其他請求共用之前建立；_run 結束時才需要這把鎖，這裡不會死結
+            job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._inflight[key] = job
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(*args, progress=job.report_progress, **kwargs)
+            job.status = "done"
+            return job.result
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            raise
+        finally:
+            job.finished_at = time.time()
+            self._finish(job)
+
+    def _finish(self, job):
+        with self._lock:
+            self._pending -= 1
+            if job.key is not None and self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+            self._finished_order.append(job.id)
+            while len(self._finished_order) > self._keep_finished:
+                self._jobs.pop(self._finished_order.pop(0), None)
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,79 @@
+import time
+from contextlib import contextmanager
+
+DEBUG = "debug"
+INFO = "info"
+WARNING = "warning"
+ERROR = "error"
+
+# phase_hook(name, start, end) 在每個階段結束時被呼叫 (perf_counter 時間)，供外部 profiler 使用
+_phase_hook = None
+
+
+def set_phase_hook(hook):
+    global _phase_hook
+    _phase_hook = hook
+
+
+class ScheduleLog:
+    """
+    Per-call log collector for a scheduling run. Each scheduler function takes
+    one explicitly, so concurrent runs never share state. Records carry a level,
+    a timestamp and the current phase; phase() also accumulates self-time per
+    phase (nested phases are subtracted from their parent).
+    """
+
+    def __init__(self, echo=False):
+        self.echo = echo
+        self.records = []
+        self.timings = {}
+        self._phase_stack = []   # [name, start, child_time]
+
+    def log(self, level, message, **fields):
+        record = {
+            "level": level,
+            "message": message,
+            "time": time.time(),
+            "phase": self._phase_stack[-1][0] if self._phase_stack else None,
+        }
+        if fields:
+            record["fields"] = fields
+        self.records.append(record)
+        if self.echo:
+            print(message)
+
+    def debug(self, message, **fields):
+        self.log(DEBUG, message, **fields)
+
+    def info(self, message, **fields):
+        self.log(INFO, message, **fields)
+
+    def warning(self, message, **fields):
+        self.log(WARNING, message, **fields)
+
+    def error(self, message, **fields):
+        self.log(ERROR, message, **fields)
+
+    @contextmanager
+    def phase(self, name):
+        frame = [name, time.perf_counter(), 0.0]
+        self._phase_stack.append(frame)
+        try:
+            yield
+        finally:
+            self._phase_stack.pop()
+            end = time.perf_counter()
+            elapsed = end - frame[1]
+            stats = self.timings.setdefault(name, {"count": 0, "seconds": 0.0})
+            stats["count"] += 1
+            stats["seconds"] += elapsed - frame[2]
+            if self._phase_stack:
+                self._phase_stack[-1][2] += elapsed
+            if _phase_hook is not None:
+                _phase_hook(name, frame[1], end)
+
+    def lines(self):
+        return [r["message"] for r in self.records]
+
+    def to_dict(self):
+        return {"records": self.records, "timings": self.timings}
@@ -0,0 +1,239 @@
+import time
+
+# --- 設定 ---
+MIN_CHUNK_MINUTES = 30            # 分段排程時每段至少幾分鐘
+OPTIMIZE_TIME_BUDGET_SEC = 1.0    # 最佳化排程的時間預算
+PRIORITY_RANK = {'高': 1, '中': 2, '低': 3}
+
+# 時間以 AvailabilityGrid 工作軸上的格子索引 (int) 表示：只包含可工作的格子，
+# 連續區段可跨越午休但不跨日，比直接用 datetime 運算快得多
+
+
+def _place_one(windows, due, need, allow_split, min_chunk):
+    """Place one task at its earliest spot. Returns pieces and consumes windows, or None."""
+    if not allow_split:
+        # 與貪婪排程相同的規則: 同一天內連續的工作時間 (跨午休時自動分段)
+        for w in windows:
+            start, end = w
+            if start + need > due:
+                return None
+            if start + need <= end:
+                w[0] = start + need
+                return [(start, start + need)]
+        return None
+
+    pieces = []
+    remaining = need
+    for w in windows:
+        start = w[0]
+        if start >= due:
+            break
+        available = min(w[1], due) - start
+        if available <= 0:
+            continue
+        amount = min(remaining, available)
+        if amount < remaining and amount < min_chunk:
+            continue
+        pieces.append((w, start, start + amount))
+        remaining -= amount
+        if remaining <= 0:
+            for window, _, new_start in pieces:
+                window[0] = new_start
+            return [(s, e) for _, s, e in pieces]
+    return None
+
+
+def _drop_used(windows):
+    # 時段由前往後填滿，移除最前面已用完的時段以免每次重新掃描
+    while windows and windows[0][0] >= windows[0][1]:
+        windows.pop(0)
+
+
+def _place_all(items, windows, allow_split, min_chunk):
+    """Place items in order into a copy of windows. Returns ({index: pieces}, [failed indexes], windows)."""
+    windows = [w[:] for w in windows]
+    placed, failed = {}, []
+    for index, item in enumerate(items):
+        pieces = _place_one(windows, item.due, item.need, allow_split, min_chunk)
+        if pieces is None:
+            failed.append(index)
+        else:
+            placed[index] = pieces
+            _drop_used(windows)
+    return placed, failed, windows
+
+
+def _select(order, windows, allow_split, min_chunk, deadline):
+    """
+    Moore-Hodgson style selection: add tasks in the given order and, whenever
+    the next one does not fit, drop the cheapest accepted task (lowest
+    priority, then longest) and re-place the rest. Dropped tasks are retried
+    afterwards while budget remains.
+    """
+    position = {id(x): i for i, x in enumerate(order)}
+    accepted, dropped = [], []
+    remaining = [w[:] for w in windows]
+    budget_exhausted = False
+
+    for item in order:
+        if time.perf_counter() > deadline:
+            budget_exhausted = True
+            dropped.append(item)
+            continue
+        # 依序加入時只需放置新任務，前面的安排不受影響
+        if _place_one(remaining, item.due, item.need, allow_split, min_chunk) is not None:
+            accepted.append(item)
+            _drop_used(remaining)
+            continue
+        accepted.append(item)
+        worst = max(accepted, key=lambda x: (x.rank, x.need))
+        accepted.remove(worst)
+        dropped.append(worst)
+        if worst is not item:
+            placed, failed, remaining = _place_all(accepted, windows, allow_split, min_chunk)
+            dropped.extend(accepted[i] for i in failed)
+            accepted = [accepted[i] for i in sorted(placed)]
+
+    rejected = []
+    failures = []   # 上次成功後失敗過的 (due, need)；截止更早且更長的任務必定也放不下
+    for item in sorted(dropped, key=lambda x: (x.rank, x.need)):
+        if time.perf_counter() > deadline:
+            budget_exhausted = True
+            rejected.append(item)
+            continue
+        if any(item.due <= due and item.need >= need for due, need in failures):
+            rejected.append(item)
+            continue
+        trial = sorted(accepted + [item], key=lambda x: position[id(x)])
+        _, failed, _ = _place_all(trial, windows, allow_split, min_chunk)
+        if failed:
+            rejected.append(item)
+            failures.append((item.due, item.need))
+        else:
+            accepted = trial
+            failures = []
+
+    placed, failed, _ = _place_all(accepted, windows, allow_split, min_chunk)
+    plan = [(accepted[i], pieces) for i, pieces in placed.items()]
+    rejected.extend(accepted[i] for i in failed)
+    return plan, rejected, budget_exhausted
+
+
+class _Item:
+    __slots__ = ("task", "due", "need", "rank")
+
+    def __init__(self, task, grid):
+        self.task = task
+        self.due = grid.deadline_index(task['due_date'])
+        self.need = grid.cells_for(task['duration_minutes'])
+        self.rank = PRIORITY_RANK[task['priority']]
+
+
+def _leftover(windows, plan):
+    """Free windows that remain after the plan's pieces are taken out."""
+    pieces = sorted(piece for _, item_pieces in plan for piece in item_pieces)
+    free = []
+    i = 0
+    for start, end in windows:
+        while i < len(pieces) and pieces[i][1] <= start:
+            i += 1
+        cursor = start
+        while i < len(pieces) and pieces[i][0] < end:
+            if pieces[i][0] > cursor:
+                free.append([cursor, pieces[i][0]])
+            cursor = max(cursor, pieces[i][1])
+            i += 1
+        if cursor < end:
+            free.append([cursor, end])
+    return free
+
+
+def _fill(plan, rejected, windows, allow_split, min_chunk):
+    # 最後把剩下的任務放進方案留下的空檔 (不分段的方案常留下可分段使用的零碎時段)
+    free = _leftover(windows, plan)
+    still_rejected = []
+    for item in sorted(rejected, key=lambda x: (x.rank, x.need)):
+        pieces = _place_one(free, item.due, item.need, allow_split, min_chunk)
+        if pieces is None:
+            still_rejected.append(item)
+        else:
+            plan.append((item, pieces))
+            _drop_used(free)
+    return plan, still_rejected
+
+
+def _min_slack_order(items, windows):
+    # slack = 截止前可用的工作時間 - 任務所需時間
+    cumulative = [0]
+    for start, end in windows:
+        cumulative.append(cumulative[-1] + (end - start))
+
+    def capacity(due):
+        for i, (start, end) in enumerate(windows):
+            if end >= due:
+                return cumulative[i] + max(0, due - start)
+        return cumulative[-1]
+
+    return sorted(items, key=lambda x: (capacity(x.due) - x.need, x.rank))
+
+
+def _score(plan):
+    # 放入越多越好；同數量時以高優先級較多者為佳
+    return (len(plan), -sum(x.rank for x, _ in plan))
+
+
+def plan_optimized(tasks, grid, allow_split=True, min_chunk_minutes=MIN_CHUNK_MINUTES,
+                   time_budget_sec=OPTIMIZE_TIME_BUDGET_SEC):
+    """
+    Plan all tasks over the grid's free working time without touching the
+    calendar. Tries EDF and min-slack orderings, with and without splitting,
+    within the time budget and keeps the plan that places the most tasks;
+    the greedy priority-order plan is always a candidate, so the result
+    never places fewer tasks than greedy. Returns a dict with the plan
+    [(task, [(start, end), ...])], the rejected tasks and a comparison with
+    the greedy priority order. The grid itself is not modified.
+    """
+    started = time.perf_counter()
+    deadline = started + time_budget_sec
+    if not tasks:
+        return {"plan": [], "rejected": [], "stats": {"placed": 0, "greedy_placed": 0, "extra_placed": 0,
+                                                      "elapsed_sec": 0.0, "budget_exhausted": False}}
+
+    windows = grid.free_runs()
+    items = [_Item(t, grid) for t in tasks]
+    min_chunk = grid.cells_for(min_chunk_minutes)
+
+    greedy_order = sorted(items, key=lambda x: (x.rank, x.due))
+    greedy_placed, greedy_failed, _ = _place_all(greedy_order, windows, False, 0)
+
+    # 貪婪排程本身也是候選方案，結果不會比貪婪排程少
+    best = ([(greedy_order[i], pieces) for i, pieces in greedy_placed.items()],
+            [greedy_order[i] for i in greedy_failed])
+    budget_exhausted = False
+    orders = (sorted(items, key=lambda x: (x.due, x.rank)), _min_slack_order(items, windows))
+    # 分段會佔用較早的零碎時段，有時反而放得比較少，所以也試不分段的版本
+    candidates = [(order, split) for split in dict.fromkeys((allow_split, False)) for order in orders]
+    for order, split in candidates:
+        if time.perf_counter() > deadline:
+            budget_exhausted = True
+            break
+        plan, rejected, exhausted = _select(order, windows, split, min_chunk, deadline)
+        budget_exhausted = budget_exhausted or exhausted
+        if _score(plan) > _score(best[0]):
+            best = (plan, rejected)
+
+    plan, rejected = _fill(*best, windows, allow_split, min_chunk)
+    # 依時間順序回傳，方便依序建立事件
+    plan.sort(key=lambda entry: entry[1][0][0])
+    return {
+        "plan": [(x.task, grid.trim([piece for s, e in pieces for piece in grid.to_pieces(s, e)], x.task['duration_minutes']))
+                 for x, pieces in plan],
+        "rejected": [x.task for x in rejected],
+        "stats": {
+            "placed": len(plan),
+            "greedy_placed": len(greedy_placed),
+            "extra_placed": len(plan) - len(greedy_placed),
+            "elapsed_sec": round(time.perf_counter() - started, 4),
+            "budget_exhausted": budget_exhausted,
+        },
+    }
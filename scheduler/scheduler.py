@@ -1,240 +1,620 @@
 import datetime as dt
+import hashlib
 import os.path
+import threading
+from collections import Counter, defaultdict
+import httplib2
+import google_auth_httplib2
+from google.auth.exceptions import RefreshError
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+try:
+    from scheduler.availability import AvailabilityGrid, DEFAULT_WORK_CALENDAR
+    from scheduler.log import ScheduleLog
+    from scheduler.optimizer import plan_optimized
+except ImportError:
+    # 直接在 scheduler/ 資料夾內執行 python scheduler.py 時
+    from availability import AvailabilityGrid, DEFAULT_WORK_CALENDAR
+    from log import ScheduleLog
+    from optimizer import plan_optimized
 
 # --- 設定 ---
 SCOPES = ['https://www.googleapis.com/auth/calendar.readonly', 'https://www.googleapis.com/auth/calendar.events']
-WORKING_HOURS_START = 9
-WORKING_HOURS_END = 18
-SEARCH_STEP_MINUTES = 15
-# 午休時間
-LUNCH_BREAK_START = 12
-LUNCH_BREAK_END = 13
+# 工作時間、午休、假日與時區由 availability.WorkCalendar 定義
+# 排程模式: 'greedy' 依優先級逐一放入最早空檔；'optimized' 以 EDF/最小寬裕度整體規劃
+SCHEDULER_MODES = ('greedy', 'optimized')
+# 排程器建立的事件會在 extendedProperties.private 中標記任務身分，重複排程時只更動有變化的任務
+TASK_ID_PROPERTY = 'inlistedTaskId'
+TASK_FINGERPRINT_PROPERTY = 'inlistedTaskHash'
+# privateExtendedProperty 查詢必須指定值，所以另外加上固定的標記，用來找出截止範圍之後的舊事件
+MANAGED_PROPERTY = 'inlistedManaged'
+MANAGED_FILTER = f'{MANAGED_PROPERTY}=1'
+
+# 憑證路徑 (可用環境變數覆寫，預設為本模組所在資料夾，不再依賴 CWD)
+SCHEDULER_DIR = os.path.dirname(os.path.abspath(__file__))
+TOKEN_PATH = os.environ.get('SCHEDULER_TOKEN_PATH', os.path.join(SCHEDULER_DIR, 'token.json'))
+CREDENTIALS_PATH = os.environ.get('SCHEDULER_CREDENTIALS_PATH', os.path.join(SCHEDULER_DIR, 'credentials.json'))
+TOKEN_REFRESH_MARGIN_SEC = 300   # token 到期前幾秒就先在背景刷新
+HTTP_TIMEOUT_SEC = 30
+
 
 # --- Google API 認證 ---
-def get_calendar_service():
-    creds = None
-    if os.path.exists('../scheduler/token.json'):
-        creds = Credentials.from_authorized_user_file('../scheduler/token.json', SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file('../scheduler/credentials.json', SCOPES)
+class CredentialsRequired(Exception):
+    """沒有可用的 token (或 refresh token 已被撤銷/過期)，且不允許在請求中開啟瀏覽器授權"""
+
+
+class CalendarServiceProvider:
+    """整個程序共用的 Calendar client: 只建立一次、背景刷新 token、每個執行緒一條連線；interactive=False 時不開啟瀏覽器授權"""
+
+    # 每建立一個 API 請求呼叫一次 request_hook(method_id)，供外部統計 (例如 /metrics)；所有實例共用
+    request_hook = None
+    request_class = HttpRequest   # 子類別可換成包裝過 execute() 的 HttpRequest
+    background_refresh = True     # False: 不開背景執行緒，access token 過期時由 AuthorizedHttp 在下一個請求前刷新
+
+    def __init__(self, token_path=TOKEN_PATH, credentials_path=CREDENTIALS_PATH, scopes=SCOPES, interactive=True):
+        self.token_path = token_path
+        self.credentials_path = credentials_path
+        self.scopes = scopes
+        self.interactive = interactive
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._creds = None
+        self._service = None
+        self._refresh_thread = None
+        self._stop = threading.Event()
+
+    def _load_credentials(self):
+        creds = None
+        if os.path.exists(self.token_path):
+            creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
+        if creds and not creds.valid and creds.expired and creds.refresh_token:
+            try:
+                creds.refresh(Request())
+                self._save_credentials(creds)
+            except RefreshError as e:
+                # refresh token 被撤銷或過期: 只能重新授權
+                if not self.interactive:
+                    raise CredentialsRequired(f"token at {self.token_path} can no longer be refreshed: {e}") from e
+                creds = None
+        if not creds or not creds.valid:
+            if not self.interactive:
+                raise CredentialsRequired(f"no valid token at {self.token_path}")
+            flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, self.scopes)
             creds = flow.run_local_server(port=0)
-        with open('../scheduler/token.json', 'w') as token:
+            self._save_credentials(creds)
+        return creds
+
+    def _save_credentials(self, creds):
+        with open(self.token_path, 'w') as token:
             token.write(creds.to_json())
+
+    def _thread_http(self):
+        # 每個執行緒一條持久連線 (keep-alive)，共用同一份憑證
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self._creds, http=httplib2.Http(timeout=HTTP_TIMEOUT_SEC))
+            self._local.http = http
+        return http
+
+    def _build_request(self, http, *args, **kwargs):
+        if self.request_hook is not None:
+            self.request_hook(kwargs.get('methodId'))
+        return self.request_class(self._thread_http(), *args, **kwargs)
+
+    def _seconds_until_refresh(self):
+        if self._creds is None or self._creds.expiry is None:
+            return TOKEN_REFRESH_MARGIN_SEC
+        # google-auth 的 expiry 是 naive UTC，補上時區後與其他時間一樣以 aware datetime 計算
+        expiry = self._creds.expiry
+        if expiry.tzinfo is None:
+            expiry = expiry.replace(tzinfo=dt.timezone.utc)
+        remaining = (expiry - dt.datetime.now(dt.timezone.utc)).total_seconds()
+        return max(0.0, remaining - TOKEN_REFRESH_MARGIN_SEC)
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self._seconds_until_refresh()):
+            try:
+                with self._lock:
+                    self._creds.refresh(Request())
+                    self._save_credentials(self._creds)
+            except Exception as e:
+                print(f"背景刷新 Google 憑證失敗: {e}")
+                # 避免失敗時空轉，稍後再試
+                if self._stop.wait(60):
+                    break
+
+    def get(self):
+        if self._service is not None:
+            return self._service
+        with self._lock:
+            if self._service is None:
+                self._creds = self._load_credentials()
+                self._service = build(
+                    'calendar', 'v3',
+                    http=self._thread_http(),
+                    requestBuilder=self._build_request,
+                    static_discovery=True,
+                    cache_discovery=False,
+                )
+                if self.background_refresh and self._creds.refresh_token:
+                    self._refresh_thread = threading.Thread(target=self._refresh_loop, daemon=True)
+                    self._refresh_thread.start()
+        return self._service
+
+    def close(self):
+        self._stop.set()
+        thread = self._refresh_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+
+
+# API 伺服器端使用: 不在請求中開啟瀏覽器授權 (會佔住排程執行緒)，token.json 需先以 python scheduler.py 建立
+_service_provider = CalendarServiceProvider(interactive=False)
+
+
+def set_request_hook(hook):
+    # 所有 provider (包含多使用者的 client pool) 共用同一個 hook
+    CalendarServiceProvider.request_hook = staticmethod(hook) if hook is not None else None
+
+
+def get_calendar_service():
     try:
-        service = build('calendar', 'v3', credentials=creds)
-        return service
+        return _service_provider.get()
     except HttpError as error:
         print(f'An error occurred: {error}')
         return None
 
-def get_calendar_events_as_tasks(service, start_range, end_range):
-    print("正在讀取主要行事曆的事件並轉換為任務列表...")
-    try:
-        tz = start_range.tzinfo
+def list_events(service, calendar_id, start_range, end_range, **params):
+    """
+    讀取時間範圍內的所有事件 (會跟隨 nextPageToken 讀完每一頁)；end_range 為 None 時沒有上限。
+    params 會直接傳給 events().list
+    """
+    items = []
+    page_token = None
+    params.setdefault('orderBy', 'startTime')
+    if end_range is not None:
+        params['timeMax'] = end_range.isoformat()
+    params = {k: v for k, v in params.items() if v is not None}
+    while True:
         events_result = service.events().list(
-            calendarId='primary', 
-            timeMin=start_range.isoformat(), 
-            timeMax=end_range.isoformat(),
-            singleEvents=True, 
-            orderBy='startTime'
+            calendarId=calendar_id, timeMin=start_range.isoformat(),
+            singleEvents=True, pageToken=page_token, **params
         ).execute()
-        
-        calendar_events = events_result.get('items', [])
-        tasks_list = []
-
-        for event in calendar_events:
-            # 忽略全天事件或沒有明確時間的事件
-            if 'dateTime' not in event['start']:
-                continue
-
-            start_time_str = event['start'].get('dateTime')
-            end_time_str = event['end'].get('dateTime')
-            
-            # 確保時區正確
-            start_time = dt.datetime.fromisoformat(start_time_str).astimezone(tz)
-            end_time = dt.datetime.fromisoformat(end_time_str).astimezone(tz)
-            duration_hours = (end_time - start_time).total_seconds() / 3600
-
-            tasks_list.append({
-                "id": event['id'],  # 使用事件ID作為唯一標識
-                "name": event.get('summary', '無標題事件'),
-                "deadline": end_time.isoformat(), # 使用結束時間作為截止日期
-                "startTime": start_time.isoformat(), # 額外提供開始時間
-                "priority": 'medium', # 預設優先級，因為行事曆事件沒有這個屬性
-                "duration": round(duration_hours, 2),
-                "completed": False, # 預設都是未完成
-                "createdAt": event.get('created'),
-                "source": "calendar" # 標記來源
-            })
-            
-        print(f"成功讀取並轉換了 {len(tasks_list)} 個事件。")
+        items.extend(events_result.get('items', []))
+        page_token = events_result.get('nextPageToken')
+        if not page_token:
+            return items
+
+def events_to_tasks(calendar_events, tz):
+    """將事件轉換為前端的任務格式 (依開始時間排序)"""
+    tasks_list = []
+    for event in calendar_events:
+        # 忽略全天事件或沒有明確時間的事件
+        if 'dateTime' not in event['start']:
+            continue
+
+        start_time_str = event['start'].get('dateTime')
+        end_time_str = event['end'].get('dateTime')
+        if start_time_str.endswith('Z'):
+            start_time_str = start_time_str.replace('Z', '+00:00')
+        if end_time_str.endswith('Z'):
+            end_time_str = end_time_str.replace('Z', '+00:00')
+
+        # 確保時區正確
+        start_time = dt.datetime.fromisoformat(start_time_str).astimezone(tz)
+        end_time = dt.datetime.fromisoformat(end_time_str).astimezone(tz)
+        duration_hours = (end_time - start_time).total_seconds() / 3600
+
+        tasks_list.append({
+            "id": event['id'],  # 使用事件ID作為唯一標識
+            "name": event.get('summary', '無標題事件'),
+            "deadline": end_time.isoformat(), # 使用結束時間作為截止日期
+            "startTime": start_time.isoformat(), # 額外提供開始時間
+            "priority": 'medium', # 預設優先級，因為行事曆事件沒有這個屬性
+            "duration": round(duration_hours, 2),
+            "completed": False, # 預設都是未完成
+            "createdAt": event.get('created'),
+            "source": "calendar" # 標記來源
+        })
+    tasks_list.sort(key=lambda t: t['startTime'])
+    return tasks_list
+
+def get_calendar_events_as_tasks(service, start_range, end_range, log=None):
+    log = log or ScheduleLog(echo=True)
+    log.info("正在讀取主要行事曆的事件並轉換為任務列表...")
+    try:
+        calendar_events = list_events(service, 'primary', start_range, end_range)
+        tasks_list = events_to_tasks(calendar_events, start_range.tzinfo)
+        log.info(f"成功讀取並轉換了 {len(tasks_list)} 個事件。", count=len(tasks_list))
         return tasks_list
 
     except HttpError as e:
-        print(f"讀取主要行事曆事件時發生錯誤: {e}")
+        log.error(f"讀取主要行事曆事件時發生錯誤: {e}")
         return []
 
+
+class PrimaryEventSnapshot:
+    """主要行事曆在 [start, end) 的本地副本: 排程時讀到的事件加上排程器自己的寫入，同步時只查詢之後的變更"""
+
+    # 與伺服器時鐘的誤差容忍；多抓到幾筆變更無妨
+    CLOCK_SKEW_SEC = 60
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.events = {}
+        self.fetched_at = None
+
+    def mark_fetched(self):
+        self.fetched_at = dt.datetime.now(dt.timezone.utc)
+
+    def apply(self, event):
+        if event.get('status') == 'cancelled':
+            self.events.pop(event['id'], None)
+        else:
+            self.events[event['id']] = event
+
+    def remove(self, event_id):
+        self.events.pop(event_id, None)
+
+    def refresh(self, service, log):
+        """讀取排程後被修改或刪除的事件 (包含其他裝置的變更)，回傳變更筆數"""
+        updated_min = self.fetched_at - dt.timedelta(seconds=self.CLOCK_SKEW_SEC)
+        changed = list_events(service, 'primary', self.start, self.end, orderBy=None,
+                              updatedMin=updated_min.isoformat(), showDeleted=True)
+        for event in changed:
+            self.apply(event)
+        log.info(f"行事曆差異檢查: {len(changed)} 筆變更。", changed=len(changed))
+        return len(changed)
+
+    def to_tasks(self):
+        return events_to_tasks(self.events.values(), self.start.tzinfo)
+
+
+def sync_calendar_tasks(service, snapshot, log=None):
+    """
+    回傳主要行事曆在 snapshot 範圍內的事件 (前端任務格式)。排程時已讀過行事曆
+    則只做差異檢查，否則 (例如沒有任何待排任務) 完整讀取一次。
+    """
+    log = log or ScheduleLog(echo=True)
+    if snapshot.fetched_at is None:
+        return get_calendar_events_as_tasks(service, snapshot.start, snapshot.end, log=log)
+    try:
+        snapshot.refresh(service, log)
+    except HttpError as e:
+        log.warning(f"差異檢查失敗，改為完整讀取: {e}")
+        return get_calendar_events_as_tasks(service, snapshot.start, snapshot.end, log=log)
+    tasks_list = snapshot.to_tasks()
+    log.info(f"成功讀取並轉換了 {len(tasks_list)} 個事件。", count=len(tasks_list))
+    return tasks_list
+
 # --- 事件建立與讀取 ---
-def create_calendar_event(service, task_name, start_dt, end_dt):
+def task_key(task):
+    return str(task.get('id', task['name']))
+
+def task_fingerprint(task):
+    """名稱、時長或截止時間改變時，原本的安排就需要重新排程"""
+    raw = f"{task['name']}|{task['duration_minutes']}|{int(task['due_date'].timestamp())}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+def event_body(task_name, start_dt, end_dt, task=None):
     event = {
         'summary': f"{task_name}",
         'description': '由智能排程工具自動安排',
         'start': {'dateTime': start_dt.isoformat(), 'timeZone': 'Asia/Taipei'},
         'end': {'dateTime': end_dt.isoformat(), 'timeZone': 'Asia/Taipei'},
     }
+    if task is not None:
+        event['extendedProperties'] = {'private': {
+            TASK_ID_PROPERTY: task_key(task),
+            TASK_FINGERPRINT_PROPERTY: task_fingerprint(task),
+            MANAGED_PROPERTY: '1',
+        }}
+    return event
+
+def create_calendar_event(service, task_name, start_dt, end_dt, log=None, task=None):
+    log = log or ScheduleLog(echo=True)
+    event = event_body(task_name, start_dt, end_dt, task)
     try:
         created_event = service.events().insert(calendarId='primary', body=event).execute()
-        print(f"  └─ 成功建立事件: {start_dt.strftime('%Y-%m-%d %H:%M')} - {end_dt.strftime('%H:%M')} -> {created_event.get('summary')}")
+        log.info(f"  └─ 成功建立事件: {start_dt.strftime('%Y-%m-%d %H:%M')} - {end_dt.strftime('%H:%M')} -> {created_event.get('summary')}",
+                 event_id=created_event.get('id'), start=start_dt.isoformat(), end=end_dt.isoformat())
         return created_event
     except HttpError as error:
-        print(f'  └─ 建立事件時發生錯誤: {error}')
+        log.error(f'  └─ 建立事件時發生錯誤: {error}')
+        return None
+
+def move_calendar_event(service, event_id, task_name, start_dt, end_dt, log=None, task=None):
+    log = log or ScheduleLog(echo=True)
+    event = event_body(task_name, start_dt, end_dt, task)
+    try:
+        moved_event = service.events().patch(calendarId='primary', eventId=event_id, body=event).execute()
+        log.info(f"  └─ 成功移動事件: {start_dt.strftime('%Y-%m-%d %H:%M')} - {end_dt.strftime('%H:%M')} -> {moved_event.get('summary')}",
+                 event_id=event_id, start=start_dt.isoformat(), end=end_dt.isoformat())
+        return moved_event
+    except HttpError as error:
+        log.error(f'  └─ 移動事件時發生錯誤: {error}')
         return None
 
-def get_all_busy_slots(service, start_range, end_range):
-    print("正在讀取所有日曆的事件資訊...")
+def delete_calendar_event(service, event_id, log=None):
+    log = log or ScheduleLog(echo=True)
+    try:
+        service.events().delete(calendarId='primary', eventId=event_id).execute()
+        log.info("  └─ 已刪除不再需要的事件", event_id=event_id)
+        return True
+    except HttpError as error:
+        log.error(f'  └─ 刪除事件時發生錯誤: {error}')
+        return False
+
+def parse_event_times(event, tz):
+    event_start_str = event['start'].get('dateTime', event['start'].get('date'))
+    event_end_str = event['end'].get('dateTime', event['end'].get('date'))
+    if event_start_str and event_start_str.endswith('Z'):
+        event_start_str = event_start_str.replace('Z', '+00:00')
+    if event_end_str and event_end_str.endswith('Z'):
+        event_end_str = event_end_str.replace('Z', '+00:00')
+    if 'T' not in event_start_str:
+        event_start = dt.datetime.fromisoformat(event_start_str).replace(tzinfo=tz)
+        event_end = event_start + dt.timedelta(days=1)
+    else:
+        event_start = dt.datetime.fromisoformat(event_start_str).astimezone(tz)
+        event_end = dt.datetime.fromisoformat(event_end_str).astimezone(tz)
+    return event_start, event_end
+
+def is_managed_event(event):
+    return TASK_ID_PROPERTY in event.get('extendedProperties', {}).get('private', {})
+
+def managed_event(event, event_start, event_end):
+    tags = event['extendedProperties']['private']
+    return {
+        "id": event['id'],
+        "task_id": tags[TASK_ID_PROPERTY],
+        "fingerprint": tags.get(TASK_FINGERPRINT_PROPERTY),
+        "start": event_start,
+        "end": event_end,
+    }
+
+def get_managed_events_after(service, start_range, managed_events, log=None):
+    """
+    讀取 start_range 之後 (沒有上限) 排程器建立的事件並加入 managed_events。
+    已移除的任務或截止日提前的任務，舊事件可能在本次讀取範圍之後，不讀取就永遠不會被刪除。
+    """
+    log = log or ScheduleLog(echo=True)
+    seen = {e['id'] for e in managed_events}
+    tz = start_range.tzinfo
+    try:
+        events = list_events(service, 'primary', start_range, None, privateExtendedProperty=MANAGED_FILTER)
+    except HttpError as e:
+        log.warning(f"無法讀取範圍之後的排程事件，已跳過。錯誤: {e}")
+        return 0
+    added = 0
+    for event in events:
+        if event['id'] in seen or not is_managed_event(event):
+            continue
+        event_start, event_end = parse_event_times(event, tz)
+        managed_events.append(managed_event(event, event_start, event_end))
+        added += 1
+    log.info(f"範圍之後的排程事件: {added} 個。", count=added)
+    return added
+
+def get_all_busy_slots(service, start_range, end_range, log=None, managed_events=None, snapshot=None):
+    """
+    回傳所有日曆的忙碌時段。若提供 managed_events 列表，排程器自己建立的事件
+    (帶有任務標記) 不算入忙碌時段，而是放入該列表供增量排程比對。
+    若提供 snapshot，主要行事曆讀到的事件會一併存入，供排程後同步使用。
+    """
+    log = log or ScheduleLog(echo=True)
+    log.info("正在讀取所有日曆的事件資訊...")
+    if snapshot is not None:
+        # 在讀取前記下時間，之後的差異檢查才不會漏掉讀取期間的變更
+        snapshot.mark_fetched()
     busy_slots = []
     calendar_list = service.calendarList().list().execute()
     for calendar_list_entry in calendar_list['items']:
         cal_id = calendar_list_entry['id']
-        print(f"  - 正在檢查日曆: {calendar_list_entry.get('summary', cal_id)}")
+        log.debug(f"  - 正在檢查日曆: {calendar_list_entry.get('summary', cal_id)}", calendar_id=cal_id)
+        is_primary = calendar_list_entry.get('primary') or cal_id == 'primary'
         try:
-            events_result = service.events().list(
-                calendarId=cal_id, timeMin=start_range.isoformat(), timeMax=end_range.isoformat(),
-                singleEvents=True, orderBy='startTime'
-            ).execute()
-            existing_events = events_result.get('items', [])
+            existing_events = list_events(service, cal_id, start_range, end_range)
             tz = start_range.tzinfo
+            if snapshot is not None and is_primary:
+                for event in existing_events:
+                    snapshot.apply(event)
             for event in existing_events:
                 if event.get('transparency') == 'transparent':
                     continue
-                event_start_str = event['start'].get('dateTime', event['start'].get('date'))
-                event_end_str = event['end'].get('dateTime', event['end'].get('date'))
-                if event_start_str and event_start_str.endswith('Z'):
-                    event_start_str = event_start_str.replace('Z', '+00:00')
-                if event_end_str and event_end_str.endswith('Z'):
-                    event_end_str = event_end_str.replace('Z', '+00:00')
-                if 'T' not in event_start_str:
-                    event_start = dt.datetime.fromisoformat(event_start_str).replace(tzinfo=tz)
-                    event_end = event_start + dt.timedelta(days=1)
-                else:
-                    event_start = dt.datetime.fromisoformat(event_start_str).astimezone(tz)
-                    event_end = dt.datetime.fromisoformat(event_end_str).astimezone(tz)
+                event_start, event_end = parse_event_times(event, tz)
+                if managed_events is not None and is_managed_event(event):
+                    managed_events.append(managed_event(event, event_start, event_end))
+                    continue
                 busy_slots.append((event_start, event_end))
         except HttpError as e:
-            print(f"    └─ 無法讀取日曆 '{cal_id}' 的事件，已跳過。錯誤: {e}")
-    print("所有日曆讀取完畢。")
+            log.warning(f"    └─ 無法讀取日曆 '{cal_id}' 的事件，已跳過。錯誤: {e}", calendar_id=cal_id)
+            if snapshot is not None and is_primary:
+                # 主要行事曆沒讀到，同步時改為完整讀取
+                snapshot.fetched_at = None
+    log.info("所有日曆讀取完畢。", busy_slots=len(busy_slots))
     return sorted(busy_slots)
 
+# --- 增量排程 ---
+class EventWriter:
+    """寫入排程器建立的事件: 重新排程的任務以 patch 移動舊事件，用不到的最後刪除，並統計寫入次數"""
+
+    def __init__(self, service, log, stale_events=(), snapshot=None):
+        self.service = service
+        self.log = log
+        self.snapshot = snapshot
+        self.reusable = defaultdict(list)
+        for event in stale_events:
+            self.reusable[event['task_id']].append(event['id'])
+        self.writes = Counter()
+
+    def write_task(self, task, pieces):
+        """為已規劃好的任務寫入事件，多段時以 (部分 i) 標示；回傳 'created' / 'moved' 或 None"""
+        reusable = self.reusable.get(task_key(task), [])
+        moved = bool(reusable)
+        written = 0
+        with self.log.phase("commit"):
+            for i, (event_start, event_end) in enumerate(pieces):
+                task_name_part = f"{task['name']}"
+                if len(pieces) > 1:
+                    task_name_part += f" (部分 {i+1})"
+                if reusable:
+                    self.writes['patch'] += 1
+                    event = move_calendar_event(self.service, reusable.pop(0), task_name_part, event_start, event_end,
+                                                log=self.log, task=task)
+                else:
+                    self.writes['insert'] += 1
+                    event = create_calendar_event(self.service, task_name_part, event_start, event_end,
+                                                  log=self.log, task=task)
+                if event:
+                    written += 1
+                    if self.snapshot is not None:
+                        self.snapshot.apply(event)
+        if written != len(pieces):
+            self.log.warning("警告: 任務區塊建立不完整。", task=task['name'])
+            return None
+        return 'moved' if moved else 'created'
+
+    def delete_unused(self):
+        with self.log.phase("commit"):
+            for event_ids in self.reusable.values():
+                for event_id in event_ids:
+                    self.writes['delete'] += 1
+                    if delete_calendar_event(self.service, event_id, log=self.log) and self.snapshot is not None:
+                        self.snapshot.remove(event_id)
+        self.reusable.clear()
+
+
+def reconcile_managed_events(tasks, managed_events, grid, log):
+    """
+    比對本次的任務列表與上次排程建立的事件:
+    - 任務沒變、事件仍在截止前且沒有和其他事件衝突 -> 保留 (不需任何寫入)
+    - 任務有變化或原時段已不適用 -> 重新排程，舊事件之後會被移動或刪除
+    - 已完成或已移除的任務 -> 舊事件刪除
+    回傳 (保留的 {task_key: pieces}, 需要排程的任務, 過時的事件)
+    """
+    by_task = defaultdict(list)
+    for event in managed_events:
+        by_task[event['task_id']].append(event)
+
+    kept, to_schedule, stale = {}, [], []
+    for task in tasks:
+        events = sorted(by_task.pop(task_key(task), []), key=lambda e: e['start'])
+        pieces = [(e['start'], e['end']) for e in events]
+        duration = sum((end - start).total_seconds() for start, end in pieces) / 60
+        if (events
+                and all(e['fingerprint'] == task_fingerprint(task) for e in events)
+                and round(duration) == task['duration_minutes']
+                and pieces[-1][1] <= task['due_date']
+                and grid.is_free(pieces)):
+            grid.reserve(pieces)
+            kept[task_key(task)] = pieces
+        else:
+            to_schedule.append(task)
+            stale.extend(events)
+
+    for events in by_task.values():
+        stale.extend(events)
+    log.info(f"增量排程: 保留 {len(kept)} 個任務，需要排程 {len(to_schedule)} 個，過時事件 {len(stale)} 個。",
+             kept=len(kept), to_schedule=len(to_schedule), stale=len(stale))
+    return kept, to_schedule, stale
+
+
 # --- 排程策略 ---
-def schedule_task(service, task, start_search_dt, busy_slots):
-    """為任務尋找時段，並自動處理午休分割"""
-    print(f"🔍 正在為 '{task['name']}' (需連續工作 {task['duration_minutes']} 分鐘) 尋找空檔...")
-    
-    current_time = start_search_dt
-    end_search_dt = task['due_date']
-    
-    while current_time < end_search_dt:
-        # 1. 將 current_time 對齊到一個可工作的、非忙碌的起點
-        # 校準到工作時間
-        working_day_start = current_time.replace(hour=WORKING_HOURS_START, minute=0, second=0, microsecond=0)
-        if current_time < working_day_start:
-            current_time = working_day_start
-
-        # 處理午休時間
-        # 定義當天的午休時間
-        lunch_start = current_time.replace(hour=LUNCH_BREAK_START, minute=0)
-        lunch_end = current_time.replace(hour=LUNCH_BREAK_END, minute=0)
-        
-        # 如果當前時間點正好在午休，直接跳到午休結束
-        if current_time >= lunch_start and current_time < lunch_end:
-            current_time = lunch_end
-            continue
+def schedule_task(writer, task, grid, log=None):
+    """為任務尋找同一天內最早的連續工作時段 (跨午休時自動分割)，寫入事件後回傳 (各段時間, 動作)"""
+    log = log or ScheduleLog(echo=True)
+    log.info(f"🔍 正在為 '{task['name']}' (需連續工作 {task['duration_minutes']} 分鐘) 尋找空檔...")
 
-        # 檢查是否在其他忙碌時段內，如果是，則跳過
-        is_inside_busy_slot = False
-        for busy_start, busy_end in busy_slots:
-            if current_time >= busy_start and current_time < busy_end:
-                current_time = busy_end
-                is_inside_busy_slot = True
-                break
-        if is_inside_busy_slot:
-            continue
+    pieces = grid.first_fit(task['duration_minutes'], task['due_date'])
+    if pieces is None:
+        return None, None
+    grid.reserve(pieces)
+    action = writer.write_task(task, pieces)
+    if action:
+        return pieces, action
+    return None, None
+
+def schedule_tasks_greedy(writer, sorted_tasks, grid, scheduling_results, progress, log):
+    for index, task in enumerate(sorted_tasks):
+        if progress:
+            progress(index, len(sorted_tasks))
+        task_name = task['name']
+        log.info("\n" + "="*60)
+        log.info(f"處理任務: {task_name} (優先級: {task['priority']}, 截止於: {task['due_date'].strftime('%Y-%m-%d %H:%M')})")
 
-        # 2. 檢查從 current_time 開始，是否有足夠的「工作時間」
-        slot_start = current_time
-        duration_needed = dt.timedelta(minutes=task['duration_minutes'])
-        
-        # 重新計算預計的結束時間，考慮午休
-        slot_end_unadjusted = slot_start + duration_needed
-        if slot_start < lunch_start and slot_end_unadjusted > lunch_start:
-            # 如果任務跨越了午休，結束時間需要加上午休時長
-            slot_end = slot_end_unadjusted + dt.timedelta(hours=(LUNCH_BREAK_END - LUNCH_BREAK_START))
+        with log.phase("search"):
+            pieces, action = schedule_task(writer, task, grid, log=log)
+
+        if pieces:
+            log.info(f"任務 '{task_name}' 已成功排入行事曆。", task=task_name, action=action)
+            scheduling_results["successful"].append({
+                "name": task_name,
+                "start": pieces[0][0].isoformat(),
+                "end": pieces[-1][1].isoformat(),
+                "action": action
+            })
         else:
-            # 沒跨越午休
-            slot_end = slot_end_unadjusted
+            log.warning(f"警告: 找不到適合的時段來安排任務 '{task_name}'。", task=task_name)
+            scheduling_results["failed"].append({
+                "name": task_name,
+                "reason": "找不到適合的時段 (Could not find a suitable time slot)"
+            })
 
-        # 3. 檢查這個計算出的「邏輯時段」是否符合所有條件
-        if slot_end > end_search_dt:
-            return None # 這個起點太晚了，不可能完成任務
+def schedule_tasks_optimized(writer, tasks, grid, scheduling_results, progress, log, allow_split=True):
+    with log.phase("search"):
+        planned = plan_optimized(tasks, grid, allow_split=allow_split)
+    stats = planned["stats"]
+    log.info(f"最佳化排程: 可排入 {stats['placed']} 個任務 (貪婪排程 {stats['greedy_placed']} 個，"
+             f"多排入 {stats['extra_placed']} 個)，耗時 {stats['elapsed_sec']} 秒。", **stats)
+    scheduling_results["optimizer"] = stats
+
+    total = len(planned["plan"])
+    for index, (task, pieces) in enumerate(planned["plan"]):
+        if progress:
+            progress(index, total)
+        action = writer.write_task(task, pieces)
+        if action:
+            log.info(f"任務 '{task['name']}' 已成功排入行事曆。", task=task['name'], action=action)
+            scheduling_results["successful"].append({
+                "name": task['name'],
+                "start": pieces[0][0].isoformat(),
+                "end": pieces[-1][1].isoformat(),
+                "action": action
+            })
+        else:
+            scheduling_results["failed"].append({
+                "name": task['name'],
+                "reason": "建立行事曆事件失敗 (Failed to create calendar event)"
+            })
+
+    for task in planned["rejected"]:
+        log.warning(f"警告: 找不到適合的時段來安排任務 '{task['name']}'。", task=task['name'])
+        scheduling_results["failed"].append({
+            "name": task['name'],
+            "reason": "找不到適合的時段 (Could not find a suitable time slot)"
+        })
 
-        working_day_end = slot_start.replace(hour=WORKING_HOURS_END, minute=0)
-        if slot_end > working_day_end:
-            current_time = (current_time + dt.timedelta(days=1)).replace(hour=WORKING_HOURS_START, minute=0)
-            continue
-            
-        # 4. 檢查是否有衝突
-        is_free = True
-        slots_to_check = []
-        if slot_start < lunch_start and slot_end > lunch_end: # 跨越午休
-            slots_to_check.append((slot_start, lunch_start))
-            slots_to_check.append((lunch_end, slot_end))
-        else: # 未跨越
-            slots_to_check.append((slot_start, slot_end))
-
-        for check_start, check_end in slots_to_check:
-            for busy_start, busy_end in busy_slots:
-                if max(check_start, busy_start) < min(check_end, busy_end):
-                    is_free = False
-                    current_time = busy_end
-                    break
-            if not is_free:
-                break
-        
-        # 5. 如果所有檢查都通過，建立事件並返回
-        if is_free:
-            created_count = 0
-            for i, (event_start, event_end) in enumerate(slots_to_check):
-                task_name_part = f"{task['name']}"
-                if len(slots_to_check) > 1:
-                    task_name_part += f" (部分 {i+1})"
-                
-                event = create_calendar_event(service, task_name_part, event_start, event_end)
-                if event:
-                    created_count += 1
-            
-            if created_count == len(slots_to_check):
-                return (slot_start, slot_end)
-            else:
-                print("警告: 任務區塊建立不完整。")
-                return None
-
-        if current_time == slot_start:
-            current_time += dt.timedelta(minutes=SEARCH_STEP_MINUTES)
-    
-    return None
 # --- 主執行函式 ---
-def schedule_all_tasks(service, tasks):
+def schedule_all_tasks(service, tasks, progress=None, log=None, mode='greedy', allow_split=True, calendar=None,
+                       snapshot=None):
+    """
+    排程所有任務。先前排程建立的事件 (帶有任務標記) 會與本次任務列表比對，
+    沒有變化的任務保留原時段，只建立、移動或刪除有變化的部分。
+    若提供 PrimaryEventSnapshot，讀取範圍會涵蓋 snapshot.end，並記錄讀到與寫入的主要行事曆事件。
+    """
+    log = log or ScheduleLog(echo=True)
+    calendar = calendar or DEFAULT_WORK_CALENDAR
+    if mode not in SCHEDULER_MODES:
+        raise ValueError(f"Unknown scheduler mode: {mode}")
     priority_map = {'高': 1, '中': 2, '低': 3}
     sorted_tasks = sorted(tasks, key=lambda x: (priority_map[x['priority']], x['due_date']))
-    now = dt.datetime.now().astimezone()
+    now = calendar.now()
 
     # 初始化結果物件
     scheduling_results = {
@@ -243,45 +623,56 @@ def schedule_all_tasks(service, tasks):
     }
 
     if not sorted_tasks:
-        print("待辦事項列表為空。")
+        log.info("待辦事項列表為空。")
         return scheduling_results
 
-    last_due_date = max(t['due_date'] for t in sorted_tasks)
-    master_busy_slots = get_all_busy_slots(service, now, last_due_date)
-
+    pending_tasks = []
     for task in sorted_tasks:
-        task_name = task['name']
-        print("\n" + "="*60)
-        print(f"處理任務: {task_name} (優先級: {task['priority']}, 截止於: {task['due_date'].strftime('%Y-%m-%d %H:%M')})")
-
         if task['due_date'] < now:
-            print(f"警告: 任務 '{task_name}' 的截止日期已過，跳過排程。")
+            log.warning(f"警告: 任務 '{task['name']}' 的截止日期已過，跳過排程。", task=task['name'])
             scheduling_results["failed"].append({
-                "name": task_name,
+                "name": task['name'],
                 "reason": "截止日期已過 (Due date has passed)"
             })
-            continue
+        else:
+            pending_tasks.append(task)
 
-        new_slot = schedule_task(service, task, now, master_busy_slots)
-        
-        if new_slot:
-            master_busy_slots.append(new_slot)
-            master_busy_slots.sort()
-            print(f"任務 '{task_name}' 已成功排入行事曆。")
+    last_due_date = max(t['due_date'] for t in sorted_tasks)
+    managed_events = []
+    with log.phase("fetch"):
+        fetch_end = max(last_due_date, snapshot.end) if snapshot is not None else last_due_date
+        busy_slots = get_all_busy_slots(service, now, fetch_end, log=log, managed_events=managed_events,
+                                        snapshot=snapshot)
+        get_managed_events_after(service, fetch_end, managed_events, log=log)
+        # 將規劃期間切成格子，並畫入所有忙碌時段
+        grid = AvailabilityGrid(calendar, now, last_due_date)
+        grid.paint(busy_slots)
+
+    with log.phase("reconcile"):
+        kept, to_schedule, stale_events = reconcile_managed_events(pending_tasks, managed_events, grid, log)
+    for task in pending_tasks:
+        pieces = kept.get(task_key(task))
+        if pieces:
             scheduling_results["successful"].append({
-                "name": task_name,
-                "start": new_slot[0].isoformat(),
-                "end": new_slot[1].isoformat()
+                "name": task['name'],
+                "start": pieces[0][0].isoformat(),
+                "end": pieces[-1][1].isoformat(),
+                "action": "unchanged"
             })
-        else:
-            print(f"警告: 找不到適合的時段來安排任務 '{task_name}'。")
-            scheduling_results["failed"].append({
-                "name": task_name,
-                "reason": "找不到適合的時段 (Could not find a suitable time slot)"
-            })
-    
-    print("\n" + "="*60)
-    print("所有任務處理完畢。")
+
+    writer = EventWriter(service, log, stale_events, snapshot=snapshot)
+    if mode == 'optimized':
+        schedule_tasks_optimized(writer, to_schedule, grid, scheduling_results, progress, log,
+                                 allow_split=allow_split)
+    else:
+        schedule_tasks_greedy(writer, to_schedule, grid, scheduling_results, progress, log)
+    writer.delete_unused()
+    scheduling_results["writes"] = dict(writer.writes)
+
+    if progress:
+        progress(len(tasks), len(tasks))
+    log.info("\n" + "="*60)
+    log.info("所有任務處理完畢。", timings=log.timings, writes=scheduling_results["writes"])
     
     # 回傳結構化的結果
     return scheduling_results
@@ -296,6 +687,7 @@ if __name__ == '__main__':
         {"name": "預約年度健康檢查", "duration_minutes": 30, "due_date": now + dt.timedelta(days=5), "priority": "低"},
         {"name": "研究並比較三家雲端服務供應商", "duration_minutes": 240, "due_date": now + dt.timedelta(days=4), "priority": "中"}
     ]
-    service = get_calendar_service()
+    # 在終端機執行時可以開啟瀏覽器授權，並建立 API 使用的 token.json
+    service = CalendarServiceProvider(interactive=True).get()
     if service:
         schedule_all_tasks(service, my_todo_list)
\ No newline at end of file
@@ -0,0 +1,300 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
+from googleapiclient.http import HttpRequest
+try:
+    from scheduler.scheduler import CalendarServiceProvider, CredentialsRequired, SCHEDULER_DIR, SCOPES
+except ImportError:
+    from scheduler import CalendarServiceProvider, CredentialsRequired, SCHEDULER_DIR, SCOPES
+
+# --- 設定 ---
+# 每個使用者一個 token 檔 (<user>.json)
+TOKEN_DIR = os.environ.get('SCHEDULER_TOKEN_DIR', os.path.join(SCHEDULER_DIR, 'tokens'))
+MAX_CLIENTS = 256                 # client pool 最多保留的使用者數 (LRU)
+# Calendar API 請求的上限 (所有使用者合計 / 單一使用者)，避免超過 Google 的配額
+CALENDAR_MAX_CONCURRENT = int(os.environ.get('SCHEDULER_CALENDAR_CONCURRENCY', '8'))
+CALENDAR_QPS = float(os.environ.get('SCHEDULER_CALENDAR_QPS', '50'))
+CALENDAR_USER_CONCURRENT = 2
+CALENDAR_USER_QPS = 10.0
+# 多使用者排程工作的執行緒數與排隊上限
+TENANT_WORKERS = int(os.environ.get('SCHEDULER_TENANT_WORKERS', '8'))
+TENANT_MAX_PENDING = 1000
+# 可以替任何使用者發行 API key 及送出 bulk 請求的管理金鑰；未設定時這些操作一律拒絕
+ADMIN_KEY = os.environ.get('SCHEDULER_ADMIN_KEY') or None
+
+_USER_ID_RE = re.compile(r'^[A-Za-z0-9_.@+-]{1,128}$')
+
+
+class TokenStore:
+    """
+    每個使用者的 OAuth token 存成獨立檔案，以原子方式寫入。
+    使用者的 API key 只存 SHA-256 雜湊 (<user>.key)，用來驗證呼叫者是否為該使用者。
+    """
+
+    def __init__(self, directory=TOKEN_DIR):
+        self.directory = directory
+
+    def path(self, user):
+        # 不安全的字元 (例如 '/') 改用雜湊作為檔名
+        name = user if _USER_ID_RE.match(user) and not user.startswith('.') else \
+            'u-' + hashlib.sha256(user.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, f"{name}.json")
+
+    def key_path(self, user):
+        return self.path(user)[:-len('.json')] + '.key'
+
+    def issue_key(self, user):
+        """產生新的 API key (舊的隨即失效)；明文只回傳這一次"""
+        key = secrets.token_urlsafe(32)
+        self._write(self.key_path(user), hashlib.sha256(key.encode('utf-8')).hexdigest())
+        return key
+
+    def check_key(self, user, key):
+        try:
+            with open(self.key_path(user)) as f:
+                stored = f.read().strip()
+        except FileNotFoundError:
+            return False
+        return hmac.compare_digest(stored, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def has(self, user):
+        return os.path.exists(self.path(user))
+
+    def save_info(self, user, info):
+        """儲存授權資訊 (與 token.json 相同的格式)；格式不正確時丟出 ValueError"""
+        Credentials.from_authorized_user_info(info, SCOPES)
+        self._write(self.path(user), json.dumps(info))
+
+    def save(self, user, creds):
+        self._write(self.path(user), creds.to_json())
+
+    def delete(self, user):
+        try:
+            os.remove(self.path(user))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _write(self, path, text):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+class RateLimiter:
+    """Token bucket: 平均每秒 rate 次，最多累積 burst 次"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CalendarCallLimiter:
+    """
+    Fair limits on Calendar API calls across users. A call first takes one of
+    its user's CALENDAR_USER_CONCURRENT slots, so a user with a large backlog
+    queues behind itself rather than filling the global pool. It then waits
+    on its own rate limiter, and only after that takes a global slot and a
+    token from the global rate limiter.
+    """
+
+    def __init__(self, max_concurrent=CALENDAR_MAX_CONCURRENT, qps=CALENDAR_QPS,
+                 per_user=CALENDAR_USER_CONCURRENT, user_qps=CALENDAR_USER_QPS):
+        self.per_user = per_user
+        self.user_qps = user_qps
+        self._global = threading.BoundedSemaphore(max_concurrent)
+        self._global_rate = RateLimiter(qps) if qps else None
+        self._users = {}
+        self._lock = threading.Lock()
+        self.waited = defaultdict(float)   # user -> 等待配額的累計秒數
+
+    def _user(self, user):
+        with self._lock:
+            entry = self._users.get(user)
+            if entry is None:
+                entry = self._users[user] = (threading.BoundedSemaphore(self.per_user),
+                                             RateLimiter(self.user_qps) if self.user_qps else None)
+            return entry
+
+    @contextmanager
+    def slot(self, user):
+        semaphore, rate = self._user(user)
+        started = time.perf_counter()
+        with semaphore:
+            # 先等使用者自己的速率限制，不佔用全域名額
+            if rate is not None:
+                rate.acquire()
+            with self._global:
+                if self._global_rate is not None:
+                    self._global_rate.acquire()
+                self.waited[user] += time.perf_counter() - started
+                yield
+
+    def forget(self, user):
+        """使用者的 client 離開 pool 時一併移除配額狀態；之後的請求會重新建立"""
+        with self._lock:
+            self._users.pop(user, None)
+            self.waited.pop(user, None)
+
+
+class LimitedHttpRequest(HttpRequest):
+    """execute() 前先取得該使用者的 Calendar 配額；分頁時 copy() 也會保留 limit"""
+
+    limit = None
+
+    def execute(self, *args, **kwargs):
+        if self.limit is None:
+            return super().execute(*args, **kwargs)
+        limiter, user = self.limit
+        with limiter.slot(user):
+            return super().execute(*args, **kwargs)
+
+
+class TenantServiceProvider(CalendarServiceProvider):
+    """單一使用者的 Calendar client：token 來自 TokenStore，不會開啟瀏覽器授權，請求受 limiter 限制"""
+
+    request_class = LimitedHttpRequest
+    # 最多 MAX_CLIENTS 個使用者，不替每個使用者開背景刷新執行緒；過期的 access token 在請求前刷新
+    background_refresh = False
+
+    def __init__(self, user, store, limiter):
+        super().__init__(token_path=store.path(user), interactive=False)
+        self.user = user
+        self.store = store
+        self.limiter = limiter
+
+    def _load_credentials(self):
+        if not os.path.exists(self.token_path):
+            raise CredentialsRequired(f"no token stored for user '{self.user}'")
+        return super()._load_credentials()
+
+    def _save_credentials(self, creds):
+        self.store.save(self.user, creds)
+
+    def _build_request(self, http, *args, **kwargs):
+        request = super()._build_request(http, *args, **kwargs)
+        request.limit = (self.limiter, self.user)
+        return request
+
+
+class ClientPool:
+    """
+    Calendar clients keyed by user, kept in an LRU of `max_clients`. Each
+    user also gets a lock so that user's scheduling runs one at a time
+    (two concurrent runs on one calendar would both insert the same tasks),
+    while different users run in parallel. A user's lock is dropped once no
+    run holds or waits on it, and the limiter state goes with the client. `factory(user, limiter)` replaces
+    the Google client, e.g. with FakeCalendarService for benchmarks.
+    """
+
+    def __init__(self, store=None, limiter=None, max_clients=MAX_CLIENTS, factory=None):
+        self.store = store or TokenStore()
+        self.limiter = limiter or CalendarCallLimiter()
+        self.max_clients = max_clients
+        self.factory = factory
+        self._clients = OrderedDict()
+        self._user_locks = {}          # user -> [lock, 持有或等待中的數量]
+        self._lock = threading.Lock()
+
+    def _provider(self, user):
+        with self._lock:
+            client = self._clients.get(user)
+            if client is not None:
+                self._clients.move_to_end(user)
+                return client
+            if self.factory is not None:
+                client = self.factory(user, self.limiter)
+            else:
+                client = TenantServiceProvider(user, self.store, self.limiter)
+            self._clients[user] = client
+            while len(self._clients) > self.max_clients:
+                evicted_user, evicted = self._clients.popitem(last=False)
+                self.limiter.forget(evicted_user)
+                self._close(evicted)
+            return client
+
+    def get(self, user):
+        """回傳該使用者的 Calendar service；沒有可用 token 時丟出 CredentialsRequired"""
+        client = self._provider(user)
+        if isinstance(client, CalendarServiceProvider):
+            try:
+                return client.get()
+            except CredentialsRequired:
+                self.evict(user)
+                raise
+            except RefreshError as e:
+                self.evict(user)
+                raise CredentialsRequired(f"token for user '{user}' was revoked or expired: {e}") from e
+        return client
+
+    def call(self, user, fn):
+        """
+        在該使用者的鎖內以 fn(service) 執行排程。執行中 access token 刷新失敗
+        (refresh token 被撤銷) 時移除這個 client 並丟出 CredentialsRequired。
+        """
+        with self.user_lock(user):
+            service = self.get(user)
+            try:
+                return fn(service)
+            except RefreshError as e:
+                self.evict(user)
+                raise CredentialsRequired(f"token for user '{user}' was revoked or expired: {e}") from e
+
+    @contextmanager
+    def user_lock(self, user):
+        with self._lock:
+            entry = self._user_locks.setdefault(user, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._user_locks[user]
+                    # 執行中被 LRU 移出 pool 的使用者，之後的請求又建立了配額狀態
+                    if user not in self._clients:
+                        self.limiter.forget(user)
+
+    def evict(self, user):
+        """token 更新或刪除後呼叫，下次使用時重新建立 client"""
+        with self._lock:
+            client = self._clients.pop(user, None)
+        self.limiter.forget(user)
+        if client is not None:
+            self._close(client)
+
+    def _close(self, client):
+        if isinstance(client, CalendarServiceProvider):
+            client.close()
+
+    def users(self):
+        with self._lock:
+            return list(self._clients)
@@ -0,0 +1,11 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("googleapiclient")
+
+from api import import_budget
+
+
+def test_scheduler_api_import_budget():
+    # 與 python -m api.import_budget 相同: 取 3 次中最快的一次，不得超過上限或載入影像套件
+    assert import_budget.main(["--repeat", "3"]) == 0
@@ -0,0 +1,18 @@
+import pytest
+
+pytest.importorskip("googleapiclient")
+pytest.importorskip("numpy")
+
+from scheduler.bench import CHECK_DURATIONS, SCENARIOS, run_once
+
+SEEDS = range(5)
+
+
+@pytest.mark.parametrize("scenario", list(SCENARIOS))
+@pytest.mark.parametrize("mode", ["greedy", "optimized"])
+def test_bench_invariants(scenario, mode):
+    # 與 python -m scheduler.bench --check 相同的性質檢查，固定的種子
+    for seed in SEEDS:
+        r = run_once(scenario, mode, task_count=30, horizon_days=14, latency_ms=0, seed=seed,
+                     durations=CHECK_DURATIONS)
+        assert r["violations"] == [], f"seed={seed}: {r['violations'][:5]}"